@@ -0,0 +1,66 @@
+from django.db.models import Exists, Max, OuterRef
+
+from . import events
+from .models import ActivityLog, Project
+from .querysets import bulk_create_with_ids
+
+
+def snapshot(obj):
+    return {field.attname: field.value_from_object(obj) for field in obj._meta.concrete_fields}
+
+
+def record(project_id, objs, action):
+    """
+    Append one change per object to the feed of the project and push them to its subscribers.
+    """
+    rows = [ActivityLog(project_id=project_id, model=obj._meta.model_name, object_id=obj.id, action=action,
+                        data=None if action == 'deleted' else snapshot(obj))
+            for obj in objs]
+    if len(rows) == 1:
+        rows[0].save()
+    else:
+        bulk_create_with_ids(ActivityLog, rows)
+    events.publish(rows)
+
+
+def changes(project_id, since, limit):
+    """
+    Return the changes of the project after the sequence number `since`, oldest first.
+    """
+    return list(ActivityLog.objects.filter(project_id=project_id, id__gt=since).order_by('id')[:limit])
+
+
+def _delete_in_chunks(queryset, batch_size):
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += ActivityLog.objects.filter(id__in=ids).delete()[0]
+
+
+def compact(batch_size=1000):
+    """
+    Delete the changes superseded by a later change of the same object. A client syncing from
+    any sequence number still ends up with the last state of every object, so 'created' and
+    'updated' must both be applied as upserts.
+    """
+    later = ActivityLog.objects.filter(project_id=OuterRef('project_id'), model=OuterRef('model'),
+                                       object_id=OuterRef('object_id'), id__gt=OuterRef('id'))
+    return _delete_in_chunks(ActivityLog.objects.filter(Exists(later)), batch_size)
+
+
+def prune(before, batch_size=1000):
+    """
+    Delete the changes older than the datetime `before`. The projects remember the last pruned
+    sequence number: clients behind it must download the project again.
+    """
+    # Ids grow with time, the scan in id order stops at the first recent row.
+    first_kept = (ActivityLog.objects.filter(created_time__gte=before).order_by('id')
+                  .values_list('id', flat=True).first())
+    old = ActivityLog.objects.all()
+    if first_kept is not None:
+        old = old.filter(id__lt=first_kept)
+    for row in old.values('project_id').annotate(horizon=Max('id')).order_by():
+        Project.objects.filter(id=row['project_id']).update(activity_horizon=row['horizon'])
+    return _delete_in_chunks(old.order_by('id'), batch_size)
@@ -0,0 +1,226 @@
+import datetime
+import gzip
+import json
+import zlib
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connection, transaction
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from . import counters, deletion, jobs
+from .models import Comment, Contributor, Issue, Project
+from .querysets import insert_rows
+
+FORMAT = 'softdesk-project'
+VERSION = 1
+RECORD_TYPES = ('project', 'contributor', 'issue', 'comment')
+PROJECT_FIELDS = ('title', 'description', 'type')
+ISSUE_VALUES = ('title', 'description', 'priority', 'tag', 'status')
+ISSUE_DEFAULTS = {'priority': 'medium', 'tag': 'task', 'status': 'to do'}
+TIMESTAMPS = ('created_time', 'updated_time')
+MEDIA_TYPE = 'application/gzip'
+
+
+def _as_text(*fields):
+    # As the database stores them, in UTC: no round trip through datetime objects.
+    return [Cast(field, TextField()) for field in fields]
+
+
+def iter_records(project_id, chunk_size=2000):
+    """
+    The lines of the archive of a project: a header, the project, then its contributors, issues
+    and comments. Users are referenced by username, comments by the id of their issue in the
+    archive. Rows are read with .iterator() as tuples, never all in memory.
+    """
+    project = Project.objects.filter(id=project_id).values(*PROJECT_FIELDS).get()
+    yield {'format': FORMAT, 'version': VERSION}
+    yield {'record': 'project', **project}
+    for user, role in (Contributor.objects.filter(project_id=project_id).order_by('id')
+                       .values_list('user__username', 'role').iterator(chunk_size)):
+        yield {'record': 'contributor', 'user': user, 'role': role}
+    columns = ('id', *ISSUE_VALUES, 'author', 'assigned', *TIMESTAMPS)
+    for row in (Issue.objects.filter(project_id=project_id).order_by('id')
+                .values_list('id', *ISSUE_VALUES, 'author__username', 'assigned__username', *_as_text(*TIMESTAMPS))
+                .iterator(chunk_size)):
+        yield {'record': 'issue', **dict(zip(columns, row))}
+    columns = ('issue', 'description', 'author', *TIMESTAMPS)
+    for row in (Comment.objects.filter(issue__project_id=project_id, issue__deleted_time__isnull=True).order_by('id')
+                .values_list('issue_id', 'description', 'author__username', *_as_text(*TIMESTAMPS))
+                .iterator(chunk_size)):
+        yield {'record': 'comment', **dict(zip(columns, row))}
+
+
+def compress(records, level=6):
+    """
+    Gzip NDJSON of `records`, yielded as the compressor fills its blocks.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for record in records:
+        chunk = compressor.compress(json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False).encode() + b'\n')
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def export_project(project_id):
+    return compress(iter_records(project_id))
+
+
+def read_records(stream, compressed=True):
+    """
+    The records of an archive read from a binary file-like `stream`, line by line.
+    """
+    lines = gzip.GzipFile(fileobj=stream) if compressed else stream
+    try:
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    except (OSError, EOFError, ValueError) as exc:
+        raise ValidationError({'detail': f'Invalid archive: {exc}'})
+
+
+def _parse_datetime(value):
+    # fromisoformat() parses the timestamps of iter_records() ten times faster.
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        value = parse_datetime(value)
+        if value is None:
+            raise
+        return value
+
+
+class Importer:
+    """
+    Create a project from the records of an archive. The rows are inserted by batches with
+    multi-row INSERTs, the ids of the issues remapped for their comments. The project stays hidden
+    until the import completes, and is purged if it fails. `owner` becomes its author; the other
+    contributors and the authors are matched by username, the unknown ones are left out.
+    """
+
+    def __init__(self, owner, batch_size=2000):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.now = timezone.now()
+        self.users = {owner.username: owner.id}
+        self.issue_ids = {}
+        self.project = None
+        self.counts = {'contributors': 0, 'issues': 0, 'comments': 0}
+        self.adapt_datetime = connection.ops.adapt_datetimefield_value
+        self.valid_choices = {}
+
+    def user_ids(self, usernames):
+        missing = {username for username in usernames if username and username not in self.users}
+        if missing:
+            found = dict(User.objects.filter(username__in=missing).values_list('username', 'id'))
+            self.users.update({username: found.get(username) for username in missing})
+        return self.users
+
+    def clean(self, model, name, value):
+        """
+        Check a value of the archive as field.clean() does (choices, max_length, blank...): the
+        rows are inserted raw. The values of a field with choices are only checked once.
+        """
+        field = model._meta.get_field(name)
+        valid = self.valid_choices.setdefault(field, set()) if field.choices else None
+        if valid is not None and value in valid:
+            return value
+        try:
+            value = field.clean(value, None)
+        except DjangoValidationError as exc:
+            raise ValidationError({'detail': f"Invalid {model._meta.model_name} {name} {value!r}: "
+                                             f"{' '.join(exc.messages)}"})
+        if valid is not None:
+            valid.add(value)
+        return value
+
+    def run(self, records):
+        records = iter(records)
+        header = next(records, None)
+        if not isinstance(header, dict) or header.get('format') != FORMAT or header.get('version') != VERSION:
+            raise ValidationError({'detail': f'Not a {FORMAT} archive of version {VERSION}.'})
+        try:
+            batch, kind = [], None
+            for record in records:
+                if record.get('record') != kind or len(batch) >= self.batch_size:
+                    self.flush(kind, batch)
+                    batch, kind = [], record.get('record')
+                batch.append(record)
+            self.flush(kind, batch)
+            if self.project is None:
+                raise ValidationError({'detail': 'The archive holds no project.'})
+        except Exception:
+            if self.project is not None:
+                deletion.soft_delete_project(self.project, self.owner)
+            raise
+        with transaction.atomic():
+            Project.all_objects.filter(id=self.project.id).update(deleted_time=None)
+            counters.rebuild_counters([self.project.id])
+            jobs.enqueue('api.search.rebuild_index', key=f'index-import:{self.project.id}', user=self.owner,
+                         project_ids=[self.project.id])
+        self.project.deleted_time = None
+        return self.project
+
+    def flush(self, kind, batch):
+        if not batch:
+            return
+        if kind != 'project' and self.project is None:
+            raise ValidationError({'detail': 'The project must come first in the archive.'})
+        if kind not in RECORD_TYPES:
+            raise ValidationError({'detail': f'Unknown record {kind!r}.'})
+        try:
+            with transaction.atomic():
+                getattr(self, f'create_{kind}s')(batch)
+        except (KeyError, TypeError, ValueError, DatabaseError) as exc:
+            raise ValidationError({'detail': f'Invalid {kind} record: {exc!r}'})
+
+    def create_projects(self, batch):
+        if self.project is not None or len(batch) > 1:
+            raise ValidationError({'detail': 'The archive holds more than one project.'})
+        fields = {field: self.clean(Project, field, batch[0][field]) for field in PROJECT_FIELDS if field in batch[0]}
+        self.project = Project.objects.create(deleted_time=self.now, **fields)
+        Contributor.objects.bulk_create([Contributor(user=self.owner, project=self.project, role='author')])
+
+    def create_contributors(self, batch):
+        users = self.user_ids(record['user'] for record in batch)
+        contributors = [Contributor(user_id=users[record['user']], project=self.project, role='contributor')
+                        for record in batch if users.get(record['user']) not in (None, self.owner.id)]
+        Contributor.objects.bulk_create(contributors, ignore_conflicts=True)
+        self.counts['contributors'] += len(contributors)
+
+    def create_issues(self, batch):
+        users = self.user_ids([record.get(field) for record in batch for field in ('author', 'assigned')])
+        fields = ('project', 'author', 'assigned', *ISSUE_VALUES, *TIMESTAMPS, 'comment_count')
+        rows = [(self.project.id, users.get(record.get('author')), users.get(record.get('assigned')),
+                 *(self.clean(Issue, field, record[field] if field in record else ISSUE_DEFAULTS[field])
+                   for field in ISSUE_VALUES),
+                 *self.timestamps(record), 0)
+                for record in batch]
+        ids = insert_rows(Issue, fields, rows)
+        self.issue_ids.update(zip((record['id'] for record in batch), ids))
+        self.counts['issues'] += len(ids)
+
+    def create_comments(self, batch):
+        users = self.user_ids(record.get('author') for record in batch)
+        rows = []
+        for record in batch:
+            if record.get('issue') not in self.issue_ids:
+                raise ValidationError({'detail': f"Comment of the unknown issue {record.get('issue')!r}."})
+            rows.append((self.issue_ids[record['issue']], users.get(record.get('author')),
+                         self.clean(Comment, 'description', record['description']), *self.timestamps(record)))
+        self.counts['comments'] += len(insert_rows(Comment, ('issue', 'author', 'description', *TIMESTAMPS), rows))
+
+    def timestamps(self, record):
+        values = []
+        for field in TIMESTAMPS:
+            value = _parse_datetime(record[field]) if record.get(field) else self.now
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            values.append(self.adapt_datetime(value))
+        return values
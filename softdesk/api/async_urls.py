@@ -0,0 +1,13 @@
+from django.urls import path
+from rest_framework.urlpatterns import format_suffix_patterns
+from api import async_views, urls
+
+# The read endpoints served by coroutines under ASGI, in front of the urls of api.urls.
+urlpatterns = format_suffix_patterns([
+    path('projects/', async_views.ProjectList.as_view()),
+    path('projects/<int:pk>', async_views.ProjectDetail.as_view()),
+    path('projects/<int:pk>/issues/', async_views.IssueList.as_view()),
+    path('projects/<int:pk>/issues/<int:issue_id>', async_views.IssueDetail.as_view()),
+    path('projects/<int:pk>/issues/<int:issue_id>/comments/', async_views.CommentList.as_view()),
+    path('projects/<int:pk>/issues/<int:issue_id>/comments/<int:comment_id>', async_views.CommentDetail.as_view()),
+]) + urls.urlpatterns
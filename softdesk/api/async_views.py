@@ -0,0 +1,100 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.utils.decorators import classonlymethod
+from django.views import View
+
+from . import views
+from .membership import resolve_contributor
+
+
+def db(func, thread_sensitive=False):
+    """
+    Run the blocking `func` in the thread pool of the event loop (sized by the ASGI_THREADS
+    environment variable), Django 3.2 having no async ORM. The connection of the thread is
+    closed or kept afterwards according to CONN_MAX_AGE, as at the end of a request.
+    """
+    def call(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=thread_sensitive)
+
+
+class AsyncReadView(View):
+    """
+    Serve GET from a coroutine with the DRF view `view_class`: authentication, then the project
+    version and, with `prefetch_contributor`, the membership concurrently, then the view itself,
+    which reuses the membership. Each lookup runs in a thread of the pool while the event loop
+    keeps serving other requests. The other methods are handed to the DRF view as they are.
+    """
+    view_class = None
+    # The views that load their object with the membership in one query leave it to them.
+    prefetch_contributor = False
+    thread_sensitive = False
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        # Django 3.2 only awaits function views: wrap the view in one.
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+        async_view.view_class = cls
+        async_view.csrf_exempt = True
+        return async_view
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.sync_view = self.view_class.as_view()
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method == 'GET':
+            return await self.get(request, *args, **kwargs)
+        return await sync_to_async(self.sync_view)(request, *args, **kwargs)
+
+    def check_membership(self, view, request):
+        view.contributor = resolve_contributor(request.user, self.kwargs['pk'])
+
+    async def get(self, request, *args, **kwargs):
+        view = self.view_class()
+        view.args, view.kwargs = args, kwargs
+        view.headers = view.default_response_headers
+        request = view.request = view.initialize_request(request, *args, **kwargs)
+        try:
+            await db(view.initial, self.thread_sensitive)(request, *args, **kwargs)
+            lookups = [db(view.validate, self.thread_sensitive)(request)]
+            if self.prefetch_contributor:
+                lookups.append(db(self.check_membership, self.thread_sensitive)(view, request))
+            await asyncio.gather(*lookups)
+            response = await db(view.get, self.thread_sensitive)(request, *args, **kwargs)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        return view.finalize_response(request, response, *args, **kwargs)
+
+
+class ProjectList(AsyncReadView):
+    view_class = views.ProjectList
+
+
+class ProjectDetail(AsyncReadView):
+    view_class = views.ProjectDetail
+
+
+class IssueList(AsyncReadView):
+    view_class = views.IssueList
+    prefetch_contributor = True
+
+
+class IssueDetail(AsyncReadView):
+    view_class = views.IssueDetail
+
+
+class CommentList(AsyncReadView):
+    view_class = views.CommentList
+
+
+class CommentDetail(AsyncReadView):
+    view_class = views.CommentDetail
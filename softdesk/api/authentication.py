@@ -0,0 +1,40 @@
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import routers, tokens
+from .models import ClaimsUser
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication without the User query: request.user is built from the claims of the
+    token, a User whose other fields are deferred, so that the row is only loaded if
+    a view reads one of them. Revoked tokens are refused, see api.tokens. Memberships are not
+    taken from the token, they could not be revoked: see api.membership.
+    """
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            routers.identify(result[0].pk)
+        return result
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if tokens.is_revoked(token):
+            raise InvalidToken("Token is revoked.")
+        return token
+
+    def get_user(self, validated_token):
+        if 'username' not in validated_token:
+            # Issued before the claims were added.
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+        # Deactivating a user revokes their tokens.
+        return ClaimsUser.from_db(DEFAULT_DB_ALIAS, ['id', 'username', 'is_active'],
+                                  [user_id, validated_token['username'], True])
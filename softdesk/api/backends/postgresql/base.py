@@ -0,0 +1,32 @@
+from django.db.backends.postgresql import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL with the `health_checks` option: a persistent connection (CONN_MAX_AGE) is checked
+    before its first use in each request, and replaced if the server closed it meanwhile, rather
+    than failing the request.
+    """
+    health_check_done = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('health_checks', None)
+        return params
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        # Called at the start and at the end of the requests.
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done and not self.in_atomic_block
+                and self.settings_dict['OPTIONS'].get('health_checks')):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
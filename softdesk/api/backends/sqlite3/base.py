@@ -0,0 +1,26 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite with two more OPTIONS: `pragmas`, run on every new connection, and `transaction_mode`,
+    the mode of the BEGIN of the transactions. IMMEDIATE takes the write lock when the transaction
+    starts: a transaction reading before it writes then waits for the busy `timeout` like the
+    others, instead of failing at once with "database is locked" when it cannot upgrade its lock.
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
@@ -0,0 +1,82 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from . import versions
+from .models import Comment, Contributor, Issue, Project
+
+STATUS_COUNTERS = {
+    'to do': 'todo_issue_count',
+    'in progress': 'in_progress_issue_count',
+    'finished': 'finished_issue_count',
+}
+
+
+def _apply(model, deltas):
+    """
+    `deltas` maps a primary key to {field: delta}; issue one F() update per row.
+    """
+    for pk, fields in deltas.items():
+        fields = {field: F(field) + delta for field, delta in fields.items() if delta}
+        if fields:
+            model.objects.filter(pk=pk).update(**fields)
+
+
+def remember_status(issue):
+    issue._counted_status = issue.__dict__.get('status')
+
+
+def issues_created(issues, sign=1):
+    deltas = defaultdict(Counter)
+    for issue in issues:
+        deltas[issue.project_id]['issue_count'] += sign
+        deltas[issue.project_id][STATUS_COUNTERS[issue.status]] += sign
+        remember_status(issue)
+    _apply(Project, deltas)
+
+
+def issues_deleted(issues):
+    issues_created(issues, sign=-1)
+
+
+def issues_updated(issues):
+    deltas = defaultdict(Counter)
+    for issue in issues:
+        old_status = getattr(issue, '_counted_status', None)
+        if old_status is not None and old_status != issue.status:
+            deltas[issue.project_id][STATUS_COUNTERS[old_status]] -= 1
+            deltas[issue.project_id][STATUS_COUNTERS[issue.status]] += 1
+        remember_status(issue)
+    _apply(Project, deltas)
+
+
+def comments_changed(issue_id, delta):
+    _apply(Issue, {issue_id: {'comment_count': delta}})
+
+
+def contributors_changed(project_id, delta):
+    _apply(Project, {project_id: {'contributor_count': delta}})
+
+
+def _count(queryset, outer_field, **filters):
+    counts = (queryset.filter(**{outer_field: OuterRef('pk')}, **filters).order_by()
+              .values(outer_field).annotate(count=Count('pk')).values('count'))
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def rebuild_counters(project_ids=None):
+    """
+    Recompute every counter from the rows, with one UPDATE per table.
+    """
+    projects = Project.objects.all()
+    issues = Issue.objects.all()
+    if project_ids is not None:
+        projects = projects.filter(id__in=project_ids)
+        issues = issues.filter(project_id__in=project_ids)
+    fields = {counter: _count(Issue.objects, 'project', status=status) for status, counter in STATUS_COUNTERS.items()}
+    projects.update(issue_count=_count(Issue.objects, 'project'),
+                    contributor_count=_count(Contributor.objects, 'project'),
+                    **fields)
+    issues.update(comment_count=_count(Comment.objects, 'issue'))
+    versions.bump(projects)
@@ -0,0 +1,83 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import activity, counters, jobs, search, versions
+from .membership import membership_cache
+from .models import ActivityLog, Comment, Contributor, Issue, Project
+
+
+def _purge(queryset, batch_size, unindex=None):
+    """
+    Delete the rows of `queryset` with raw DELETE ... WHERE id IN (...) statements of at most
+    `batch_size` ids, one short transaction each: no signal, no row loaded, and the writer lock
+    is released between the batches. `unindex(ids)` removes them from the search index.
+    """
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+            if unindex is not None:
+                unindex(ids)
+        deleted += len(ids)
+
+
+def _unindex_comments(ids):
+    search.unindex_ids(comment_ids=ids)
+
+
+def _unindex_issues(ids):
+    search.unindex_ids(issue_ids=ids)
+
+
+def soft_delete_project(project, user):
+    """
+    Hide the project from every view at once and queue the job purging it. Returns the job.
+    """
+    with transaction.atomic():
+        Project.objects.filter(id=project.id).update(deleted_time=timezone.now())
+        job = jobs.enqueue('api.deletion.delete_project', key=f'delete-project:{project.id}', user=user,
+                           project_id=project.id)
+    membership_cache.invalidate(project.id)
+    return job
+
+
+def soft_delete_issues(issues, user):
+    """
+    Hide the issues, with the side effects of their deletion, and queue the job purging them.
+    """
+    ids = [issue.id for issue in issues]
+    with transaction.atomic():
+        Issue.objects.filter(id__in=ids).update(deleted_time=timezone.now())
+        counters.issues_deleted(issues)
+        for project_id in {issue.project_id for issue in issues}:
+            activity.record(project_id, [issue for issue in issues if issue.project_id == project_id], 'deleted')
+            versions.bump_project(project_id)
+        return jobs.enqueue('api.deletion.delete_issues', user=user, issue_ids=ids)
+
+
+def delete_project(project_id, batch_size=1000):
+    """
+    Background job purging a project: its comments, issues, contributors and change feed by
+    batches, then the project. Run again after a failure, it resumes where it stopped.
+    """
+    comments = _purge(Comment.objects.filter(issue__project_id=project_id), batch_size, _unindex_comments)
+    issues = _purge(Issue.all_objects.filter(project_id=project_id), batch_size, _unindex_issues)
+    _purge(Contributor.objects.filter(project_id=project_id), batch_size)
+    _purge(ActivityLog.objects.filter(project_id=project_id), batch_size)
+    _purge(Project.all_objects.filter(id=project_id), batch_size)
+    return {'issues': issues, 'comments': comments}
+
+
+def delete_issues(issue_ids, batch_size=1000):
+    """
+    Background job purging deleted issues and their comments by batches.
+    """
+    comments = _purge(Comment.objects.filter(issue_id__in=issue_ids), batch_size, _unindex_comments)
+    issues = _purge(Issue.all_objects.filter(id__in=issue_ids, deleted_time__isnull=False), batch_size,
+                    _unindex_issues)
+    return {'issues': issues, 'comments': comments}
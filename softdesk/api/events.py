@@ -0,0 +1,178 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from . import jobs
+from .models import ActivityLog
+
+
+class SubscriptionOverflow(Exception):
+    """
+    The subscriber fell too far behind and missed events: it must resync from the change feed.
+    """
+
+
+class Subscription:
+
+    def __init__(self, queue_size):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def put(self, event):
+        """
+        Called in the event loop of the subscriber.
+        """
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def next(self, timeout):
+        """
+        Return the next event, or None if nothing happened during `timeout` seconds.
+        """
+        if self.overflowed and self.queue.empty():
+            raise SubscriptionOverflow
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InMemoryBroker:
+    """
+    Fan-out of the events of a project to the subscriptions of the process, for tests and single
+    node deployments. `publish` may be called from any thread.
+    """
+    # Whether another process, a worker for instance, can publish to the subscribers.
+    shared = False
+
+    def __init__(self, queue_size=1000):
+        self.queue_size = queue_size
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, project_id, event):
+        self._fan_out(project_id, event)
+
+    def _fan_out(self, project_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(project_id, ()))
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.put, event)
+
+    @asynccontextmanager
+    async def subscribe(self, project_id):
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscriptions[project_id].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscriptions[project_id].discard(subscription)
+                if not self._subscriptions[project_id]:
+                    del self._subscriptions[project_id]
+
+
+class RedisBroker(InMemoryBroker):
+    """
+    Events go through Redis pub/sub so that every node receives them. Each process holds one
+    pattern subscription and fans the events out to its own subscriptions.
+    """
+    shared = True
+
+    def __init__(self, url, prefix='softdesk:events', queue_size=1000):
+        super().__init__(queue_size)
+        try:
+            import redis
+            import redis.asyncio  # noqa: F401
+        except ImportError:
+            raise ImproperlyConfigured("RedisBroker requires the redis package, version 4.2 or later.")
+        self.redis = redis
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._listener = None
+
+    def publish(self, project_id, event):
+        self._client.publish(f'{self.prefix}:{project_id}', json.dumps(event, cls=DjangoJSONEncoder))
+
+    async def _listen(self):
+        client = self.redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.psubscribe(f'{self.prefix}:*')
+        try:
+            async for message in pubsub.listen():
+                if message['type'] == 'pmessage':
+                    project_id = int(message['channel'].decode().rsplit(':', 1)[1])
+                    self._fan_out(project_id, json.loads(message['data']))
+        finally:
+            await pubsub.close()
+            await client.close()
+
+    @asynccontextmanager
+    async def subscribe(self, project_id):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.ensure_future(self._listen())
+        async with super().subscribe(project_id) as subscription:
+            yield subscription
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        config = getattr(settings, 'EVENTS', {})
+        broker_class = import_string(config.get('BROKER', 'api.events.InMemoryBroker'))
+        _broker = broker_class(**config.get('OPTIONS', {}))
+    return _broker
+
+
+def as_event(row):
+    """
+    Event of an ActivityLog row, in the format of the change feed.
+    """
+    return {'seq': row.id, 'model': row.model, 'action': row.action, 'id': row.object_id, 'data': row.data,
+            'created_time': row.created_time}
+
+
+def publish(rows):
+    """
+    Push the changes to the subscribers of their project once the transaction commits. Past
+    EVENTS['FAN_OUT_INLINE'] changes, a bulk write or a cascade, a background job pushes them
+    if the broker allows it.
+    """
+    if len(rows) > getattr(settings, 'EVENTS', {}).get('FAN_OUT_INLINE', 100) and get_broker().shared:
+        jobs.enqueue('api.events.fan_out', row_ids=[row.id for row in rows])
+        return
+    events = [(row.project_id, as_event(row)) for row in rows]
+
+    def send():
+        broker = get_broker()
+        for project_id, event in events:
+            broker.publish(project_id, event)
+    transaction.on_commit(send)
+
+
+def fan_out(row_ids):
+    """
+    Background job pushing the ActivityLog rows `row_ids`.
+    """
+    broker = get_broker()
+    for row in ActivityLog.objects.filter(id__in=row_ids).order_by('id'):
+        broker.publish(row.project_id, as_event(row))
+    return {'events': len(row_ids)}
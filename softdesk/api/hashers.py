@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, BCryptSHA256PasswordHasher, PBKDF2PasswordHasher
+from django.utils.module_loading import import_string
+
+_pool = None
+_pool_lock = threading.Lock()
+_in_worker = False
+
+
+def _init_worker():
+    global _in_worker
+    _in_worker = True
+
+
+def _call(hasher_path, method, *args):
+    return getattr(import_string(hasher_path)(), method)(*args)
+
+
+def get_pool():
+    """
+    The processes hashing the passwords, PASSWORD_HASHING_WORKERS of them (one per core by
+    default), None when it is 0.
+    """
+    global _pool
+    if _in_worker:
+        return None
+    workers = getattr(settings, 'PASSWORD_HASHING_WORKERS', None)
+    if workers == 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(workers or os.cpu_count(), mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker)
+    return _pool
+
+
+class PooledHasherMixin:
+    """
+    Run `encode` and `verify` in the process pool: the request thread waits without holding
+    the GIL, and no more hashes than workers run at once whatever the number of requests,
+    the others wait in the queue of the pool.
+    """
+
+    def _run(self, method, *args):
+        pool = get_pool()
+        if pool is None:
+            return getattr(super(), method)(*args)
+        return pool.submit(_call, f'{type(self).__module__}.{type(self).__qualname__}', method, *args).result()
+
+    def encode(self, *args):
+        return self._run('encode', *args)
+
+    def verify(self, password, encoded):
+        return self._run('verify', password, encoded)
+
+
+class PooledArgon2PasswordHasher(PooledHasherMixin, Argon2PasswordHasher):
+    pass
+
+
+class PooledBCryptSHA256PasswordHasher(PooledHasherMixin, BCryptSHA256PasswordHasher):
+    pass
+
+
+class PooledPBKDF2PasswordHasher(PooledHasherMixin, PBKDF2PasswordHasher):
+    pass
@@ -0,0 +1,142 @@
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+
+def get_settings():
+    return {'QUEUE': 'api.jobs.DatabaseQueue', 'OPTIONS': {}, 'MAX_ATTEMPTS': 3, 'RETRY_DELAY': 10,
+            'LEASE': 300, **getattr(settings, 'JOBS', {})}
+
+
+class DatabaseQueue:
+    """
+    The workers poll the job table every `poll_interval` seconds.
+    """
+
+    def __init__(self, poll_interval=1):
+        self.poll_interval = poll_interval
+
+    def push(self, job):
+        pass
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.poll_interval))
+
+
+class RedisQueue(DatabaseQueue):
+    """
+    The job table stays the source of truth; the ids pushed to a Redis list once the transaction
+    commits wake an idle worker at once instead of at its next poll.
+    """
+
+    def __init__(self, url, key='softdesk:jobs', poll_interval=5):
+        super().__init__(poll_interval)
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("RedisQueue requires the redis package.")
+        self.key = key
+        self._client = redis.Redis.from_url(url)
+
+    def push(self, job):
+        transaction.on_commit(lambda: self._client.lpush(self.key, job.id))
+
+    def wait(self, timeout):
+        self._client.brpop(self.key, timeout=max(1, round(min(timeout, self.poll_interval))))
+
+
+_queue = None
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        config = get_settings()
+        _queue = import_string(config['QUEUE'])(**config['OPTIONS'])
+    return _queue
+
+
+def enqueue(task, key=None, user=None, max_attempts=None, **kwargs):
+    """
+    Queue the call of the function at the dotted path `task` with the JSON serializable `kwargs`,
+    in the current transaction. With an idempotency `key`, the job already queued under this key
+    is returned instead, or queued again if it failed.
+    """
+    fields = {'task': task, 'kwargs': kwargs, 'user': user,
+              'max_attempts': max_attempts or get_settings()['MAX_ATTEMPTS']}
+    if key is None:
+        job = Job.objects.create(**fields)
+    else:
+        job, created = Job.objects.get_or_create(key=key, defaults=fields)
+        if not created and job.status == 'failed':
+            job.status, job.attempts, job.run_at, job.error = 'queued', 0, timezone.now(), ''
+            job.save(update_fields=['status', 'attempts', 'run_at', 'error', 'updated_time'])
+        elif not created:
+            return job
+    get_queue().push(job)
+    return job
+
+
+def _claimable(now):
+    # Queued and due, or still running past the lease of a worker that died.
+    return Q(status='queued', run_at__lte=now) | Q(status='running', locked_until__lt=now)
+
+
+def claim():
+    """
+    Take the next due job, or None. The conditional UPDATE makes sure each claim goes to a
+    single worker, on any database.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(_claimable(now)).order_by('run_at', 'id').values_list('id', flat=True)[:10]
+    for pk in candidates:
+        claimed = Job.objects.filter(_claimable(now), pk=pk).update(
+            status='running', attempts=F('attempts') + 1, updated_time=now,
+            locked_until=now + timedelta(seconds=get_settings()['LEASE']))
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run(job):
+    """
+    Call the task of a claimed job. A failed attempt is retried after RETRY_DELAY seconds,
+    doubled at each attempt, until the job has run `max_attempts` times.
+    """
+    try:
+        if job.attempts > job.max_attempts:
+            raise RuntimeError("The worker running the job stopped.")
+        result = import_string(job.task)(**job.kwargs)
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_at = timezone.now() + timedelta(seconds=get_settings()['RETRY_DELAY'] * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+    else:
+        job.status, job.result, job.error = 'succeeded', result, ''
+    job.locked_until = None
+    job.save(update_fields=['status', 'result', 'error', 'run_at', 'locked_until', 'updated_time'])
+    return job
+
+
+def run_pending():
+    """
+    Run the due jobs until none is left, in this thread. Returns the jobs run.
+    """
+    done = []
+    job = claim()
+    while job is not None:
+        done.append(run(job))
+        job = claim()
+    return done
@@ -0,0 +1,431 @@
+import datetime
+import http.client
+import json
+import os
+import re
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve
+from rest_framework.test import APIClient
+
+from api import archive, urls
+from api.membership import membership_cache
+from api.models import ActivityLog, Comment, Contributor, Issue, Job, Project
+from api.serializers import SignInSerializer
+
+# `body` and `token` are values or functions of the number of the request. `prepare`, a function
+# of the number of the request too, creates the rows the request needs and returns the values
+# of the placeholders of `path`. They are called before the request is timed.
+Scenario = namedtuple('Scenario', ['name', 'method', 'path', 'body', 'token', 'prepare', 'write'],
+                      defaults=[None, None, None, False])
+
+CONCURRENT_WRITES = ('issue-create', 'comment-create', 'issue-bulk-create', 'comment-bulk-create')
+
+QUERIES = re.compile(r'desc="(\d+) queries')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Benchmark every route of api/urls.py on a seeded database (see the `seed` command): "
+            "requests/sec, p50/p95/p99 latency and SQL queries per request of each route. By default "
+            "the requests go through the test client, writes included, in a transaction rolled back "
+            "at the end. With --url they go to a running server, reads only; the queries are then "
+            "read from the Server-Timing header, see METRICS['SERVER_TIMING']. --output saves the "
+            "results as JSON, --compare checks them against a saved run, for CI.\n"
+            "With --writers, the writes of issues and comments are sent from that many threads on a scratch "
+            "project, committed, and --profiles runs them once per database profile (DB_PROFILE of the "
+            "settings) to compare their concurrent write throughput.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Base URL of a running server, http://127.0.0.1:8000 for instance.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per route.")
+        parser.add_argument('--warmup', type=int, default=20, help="Requests per route before measuring.")
+        parser.add_argument('--concurrency', type=int, default=10, help="Concurrent requests with --url.")
+        parser.add_argument('--writers', type=int,
+                            help="Send the concurrent writes from that many threads, committed.")
+        parser.add_argument('--profiles', nargs='+', help="Database profiles to compare the concurrent writes of.")
+        parser.add_argument('--password', default='softdesk', help="Password of the seeded users.")
+        parser.add_argument('--only', nargs='+', help="Names of the scenarios to run.")
+        parser.add_argument('--output', help="Path of the JSON report.")
+        parser.add_argument('--compare', help="JSON report of a previous run to compare with.")
+        parser.add_argument('--max-regression', type=float, default=0.25,
+                            help="Allowed increase of the p95 latency over --compare, 0.25 for 25%%.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        if options['profiles']:
+            return self.compare_profiles(options['profiles'])
+        scenarios = self.scenarios(*self.busiest())
+        uncovered = self.uncovered(scenarios)
+        if options['only']:
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['only']]
+        if options['url']:
+            scenarios = [scenario for scenario in scenarios if not scenario.write]
+            results = [self.run_http(scenario) for scenario in scenarios]
+        elif options['writers']:
+            results = self.run_concurrent_writes([scenario.name for scenario in scenarios])
+        else:
+            results = self.run_client(scenarios)
+
+        report = {
+            'mode': 'http' if options['url'] else 'writers' if options['writers'] else 'client',
+            'profile': settings.DB_PROFILE,
+            'writers': options['writers'],
+            'url': options['url'],
+            'vendor': connection.vendor,
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'dataset': {'users': User.objects.count(), 'projects': Project.objects.count(),
+                        'issues': Issue.objects.count(), 'comments': Comment.objects.count()},
+            'requests': options['requests'],
+            'uncovered': uncovered,
+            'scenarios': results,
+        }
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+        if options['compare']:
+            with open(options['compare']) as file:
+                self.compare(json.load(file), report)
+
+    def busiest(self):
+        """
+        The project with the most issues, its most commented issue, its last comment and its author.
+        """
+        project = Project.objects.order_by('-issue_count', 'id').first()
+        issue = project and Issue.objects.filter(project=project).order_by('-comment_count', 'id').first()
+        comment = issue and Comment.objects.filter(issue=issue).order_by('-id').first()
+        if comment is None:
+            raise CommandError("The database is empty, run `manage.py seed` first.")
+        return project, issue, comment, Contributor.objects.get(project=project, role='author').user
+
+    def scenarios(self, project, issue, comment, user):
+        token = SignInSerializer.get_token(user)
+        self.access = str(token.access_token)
+        p = f'/api/v1/projects/{project.id}'
+        i = f'{p}/issues/{issue.id}'
+
+        def new_user(n):
+            return User.objects.create_user(username=f'benchmark-{n}-{time.time_ns()}')
+
+        def contributor_to_remove(n):
+            contributor = Contributor.objects.create(user=new_user(n), project=project, role='contributor')
+            return {'user_id': contributor.user_id}
+
+        archive_body = b''.join(archive.compress([
+            {'format': archive.FORMAT, 'version': archive.VERSION},
+            {'record': 'project', 'title': 'Benchmark import', 'description': 'benchmark', 'type': 'back-end'},
+            *({'record': 'issue', 'id': k, 'title': f'benchmark {k}', 'description': 'benchmark',
+               'author': user.username} for k in range(10)),
+            *({'record': 'comment', 'issue': k, 'description': 'benchmark'} for k in range(10)),
+        ]))
+
+        def job_to_poll(n):
+            return {'job_id': Job.objects.create(task='api.counters.rebuild_counters', user=user).id}
+
+        return [
+            Scenario('signin', 'POST', '/api/v1/signin/', {'username': user.username,
+                                                           'password': self.options['password']}),
+            Scenario('token-refresh', 'POST', '/api/v1/token/refresh/', {'refresh': str(token)}),
+            Scenario('project-list', 'GET', '/api/v1/projects/'),
+            Scenario('project-summary', 'GET', '/api/v1/projects/summary/'),
+            Scenario('project-detail', 'GET', p),
+            Scenario('contributor-list', 'GET', f'{p}/users/'),
+            Scenario('issue-list', 'GET', f'{p}/issues/'),
+            Scenario('issue-search', 'GET', f'{p}/search/?q=crash'),
+            Scenario('changes', 'GET', f'{p}/changes/'),
+            Scenario('project-export', 'GET', f'{p}/export'),
+            Scenario('issue-detail', 'GET', i),
+            Scenario('comment-list', 'GET', f'{i}/comments/'),
+            Scenario('comment-detail', 'GET', f'{i}/comments/{comment.id}'),
+            Scenario('signup', 'POST', '/api/v1/signup/',
+                     lambda n: {'username': f'benchmark-{n}-{time.time_ns()}', 'password': 'benchmark',
+                                'password2': 'benchmark'}, write=True),
+            Scenario('signout', 'POST', '/api/v1/signout/', {},
+                     token=lambda n: str(SignInSerializer.get_token(user).access_token), write=True),
+            Scenario('project-create', 'POST', '/api/v1/projects/',
+                     lambda n: {'title': f'Benchmark {n}', 'description': 'benchmark', 'type': 'back-end'},
+                     write=True),
+            Scenario('contributor-add', 'POST', f'{p}/users/', lambda n: {'username': new_user(n).username},
+                     write=True),
+            Scenario('contributor-remove', 'DELETE', f'{p}/users/{{user_id}}', prepare=contributor_to_remove,
+                     write=True),
+            Scenario('issue-create', 'POST', f'{p}/issues/',
+                     lambda n: {'title': f'benchmark {n}', 'description': 'benchmark', 'assigned': user.username},
+                     write=True),
+            Scenario('issue-bulk-create', 'POST', f'{p}/issues/bulk/',
+                     lambda n: [{'title': f'benchmark {n}.{k}', 'description': 'benchmark'} for k in range(10)],
+                     write=True),
+            Scenario('comment-create', 'POST', f'{i}/comments/', {'description': 'benchmark'}, write=True),
+            Scenario('comment-bulk-create', 'POST', f'{i}/comments/bulk/',
+                     [{'description': 'benchmark'} for _ in range(10)], write=True),
+            Scenario('project-import', 'POST', '/api/v1/projects/import/', archive_body, write=True),
+            Scenario('job-status', 'GET', '/api/v1/jobs/{job_id}', prepare=job_to_poll, write=True),
+        ]
+
+    @staticmethod
+    def resolve(value, n):
+        return value(n) if callable(value) else value
+
+    @staticmethod
+    def prepare(scenario, n):
+        return scenario.path.format(**scenario.prepare(n)) if scenario.prepare else scenario.path
+
+    def uncovered(self, scenarios):
+        """
+        The routes of api/urls.py without a scenario.
+        """
+        routes = {pattern.pattern._route for pattern in urls.urlpatterns if 'format' not in pattern.pattern.converters}
+        covered = set()
+        for scenario in scenarios:
+            placeholders = {name: 0 for _, name, _, _ in string.Formatter().parse(scenario.path) if name}
+            path = scenario.path.format(**placeholders).split('?')[0]
+            covered.add(resolve(path).route.replace('api/v1/', '', 1))
+        return sorted(routes - covered)
+
+    @staticmethod
+    def client_settings():
+        """
+        No throttling nor concurrency caps, and caches of their own.
+        """
+        rest_framework = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+        caches = {alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'benchmark-{alias}'}
+                  for alias in settings.CACHES}
+        return override_settings(REST_FRAMEWORK=rest_framework, CACHES=caches, CONCURRENCY_LIMITS={},
+                                 ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+
+    def run_client(self, scenarios):
+        """
+        Send the requests one after the other through the test client, in a transaction rolled back
+        at the end.
+        """
+        results = []
+        with self.client_settings():
+            try:
+                with transaction.atomic():
+                    client = APIClient()
+                    for scenario in scenarios:
+                        results.append(self.run_scenario(client, scenario))
+                    raise Rollback
+            except Rollback:
+                pass
+            membership_cache.clear()
+        return results
+
+    def send(self, client, scenario, n):
+        """
+        Return the status, the latency in ms and the queries of the request `n` of `scenario`.
+        """
+        path, body = self.prepare(scenario, n), self.resolve(scenario.body, n)
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.resolve(scenario.token, n) or self.access}')
+        send = getattr(client, scenario.method.lower())
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            if scenario.method == 'GET':
+                response = send(path)
+            elif isinstance(body, bytes):
+                response = send(path, body, content_type=archive.MEDIA_TYPE)
+            else:
+                # Form data, as the clients of the API send, except for the bulk lists.
+                response = send(path, body, format='json' if isinstance(body, list) else 'multipart')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - start) * 1000
+        return response.status_code, elapsed, len(captured)
+
+    def run_scenario(self, client, scenario):
+        latencies, queries, errors = [], [], 0
+        warmup = self.options['warmup']
+        for n in range(warmup + self.options['requests']):
+            status, elapsed, count = self.send(client, scenario, n)
+            if n < warmup:
+                continue
+            if status >= 400:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            queries.append(count)
+        return self.summary(scenario, latencies, errors, sum(latencies) / 1000, queries)
+
+    def run_concurrent_writes(self, names):
+        """
+        Send the writes of CONCURRENT_WRITES from --writers threads, each request in its own
+        connection as with CONN_MAX_AGE=0 (or a connection kept CONN_MAX_AGE seconds), on a
+        scratch project deleted at the end.
+        """
+        _, _, _, user = self.busiest()
+        project = Project.objects.create(title=f'Benchmark {time.time_ns()}', description='benchmark')
+        Contributor.objects.create(user=user, project=project, role='author')
+        issue = Issue.objects.create(project=project, author=user, assigned=user, title='benchmark',
+                                     description='benchmark')
+        comment = Comment.objects.create(issue=issue, author=user, description='benchmark')
+        scenarios = [scenario for scenario in self.scenarios(project, issue, comment, user)
+                     if scenario.name in CONCURRENT_WRITES and scenario.name in names]
+        local = threading.local()
+
+        def run(scenario, count, offset):
+            def request(n):
+                if not hasattr(local, 'client'):
+                    local.client = APIClient(raise_request_exception=False)
+                try:
+                    return self.send(local.client, scenario, n)
+                finally:
+                    close_old_connections()
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(self.options['writers']) as executor:
+                timings = list(executor.map(request, range(offset, offset + count)))
+            return timings, time.perf_counter() - start
+
+        results = []
+        try:
+            with self.client_settings():
+                for scenario in scenarios:
+                    run(scenario, self.options['warmup'], 0)
+                    timings, elapsed = run(scenario, self.options['requests'], self.options['warmup'])
+                    done = [timing for timing in timings if timing[0] < 400]
+                    results.append(self.summary(scenario, [latency for _, latency, _ in done],
+                                                len(timings) - len(done), elapsed, [count for *_, count in done]))
+        finally:
+            project.delete()
+            ActivityLog.objects.filter(project_id=project.id).delete()
+            membership_cache.clear()
+        return results
+
+    def compare_profiles(self, profiles):
+        """
+        Run the concurrent writes once per database profile, each in a process of its own since the
+        profile is read from the environment by the settings.
+        """
+        reports = {}
+        for profile in profiles:
+            with tempfile.NamedTemporaryFile(suffix='.json') as output:
+                command = [sys.executable, str(Path(settings.BASE_DIR) / 'manage.py'), 'benchmark',
+                           '--writers', str(self.options['writers'] or 8),
+                           '--requests', str(self.options['requests']), '--warmup', str(self.options['warmup']),
+                           '--password', self.options['password'], '--output', output.name]
+                if self.options['only']:
+                    command += ['--only', *self.options['only']]
+                process = subprocess.run(command, env={**os.environ, 'DB_PROFILE': profile},
+                                         capture_output=True, text=True)
+                if process.returncode:
+                    raise CommandError(f"Profile {profile} failed:\n{process.stderr}")
+                reports[profile] = json.load(output)
+
+        self.stdout.write(f"{'route':<22}" + ''.join(f"{profile:>36}" for profile in profiles))
+        self.stdout.write(f"{'':<22}" + f"{'req/s':>12}{'p95 (ms)':>12}{'errors':>12}" * len(profiles))
+        for i, result in enumerate(reports[profiles[0]]['scenarios']):
+            row = [reports[profile]['scenarios'][i] for profile in profiles]
+            self.stdout.write(f"{result['name']:<22}" + ''.join(
+                f"{item['throughput']:>12.1f}{item['p95']:>12.2f}{item['errors']:>12}" for item in row))
+        if self.options['output']:
+            with open(self.options['output'], 'w') as file:
+                json.dump({'mode': 'profiles', 'profiles': reports}, file, indent=2)
+
+    def run_http(self, scenario):
+        """
+        Send the requests from --concurrency threads, each on its own keep-alive connection.
+        """
+        parts = urlsplit(self.options['url'])
+        local = threading.local()
+
+        def request(n):
+            if not hasattr(local, 'connection'):
+                local.connection = http.client.HTTPConnection(parts.netloc, timeout=30)
+            path, body = self.prepare(scenario, n), self.resolve(scenario.body, n)
+            headers = {'Authorization': f'Bearer {self.resolve(scenario.token, n) or self.access}',
+                       'Content-Type': 'application/json'}
+            start = time.perf_counter()
+            try:
+                local.connection.request(scenario.method, parts.path.rstrip('/') + path,
+                                         None if body is None else json.dumps(body), headers)
+                response = local.connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                local.connection.close()
+                del local.connection
+                return None
+            if response.status >= 400:
+                return None
+            match = QUERIES.search(response.getheader('Server-Timing') or '')
+            return (time.perf_counter() - start) * 1000, int(match.group(1)) if match else None
+
+        with ThreadPoolExecutor(self.options['concurrency']) as executor:
+            list(executor.map(request, range(self.options['warmup'])))
+            start = time.perf_counter()
+            timings = list(executor.map(request, range(self.options['requests'])))
+            elapsed = time.perf_counter() - start
+        done = [timing for timing in timings if timing is not None]
+        queries = [count for _, count in done if count is not None]
+        return self.summary(scenario, [latency for latency, _ in done], len(timings) - len(done), elapsed, queries)
+
+    def summary(self, scenario, latencies, errors, elapsed, queries):
+        return {
+            'name': scenario.name,
+            'method': scenario.method,
+            'requests': len(latencies) + errors,
+            'errors': errors,
+            'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0,
+            'p50': round(self.percentile(latencies, 50), 2),
+            'p95': round(self.percentile(latencies, 95), 2),
+            'p99': round(self.percentile(latencies, 99), 2),
+            'queries': round(statistics.mean(queries), 1) if queries else None,
+        }
+
+    @staticmethod
+    def percentile(values, percent):
+        if len(values) < 2:
+            return values[0] if values else 0
+        return statistics.quantiles(values, n=100)[percent - 1]
+
+    def print_report(self, report):
+        self.stdout.write(f"{report['mode']} on {report['vendor']}: " +
+                          ', '.join(f'{count} {name}' for name, count in report['dataset'].items()))
+        self.stdout.write(f"{'route':<22}{'requests':>9}{'errors':>8}{'req/s':>9}"
+                          f"{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'queries':>9}")
+        for result in report['scenarios']:
+            queries = '-' if result['queries'] is None else result['queries']
+            self.stdout.write(f"{result['name']:<22}{result['requests']:>9}{result['errors']:>8}"
+                              f"{result['throughput']:>9.1f}{result['p50']:>10.2f}{result['p95']:>10.2f}"
+                              f"{result['p99']:>10.2f}{queries:>9}")
+        if report['uncovered']:
+            self.stdout.write(self.style.WARNING(f"Not benchmarked: {', '.join(report['uncovered'])}"))
+
+    def compare(self, baseline, report):
+        """
+        Fail if a route got slower than --max-regression allows at p95, runs more queries, or
+        has errors it did not have.
+        """
+        previous = {result['name']: result for result in baseline['scenarios']}
+        failures = []
+        for result in report['scenarios']:
+            before = previous.get(result['name'])
+            if before is None or before['errors'] == before['requests']:
+                continue
+            if result['p95'] > before['p95'] * (1 + self.options['max_regression']):
+                failures.append(f"{result['name']}: p95 {before['p95']} -> {result['p95']} ms")
+            if None not in (result['queries'], before['queries']) and result['queries'] > before['queries']:
+                failures.append(f"{result['name']}: {before['queries']} -> {result['queries']} queries")
+            if result['errors'] > before['errors']:
+                failures.append(f"{result['name']}: {before['errors']} -> {result['errors']} errors")
+        if failures:
+            raise CommandError("Regressions:\n  " + '\n  '.join(failures))
+        self.stdout.write(self.style.SUCCESS(f"No regression against {self.options['compare']}."))
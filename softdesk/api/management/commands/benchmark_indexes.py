@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.models import Comment, Contributor, Issue
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Show the plan and the latency of the hot lookups of the API, without then with the indexes "
+            "of api.models. Run it on a seeded database, see the `seed` command.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        issue = Issue.objects.order_by('-id').first()
+        comment = Comment.objects.filter(issue__project_id=issue.project_id).order_by('-id').first() if issue else None
+        if comment is None:
+            raise CommandError("The database is empty, run `manage.py seed` first.")
+        contributor = Contributor.objects.filter(project_id=issue.project_id).order_by('-id').first()
+        self.queries = {
+            'membership': Contributor.objects.filter(user_id=contributor.user_id, project_id=issue.project_id),
+            'project authors': Contributor.objects.filter(project_id=issue.project_id, role='author'),
+            'issue': Issue.objects.filter(project_id=issue.project_id, id=issue.id),
+            'issue page': Issue.objects.filter(project_id=issue.project_id).order_by('created_time', 'id')[:50],
+            'comment': Comment.objects.filter(issue_id=comment.issue_id, id=comment.id),
+            'comment page': Comment.objects.filter(issue_id=comment.issue_id).order_by('created_time', 'id')[:50],
+        }
+        self.stdout.write(f"{Issue.objects.count()} issues, {Comment.objects.count()} comments "
+                          f"on {connection.vendor}.\n")
+
+        try:
+            with transaction.atomic():
+                self.drop_indexes()
+                before = self.measure(options['repeat'], 'without indexes')
+                raise Rollback
+        except Rollback:
+            pass
+        after = self.measure(options['repeat'], 'with indexes')
+
+        self.stdout.write(f"{'query':<20}{'before (ms)':>14}{'after (ms)':>14}")
+        for name in self.queries:
+            self.stdout.write(f"{name:<20}{before[name]:>14.3f}{after[name]:>14.3f}")
+
+    def drop_indexes(self):
+        with connection.cursor() as cursor:
+            for model in (Contributor, Issue, Comment):
+                for index in model._meta.indexes:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+                for constraint in model._meta.constraints:
+                    if connection.vendor == 'sqlite':
+                        # SQLite keeps unique constraints in the table definition.
+                        continue
+                    cursor.execute(f'ALTER TABLE {connection.ops.quote_name(model._meta.db_table)} '
+                                   f'DROP CONSTRAINT {connection.ops.quote_name(constraint.name)}')
+
+    def measure(self, repeat, label):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Plans {label}:"))
+        medians = {}
+        for name, queryset in self.queries.items():
+            plan = queryset.explain().replace('\n', '\n    ')
+            self.stdout.write(f"  {name}:\n    {plan}")
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            medians[name] = statistics.median(timings)
+        self.stdout.write('')
+        return medians
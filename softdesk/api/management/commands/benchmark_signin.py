@@ -0,0 +1,54 @@
+import importlib.util
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+HASHERS = [
+    ('pbkdf2 inline', 'django.contrib.auth.hashers.PBKDF2PasswordHasher', None),
+    ('pbkdf2 pooled', 'api.hashers.PooledPBKDF2PasswordHasher', None),
+    ('bcrypt pooled', 'api.hashers.PooledBCryptSHA256PasswordHasher', 'bcrypt'),
+    ('argon2 pooled', 'api.hashers.PooledArgon2PasswordHasher', 'argon2'),
+]
+
+
+class Command(BaseCommand):
+    help = ("Verify a password from concurrent threads, as concurrent sign ins do, with Django's inline "
+            "PBKDF2 hasher then with the pooled hashers of api.hashers, and report the verifications/sec, "
+            "per core, and the median latency. Argon2 and bcrypt are skipped when their package is missing.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=16)
+
+    def handle(self, *args, **options):
+        cores = os.cpu_count()
+        self.stdout.write(f"{cores} cores, {settings.PASSWORD_HASHING_WORKERS or cores} hashing workers.\n")
+        self.stdout.write(f"{'hasher':<16}{'verif/s':>10}{'per core':>10}{'p50 (ms)':>10}")
+        for label, hasher, package in HASHERS:
+            if package and not importlib.util.find_spec(package):
+                self.stdout.write(f"{label:<16}{'not installed':>30}")
+                continue
+            with override_settings(PASSWORD_HASHERS=[hasher]):
+                rate, p50 = self.measure(options['requests'], options['concurrency'])
+            self.stdout.write(f"{label:<16}{rate:>10.1f}{rate / cores:>10.1f}{p50:>10.1f}")
+
+    def measure(self, count, concurrency):
+        encoded = make_password('softdesk')
+        # Warm up, starting the pool.
+        check_password('softdesk', encoded)
+
+        def verify(_):
+            start = time.perf_counter()
+            check_password('softdesk', encoded)
+            return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            latencies = list(executor.map(verify, range(count)))
+        return count / (time.perf_counter() - start), statistics.median(latencies)
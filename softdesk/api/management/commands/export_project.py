@@ -0,0 +1,25 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import archive
+from api.models import Project
+
+
+class Command(BaseCommand):
+    help = "Write the gzip NDJSON archive of a project, as GET /projects/<id>/export, to a file or stdout."
+
+    def add_arguments(self, parser):
+        parser.add_argument('project', type=int)
+        parser.add_argument('--output', help="Path of the archive, stdout by default.")
+
+    def handle(self, *args, **options):
+        if not Project.objects.filter(id=options['project']).exists():
+            raise CommandError(f"Project with id '{options['project']}' doesn't exist.")
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in archive.export_project(options['project']):
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from api import archive
+
+
+class Command(BaseCommand):
+    help = "Create a project from an archive of export_project: gzip, or plain NDJSON if not named *.gz."
+
+    def add_arguments(self, parser):
+        parser.add_argument('archive', help="Path of the archive.")
+        parser.add_argument('--owner', required=True, help="Username of the author of the project.")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"User with username '{options['owner']}' doesn't exist.")
+        importer = archive.Importer(owner, batch_size=options['batch_size'])
+        with open(options['archive'], 'rb') as file:
+            try:
+                project = importer.run(archive.read_records(file, compressed=options['archive'].endswith('.gz')))
+            except ValidationError as exc:
+                raise CommandError(exc.detail)
+        counts = ', '.join(f'{count} {name}' for name, count in importer.counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Project {project.id} imported: {counts}."))
@@ -0,0 +1,96 @@
+import http.client
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ("Load a running server with concurrent GET requests and report requests/sec and latency "
+            "percentiles per target, for instance the WSGI and the ASGI deployments side by side:\n"
+            "  gunicorn softdesk.wsgi -w 4 -b :8000 & uvicorn softdesk.asgi:application --workers 4 --port 8001 &\n"
+            "  manage.py loadtest wsgi=http://127.0.0.1:8000/api/v1/projects/1 "
+            "asgi=http://127.0.0.1:8001/api/v1/projects/1 --username seed-0 --password softdesk")
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help="URLs to load, optionally labelled: label=url.")
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per target.")
+        parser.add_argument('--warmup', type=int, default=100, help="Requests per target before measuring.")
+        parser.add_argument('--token', help="JWT access token.")
+        parser.add_argument('--username')
+        parser.add_argument('--password')
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        targets = [target.split('=', 1) if '=' in target.split('://')[0] else (target, target)
+                   for target in options['targets']]
+        self.timeout = options['timeout']
+        token = options['token'] or self.sign_in(targets[0][1], options['username'], options['password'])
+        self.headers = {'Authorization': f'Bearer {token}', 'Connection': 'keep-alive'}
+
+        results = []
+        for label, url in targets:
+            self.run(url, options['warmup'], options['concurrency'])
+            start = time.perf_counter()
+            latencies, errors = self.run(url, options['requests'], options['concurrency'])
+            elapsed = time.perf_counter() - start
+            results.append((label, options['requests'], errors, options['requests'] / elapsed, latencies))
+
+        self.stdout.write(f"{'target':<20}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+        for label, count, errors, rps, latencies in results:
+            p50, p99 = self.percentile(latencies, 50), self.percentile(latencies, 99)
+            self.stdout.write(f"{label:<20}{count:>10}{errors:>8}{rps:>10.1f}{p50:>10.1f}{p99:>10.1f}")
+
+    def sign_in(self, url, username, password):
+        if not username or not password:
+            raise CommandError("Pass --token, or --username and --password.")
+        parts = urlsplit(url)
+        connection = http.client.HTTPConnection(parts.netloc, timeout=self.timeout)
+        connection.request('POST', '/api/v1/signin/', json.dumps({'username': username, 'password': password}),
+                           {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise CommandError(f"Sign in failed: {response.status} {body.decode()}")
+        return json.loads(body)['access']
+
+    def run(self, url, count, concurrency):
+        """
+        Send `count` GET requests to `url` from `concurrency` threads, each on its own keep-alive
+        connection. Return the latencies in ms of the successful ones and the number of errors.
+        """
+        parts = urlsplit(url)
+        path = parts.path + (f'?{parts.query}' if parts.query else '')
+        local = threading.local()
+
+        def request(_):
+            if not hasattr(local, 'connection'):
+                local.connection = http.client.HTTPConnection(parts.netloc, timeout=self.timeout)
+            start = time.perf_counter()
+            try:
+                local.connection.request('GET', path, headers=self.headers)
+                response = local.connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                local.connection.close()
+                del local.connection
+                return None
+            if response.status >= 400:
+                return None
+            return (time.perf_counter() - start) * 1000
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            timings = list(executor.map(request, range(count)))
+        latencies = [timing for timing in timings if timing is not None]
+        return latencies, len(timings) - len(latencies)
+
+    @staticmethod
+    def percentile(values, percent):
+        if len(values) < 2:
+            return values[0] if values else 0
+        return statistics.quantiles(values, n=100)[percent - 1]
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import activity
+
+
+class Command(BaseCommand):
+    help = ("Compact the change feed, dropping the changes superseded by a later change of the same object, "
+            "then prune the changes older than --days. Meant to run periodically, from cron for instance.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help="Age of the changes to prune, 0 to keep them all.")
+        parser.add_argument('--no-compact', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not options['no_compact']:
+            compacted = activity.compact(batch_size=options['batch_size'])
+            self.stdout.write(f"{compacted} superseded changes compacted.")
+        if options['days']:
+            pruned = activity.prune(timezone.now() - timedelta(days=options['days']), batch_size=options['batch_size'])
+            self.stdout.write(f"{pruned} changes pruned.")
+        self.stdout.write(self.style.SUCCESS("Change feed pruned."))
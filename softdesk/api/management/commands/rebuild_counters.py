@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api import jobs
+from api.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized issue, comment and contributor counters from the rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('projects', nargs='*', type=int, help="Ids of the projects to rebuild, all by default.")
+        parser.add_argument('--enqueue', action='store_true', help="Leave the rebuild to a worker.")
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            job = jobs.enqueue('api.counters.rebuild_counters', project_ids=options['projects'] or None)
+            self.stdout.write(self.style.SUCCESS(f"Counter rebuild queued as job {job.id}."))
+            return
+        rebuild_counters(options['projects'] or None)
+        self.stdout.write(self.style.SUCCESS("Counters rebuilt."))
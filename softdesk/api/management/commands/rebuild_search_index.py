@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api import jobs
+from api.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full text index of the issues and comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument('projects', nargs='*', type=int, help="Ids of the projects to reindex, all by default.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--enqueue', action='store_true', help="Leave the rebuild to a worker.")
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            job = jobs.enqueue('api.search.rebuild_index', project_ids=options['projects'] or None,
+                               batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Search index rebuild queued as job {job.id}."))
+            return
+        rebuild_index(options['projects'] or None, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,114 @@
+import itertools
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.counters import rebuild_counters
+from api.models import Comment, Contributor, Issue, Project
+from api.querysets import bulk_create_with_ids
+from api.search import rebuild_index
+
+WORDS = ('login', 'page', 'error', 'crash', 'slow', 'button', 'export', 'import', 'search', 'mobile', 'android',
+         'ios', 'api', 'timeout', 'database', 'report', 'email', 'upload', 'layout', 'dashboard', 'payment',
+         'invoice', 'cache', 'session', 'token', 'profile', 'settings', 'sync', 'notification', 'translation')
+
+
+class Command(BaseCommand):
+    help = ("Fill the database with a synthetic dataset of users, projects, issues and comments. With --skew, "
+            "the activity follows a power law as in real trackers: a few projects get most of the issues, a "
+            "few contributors write most of them, and a few issues get most of the comments.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--projects', type=int, default=10)
+        parser.add_argument('--contributors', type=int, default=10, help="Contributors per project.")
+        parser.add_argument('--issues', type=int, default=1000, help="Issues in total.")
+        parser.add_argument('--comments', type=int, default=3, help="Comments per issue, on average.")
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help="Exponent of the power law of the activity, 0 for a uniform dataset.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the random generator.")
+        parser.add_argument('--prefix', default='seed', help="Prefix of the usernames.")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.skew = options['skew']
+        self._weights = {}
+        batch_size = options['batch_size']
+        password = make_password('softdesk')
+
+        with transaction.atomic():
+            users = bulk_create_with_ids(User, [
+                User(username=f"{options['prefix']}-{i}", password=password) for i in range(options['users'])
+            ], batch_size=batch_size)
+            projects = bulk_create_with_ids(Project, [
+                Project(title=f'Project {i}', description='Synthetic project',
+                        type=self.random.choice(Project.TYPE_CHOICES)[0]) for i in range(options['projects'])
+            ], batch_size=batch_size)
+            members = self.create_contributors(users, projects, options['contributors'], batch_size)
+        self.stdout.write(f"{len(users)} users, {len(projects)} projects created.")
+
+        created = 0
+        while created < options['issues']:
+            size = min(batch_size, options['issues'] - created)
+            with transaction.atomic():
+                issues = bulk_create_with_ids(Issue, [self.make_issue(projects, members) for _ in range(size)])
+                Comment.objects.bulk_create(self.make_comments(issues, members, options['comments']),
+                                            batch_size=batch_size)
+            created += size
+            self.stdout.write(f"{created}/{options['issues']} issues created.")
+
+        rebuild_counters([project.id for project in projects])
+        rebuild_index([project.id for project in projects])
+        self.stdout.write(self.style.SUCCESS("Dataset created."))
+
+    def create_contributors(self, users, projects, per_project, batch_size):
+        members, contributors = {}, []
+        for project in projects:
+            members[project.id] = self.random.sample(users, min(per_project, len(users)))
+            contributors += [Contributor(user=user, project=project, role='author' if i == 0 else 'contributor')
+                             for i, user in enumerate(members[project.id])]
+        Contributor.objects.bulk_create(contributors, batch_size=batch_size)
+        return members
+
+    def weights(self, size):
+        """
+        Cumulative weights of a Zipf law over `size` items: the k-th weighs 1 / k ** skew.
+        """
+        return list(itertools.accumulate(1 / rank ** self.skew for rank in range(1, size + 1)))
+
+    def pick(self, items):
+        if not self.skew:
+            return self.random.choice(items)
+        if len(items) not in self._weights:
+            self._weights[len(items)] = self.weights(len(items))
+        return self.random.choices(items, cum_weights=self._weights[len(items)])[0]
+
+    def words(self, count):
+        return ' '.join(self.pick(WORDS) for _ in range(count))
+
+    def comment_count(self, mean):
+        """
+        `mean` without skew, else drawn from a Pareto law of tail index 1 + 1 / skew and mean `mean`.
+        """
+        if not self.skew:
+            return mean
+        alpha = 1 + 1 / self.skew
+        return min(round(mean * (alpha - 1) * (self.random.paretovariate(alpha) - 1)), 100 * mean)
+
+    def make_issue(self, projects, members):
+        project = self.pick(projects)
+        return Issue(project=project, author=self.pick(members[project.id]),
+                     assigned=self.pick(members[project.id]),
+                     title=f'{self.words(3)} {self.random.randrange(10 ** 6)}', description=self.words(12),
+                     priority=self.random.choice(Issue.PRIORITY_CHOICES)[0],
+                     tag=self.random.choice(Issue.TAG_CHOICES)[0],
+                     status=self.random.choice(Issue.STATUS_CHOICES)[0])
+
+    def make_comments(self, issues, members, per_issue):
+        for issue in issues:
+            for _ in range(self.comment_count(per_issue)):
+                yield Comment(issue=issue, author=self.pick(members[issue.project_id]), description=self.words(8))
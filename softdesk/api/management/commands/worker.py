@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import jobs
+
+
+class Command(BaseCommand):
+    help = "Run the background jobs queued by the API, see api.jobs. Start as many workers as needed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', action='store_true', help="Exit once no job is due.")
+        parser.add_argument('--max-jobs', type=int, help="Exit after running this many jobs.")
+
+    def handle(self, *args, **options):
+        done = 0
+        while options['max_jobs'] is None or done < options['max_jobs']:
+            # Long running: drop the connections the database may have closed, as after a request.
+            close_old_connections()
+            job = jobs.claim()
+            if job is None:
+                if options['burst']:
+                    break
+                jobs.get_queue().wait(jobs.get_settings()['LEASE'])
+                continue
+            jobs.run(job)
+            done += 1
+            style = self.style.SUCCESS if job.status == 'succeeded' else self.style.WARNING
+            self.stdout.write(style(f"Job {job.id} {job.task}: {job.status} (attempt {job.attempts})."))
+        self.stdout.write(f"{done} jobs run.")
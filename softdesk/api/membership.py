@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import OuterRef, Subquery
+from rest_framework.exceptions import NotFound
+
+from .models import Comment, Contributor, Issue, Project
+
+Membership = namedtuple('Membership', ['project', 'contributor', 'issue', 'comment'])
+
+
+def is_shared(backend):
+    """
+    Whether every process sees the writes to the cache `backend`: a locmem cache is private.
+    """
+    return not isinstance(backend, (LocMemCache, DummyCache))
+
+
+class MembershipCache:
+    """
+    (user_id, project_id) -> (contributor_id, role). Non members are not cached.
+
+    Entries live in a shared Django cache, stamped with the version of their project: saving or
+    deleting a Contributor bumps the version, which invalidates every entry of the project on
+    every process. In front of it, a bounded in-process LRU answers without any round trip
+    during `local_ttl` seconds. When the cache is private to the process (locmem), the other
+    processes would never see the bumps: the shared layer is skipped, and `local_ttl` bounds
+    how long a removed member keeps their access, as it does with a shared cache.
+    """
+
+    def __init__(self, alias='default', maxsize=10000, local_ttl=5, timeout=300):
+        self.alias = alias
+        self.maxsize = maxsize
+        self.local_ttl = local_ttl
+        self.timeout = timeout
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def version_key(project_id):
+        return f'membership:version:{project_id}'
+
+    @staticmethod
+    def entry_key(user_id, project_id):
+        return f'membership:{project_id}:{user_id}'
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return entry
+
+    def _set_local(self, key, value):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.local_ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.maxsize:
+                self._local.popitem(last=False)
+
+    def get(self, user_id, project_id):
+        key = (user_id, project_id)
+        entry = self._get_local(key)
+        if entry is not None:
+            return entry[1]
+
+        shared = is_shared(self.backend)
+        version_key, entry_key = self.version_key(project_id), self.entry_key(user_id, project_id)
+        cached = self.backend.get_many([version_key, entry_key]) if shared else {}
+        version = cached.get(version_key, 0)
+        if entry_key in cached and cached[entry_key][0] == version:
+            value = cached[entry_key][1]
+        else:
+            value = (Contributor.objects.filter(user_id=user_id, project_id=project_id,
+                                                project__deleted_time__isnull=True)
+                     .values_list('id', 'role').first())
+            if value is None:
+                return None
+            if shared:
+                self.backend.set(entry_key, (version, value), self.timeout)
+        self._set_local(key, value)
+        return value
+
+    def invalidate(self, project_id):
+        try:
+            self.backend.incr(self.version_key(project_id))
+        except ValueError:
+            self.backend.set(self.version_key(project_id), 1, None)
+        with self._lock:
+            for key in [key for key in self._local if key[1] == project_id]:
+                del self._local[key]
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+
+membership_cache = MembershipCache(**getattr(settings, 'MEMBERSHIP_CACHE', {}))
+
+
+def _member_subquery(user, project_ref, field):
+    members = Contributor.objects.filter(project_id=OuterRef(project_ref), user=user)
+    return Subquery(members.values(field)[:1])
+
+
+def _raise_not_found(user, project_id, issue_id, comment_id):
+    """
+    Slow path, only taken on a miss: find which level of the lookup failed.
+    """
+    if not Project.objects.filter(id=project_id).exists():
+        raise NotFound(f"Project with id '{project_id}' doesn't exist.")
+    if not Contributor.objects.filter(project_id=project_id, user=user).exists():
+        raise NotFound("You are not collaborate on this project.")
+    if issue_id is not None and not Issue.objects.filter(id=issue_id, project_id=project_id).exists():
+        raise NotFound(f"Issue with id '{issue_id}' doesn't exist.")
+    raise NotFound(f"Comment with id '{comment_id}' doesn't exist.")
+
+
+def resolve_contributor(user, project_id, check_project=False):
+    """
+    Return the Contributor of `user` in the project, read through the membership cache.
+    The instance only carries its id, user, project_id and role. In the other processes, the
+    cache outlives the deletion of a project by up to `local_ttl` seconds: `check_project`
+    makes sure the project still exists, with one query, for the views writing to it.
+    """
+    member = membership_cache.get(user.id, project_id)
+    if member is None or check_project and not Project.objects.filter(id=project_id).exists():
+        _raise_not_found(user, project_id, None, None)
+    return Contributor(id=member[0], user=user, project_id=project_id, role=member[1])
+
+
+def resolve_membership(user, project_id, issue_id=None, comment_id=None, queryset=None):
+    """
+    Load the project, the membership of `user` and, when asked, the issue and the comment
+    in one joined query. `queryset` is the base queryset of the deepest object requested.
+    Raise NotFound when any of them is missing.
+    """
+    if comment_id is not None:
+        model, project_path = Comment, 'issue__project'
+        lookups = {'id': comment_id, 'issue_id': issue_id, 'issue__project_id': project_id,
+                   'issue__deleted_time__isnull': True, 'issue__project__deleted_time__isnull': True}
+    elif issue_id is not None:
+        model, project_path = Issue, 'project'
+        lookups = {'id': issue_id, 'project_id': project_id, 'project__deleted_time__isnull': True}
+    else:
+        model, project_path = Project, ''
+        lookups = {'id': project_id}
+
+    if queryset is None:
+        queryset = model.objects.all()
+    project_ref = project_path + '_id' if project_path else 'pk'
+    queryset = queryset.filter(**lookups).annotate(member_id=_member_subquery(user, project_ref, 'id'),
+                                                   member_role=_member_subquery(user, project_ref, 'role'))
+    if project_path:
+        queryset = queryset.select_related(project_path)
+
+    try:
+        obj = queryset.get()
+    except model.DoesNotExist:
+        _raise_not_found(user, project_id, issue_id, comment_id)
+    if obj.member_id is None:
+        raise NotFound("You are not collaborate on this project.")
+
+    comment = obj if model is Comment else None
+    issue = comment.issue if comment is not None else obj if model is Issue else None
+    project = issue.project if issue is not None else obj
+    contributor = Contributor(id=obj.member_id, user=user, project=project, role=obj.member_role)
+    return Membership(project, contributor, issue, comment)
+
+
+def resolve_assigned(project_id, username):
+    """
+    Return the user called `username` if they contribute to the project, in one query.
+    """
+    try:
+        return Contributor.objects.select_related('user').get(project_id=project_id,
+                                                              user__username=username).user
+    except Contributor.DoesNotExist:
+        if not User.objects.filter(username=username).exists():
+            raise NotFound(f"User with username '{username}' doesn't exist. ")
+        raise NotFound("The assigned user doesn't contribute to the project.")
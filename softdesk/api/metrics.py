@@ -0,0 +1,249 @@
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .payloads import payload_cache
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_profile = contextvars.ContextVar('profile', default=None)
+
+
+def get_settings():
+    return {'SAMPLE_RATE': 1.0, 'SERVER_TIMING': False, 'TOKEN': None, **getattr(settings, 'METRICS', {})}
+
+
+class Profile:
+    """
+    What a sampled request spent in the database and in the serializers.
+    """
+
+    def __init__(self):
+        self.db_time = 0
+        self.serialize_time = 0
+        self.serializing = False
+        self.statements = Counter()
+
+    @property
+    def queries(self):
+        return sum(self.statements.values())
+
+    @property
+    def duplicates(self):
+        """
+        Queries repeating the SQL of an earlier one with other parameters: the N+1 pattern.
+        """
+        return self.queries - len(self.statements)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Installed on every connection, a no-op out of the sampled requests.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_query(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.db_time += time.perf_counter() - start
+        profile.statements[sql] += 1
+
+
+@contextmanager
+def serializing():
+    """
+    Count the time of the outermost serializer of a sampled request, the nested ones included.
+    """
+    profile = _profile.get()
+    if profile is None or profile.serializing:
+        yield
+        return
+    profile.serializing = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.serialize_time += time.perf_counter() - start
+        profile.serializing = False
+
+
+class Registry:
+    """
+    The metrics of the process, per route: requests and their duration for every request, and
+    database time, queries, duplicate queries and serialization time for the sampled ones.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()
+            self.durations = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))
+            self.duration_sums = Counter()
+            self.sampled = Counter()
+            self.db_time = Counter()
+            self.queries = Counter()
+            self.duplicates = Counter()
+            self.serialize_time = Counter()
+            self.reads = Counter()
+
+    def observe(self, route, method, status, duration, profile=None):
+        with self._lock:
+            self.requests[(route, method, str(status))] += 1
+            buckets = self.durations[route]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            self.duration_sums[route] += duration
+            if profile is not None:
+                self.sampled[route] += 1
+                self.db_time[route] += profile.db_time
+                self.queries[route] += profile.queries
+                self.duplicates[route] += profile.duplicates
+                self.serialize_time[route] += profile.serialize_time
+
+    def observe_routing(self, database, reason):
+        with self._lock:
+            self.reads[(database, reason)] += 1
+
+    def render(self):
+        """
+        The Prometheus text exposition format.
+        """
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def sample(name, labels, value):
+            labels = ','.join(f'{key}="{escape(label)}"' for key, label in labels)
+            lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+
+        with self._lock:
+            family('softdesk_requests_total', 'counter', 'Requests served.')
+            for (route, method, status), count in sorted(self.requests.items()):
+                sample('softdesk_requests_total', [('route', route), ('method', method), ('status', status)], count)
+
+            name = 'softdesk_request_duration_seconds'
+            family(name, 'histogram', 'Duration of the requests, until the response is returned.')
+            for route, buckets in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS + ('+Inf',), buckets):
+                    cumulative += count
+                    sample(f'{name}_bucket', [('route', route), ('le', bound)], cumulative)
+                sample(f'{name}_sum', [('route', route)], self.duration_sums[route])
+                sample(f'{name}_count', [('route', route)], cumulative)
+
+            for name, counter, help_text in [
+                ('softdesk_sampled_requests_total', self.sampled, 'Requests profiled.'),
+                ('softdesk_db_seconds_total', self.db_time, 'Time in SQL queries of the profiled requests.'),
+                ('softdesk_queries_total', self.queries, 'SQL queries of the profiled requests.'),
+                ('softdesk_duplicate_queries_total', self.duplicates,
+                 'Queries of the profiled requests repeating the SQL of an earlier one (N+1).'),
+                ('softdesk_serialize_seconds_total', self.serialize_time,
+                 'Time in the serializers of the profiled requests.'),
+            ]:
+                family(name, 'counter', help_text)
+                for route, value in sorted(counter.items()):
+                    sample(name, [('route', route)], value)
+
+            family('softdesk_db_reads_total', 'counter',
+                   'Reads routed by api.routers, per database and reason: replica, pinned or atomic.')
+            for (database, reason), count in sorted(self.reads.items()):
+                sample('softdesk_db_reads_total', [('database', database), ('reason', reason)], count)
+
+        stats = payload_cache.stats()
+        for key in ('hits', 'coalesced', 'misses'):
+            family(f'softdesk_payload_cache_{key}_total', 'counter', f'Payload cache {key}.')
+            sample(f'softdesk_payload_cache_{key}_total', [], stats.get(key, 0))
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else '<unmatched>'
+
+
+class MetricsMiddleware:
+    """
+    Record the duration of every request per route, and profile a METRICS['SAMPLE_RATE'] share
+    of them: SQL queries and their time, duplicate queries, serialization time. The sampled
+    responses carry a Server-Timing header when METRICS['SERVER_TIMING'] is set. Works under
+    WSGI and ASGI; the metrics are those of the process.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        profile, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self.finish(request, response, profile, start)
+
+    async def __acall__(self, request):
+        profile, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        return self.finish(request, response, profile, start)
+
+    def start(self):
+        options = get_settings()
+        profile = Profile() if random.random() < options['SAMPLE_RATE'] else None
+        return profile, _profile.set(profile), time.perf_counter()
+
+    def finish(self, request, response, profile, start):
+        duration = time.perf_counter() - start
+        registry.observe(route_of(request), request.method, response.status_code, duration, profile)
+        if profile is not None and get_settings()['SERVER_TIMING']:
+            response['Server-Timing'] = (
+                f'db;dur={profile.db_time * 1000:.1f};desc="{profile.queries} queries, '
+                f'{profile.duplicates} duplicates", serialize;dur={profile.serialize_time * 1000:.1f}, '
+                f'total;dur={duration * 1000:.1f}'
+            )
+        return response
+
+
+def metrics_view(request):
+    token = get_settings()['TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
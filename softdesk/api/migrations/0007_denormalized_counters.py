@@ -0,0 +1,65 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count(model, outer_field, **filters):
+    counts = (model.objects.filter(**{outer_field: OuterRef('pk')}, **filters).order_by()
+              .values(outer_field).annotate(count=Count('pk')).values('count'))
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    Project = apps.get_model('api', 'Project')
+    Contributor = apps.get_model('api', 'Contributor')
+    Issue = apps.get_model('api', 'Issue')
+    Comment = apps.get_model('api', 'Comment')
+    Project.objects.update(issue_count=count(Issue, 'project'),
+                           todo_issue_count=count(Issue, 'project', status='to do'),
+                           in_progress_issue_count=count(Issue, 'project', status='in progress'),
+                           finished_issue_count=count(Issue, 'project', status='finished'),
+                           contributor_count=count(Contributor, 'project'))
+    Issue.objects.update(comment_count=count(Comment, 'issue'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='comment_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='contributor_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='finished_issue_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='in_progress_issue_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='issue_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='todo_issue_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.4 on 2026-10-18 11:55
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_contributors(apps, schema_editor):
+    Contributor = apps.get_model('api', 'Contributor')
+    Project = apps.get_model('api', 'Project')
+    duplicates = (Contributor.objects.values('user', 'project').order_by()
+                  .annotate(first_id=Min('id'), count=Count('id')).filter(count__gt=1))
+    for duplicate in duplicates:
+        Contributor.objects.filter(user=duplicate['user'], project=duplicate['project']).exclude(
+            id=duplicate['first_id']).delete()
+        Project.objects.filter(id=duplicate['project']).update(
+            contributor_count=Contributor.objects.filter(project=duplicate['project']).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['issue', 'id'], name='comment_issue_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contributor',
+            index=models.Index(fields=['project', 'role'], name='contributor_project_role_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['project', 'id'], name='issue_project_id_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_contributors, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='contributor',
+            constraint=models.UniqueConstraint(fields=('user', 'project'), name='unique_contributor'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+from itertools import islice
+
+from django.db import migrations
+
+# The index as this migration creates it, copied from api.search: later changes of the module
+# must not change what it does.
+TABLE = 'api_search_index'
+BATCH_SIZE = 1000
+
+CREATE_SQL = {
+    'sqlite': [
+        f"CREATE VIRTUAL TABLE {TABLE} USING fts5(title, body, issue_id UNINDEXED, project_id UNINDEXED, "
+        f"tokenize='porter unicode61')",
+        f"INSERT INTO {TABLE}({TABLE}, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    ],
+    'postgresql': [
+        f"CREATE TABLE {TABLE} (id bigint PRIMARY KEY, document tsvector NOT NULL, issue_id bigint NOT NULL, "
+        f"project_id bigint NOT NULL)",
+        f"CREATE INDEX {TABLE}_document ON {TABLE} USING GIN (document)",
+    ],
+}
+UPSERT_SQL = {
+    'sqlite': (f"INSERT OR REPLACE INTO {TABLE} (rowid, title, body, issue_id, project_id) "
+               f"VALUES (%s, %s, %s, %s, %s)"),
+    'postgresql': (f"INSERT INTO {TABLE} (id, document, issue_id, project_id) VALUES (%s, "
+                   f"setweight(to_tsvector('english', %s), 'A') || setweight(to_tsvector('english', %s), 'B'), "
+                   f"%s, %s) ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document"),
+}
+
+
+def _insert_by_batches(cursor, sql, rows):
+    rows = iter(rows)
+    batch = list(islice(rows, BATCH_SIZE))
+    while batch:
+        cursor.executemany(sql, batch)
+        batch = list(islice(rows, BATCH_SIZE))
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_SQL:
+        return
+    for sql in CREATE_SQL[vendor]:
+        schema_editor.execute(sql)
+    Issue = apps.get_model('api', 'Issue')
+    Comment = apps.get_model('api', 'Comment')
+    # Issues are stored under their negated id, comments under their id.
+    issues = Issue.objects.values_list('id', 'title', 'description', 'project_id').iterator(BATCH_SIZE)
+    comments = (Comment.objects.values_list('id', 'description', 'issue_id', 'issue__project_id')
+                .iterator(BATCH_SIZE))
+    with schema_editor.connection.cursor() as cursor:
+        _insert_by_batches(cursor, UPSERT_SQL[vendor], (
+            (-pk, title, description, pk, project_id) for pk, title, description, project_id in issues))
+        _insert_by_batches(cursor, UPSERT_SQL[vendor], (
+            (pk, '', description, issue_id, project_id) for pk, description, issue_id, project_id in comments))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.4 on 2026-10-18 12:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='deleted_time',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='deleted_time',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.4 on 2026-10-18 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('revoked_at', models.FloatField()),
+                ('expires', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
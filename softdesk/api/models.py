@@ -1,5 +1,16 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+class LiveManager(models.Manager):
+    """
+    Hide the rows being deleted, see api.deletion. `all_objects` sees them.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_time__isnull=True)
 
 
 class Project(models.Model):
@@ -12,6 +23,42 @@ class Project(models.Model):
     title = models.CharField(max_length=200)
     description = models.CharField(max_length=2000)
     type = models.CharField(max_length=9, choices=TYPE_CHOICES, default='back-end')
+    # Denormalized counters, maintained by api.counters
+    issue_count = models.IntegerField(default=0)
+    todo_issue_count = models.IntegerField(default=0)
+    in_progress_issue_count = models.IntegerField(default=0)
+    finished_issue_count = models.IntegerField(default=0)
+    contributor_count = models.IntegerField(default=0)
+    # Bumped by every change of the project or of its issues, comments and contributors, see api.versions
+    version = models.IntegerField(default=1)
+    updated_time = models.DateTimeField(auto_now=True)
+    # Changes up to this sequence number were pruned from the change feed, see api.activity
+    activity_horizon = models.BigIntegerField(default=0)
+    # Set when the project is deleted, until a background job purges it, see api.deletion
+    deleted_time = models.DateTimeField(null=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    @property
+    def open_issue_count(self):
+        return self.todo_issue_count + self.in_progress_issue_count
+
+
+class ClaimsUser(User):
+    """
+    User built from the claims of a JWT, see api.authentication. Reading any other field loads
+    all of them in one query.
+    """
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred.issuperset(fields):
+            fields = deferred
+        super().refresh_from_db(using, fields)
 
 
 class Contributor(models.Model):
@@ -23,6 +70,15 @@ class Contributor(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='contributors')
     role = models.CharField(max_length=11, choices=ROLE_CHOICES, default='author')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'id'], name='contributor_project_id_idx'),
+            models.Index(fields=['project', 'role'], name='contributor_project_role_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'project'], name='unique_contributor'),
+        ]
+
 
 class Issue(models.Model):
     PRIORITY_CHOICES = (
@@ -49,6 +105,18 @@ class Issue(models.Model):
     tag = models.CharField(max_length=11, choices=TAG_CHOICES, default='task')
     status = models.CharField(max_length=11, choices=STATUS_CHOICES, default='to do')
     created_time = models.DateTimeField(auto_now_add=True)
+    updated_time = models.DateTimeField(auto_now=True)
+    comment_count = models.IntegerField(default=0)
+    deleted_time = models.DateTimeField(null=True)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'created_time', 'id'], name='issue_project_created_idx'),
+            models.Index(fields=['project', 'id'], name='issue_project_id_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -56,3 +124,78 @@ class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='comments', null=True)
     issue = models.ForeignKey(Issue, on_delete=models.CASCADE, related_name='comments')
     created_time = models.DateTimeField(auto_now_add=True)
+    updated_time = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['issue', 'created_time', 'id'], name='comment_issue_created_idx'),
+            models.Index(fields=['issue', 'id'], name='comment_issue_id_idx'),
+        ]
+
+
+class ActivityLog(models.Model):
+    """
+    Append-only feed of the changes of the issues, comments and contributors of a project.
+    The id is the sequence number clients sync from.
+    """
+    ACTION_CHOICES = (
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('deleted', 'Deleted'),
+    )
+    # No foreign key constraint: the rows of a project being deleted are written during its cascade.
+    project = models.ForeignKey(Project, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    model = models.CharField(max_length=11)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=7, choices=ACTION_CHOICES)
+    data = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project', 'id'], name='activity_project_id_idx'),
+            models.Index(fields=['project', 'model', 'object_id'], name='activity_object_idx'),
+        ]
+
+
+class RevokedToken(models.Model):
+    """
+    The JWT deny-list of api.tokens when the default cache is private to the process: a token
+    id, or a user whose tokens issued before `revoked_at` are refused.
+    """
+    key = models.CharField(max_length=255, unique=True)
+    # UNIX time, compared with the iat claim.
+    revoked_at = models.FloatField()
+    expires = models.DateTimeField(db_index=True)
+
+
+class Job(models.Model):
+    """
+    Background job, see api.jobs: the call of `task` with `kwargs`, run by the worker command.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    )
+    task = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    # Idempotency key: enqueuing twice under the same key queues a single job.
+    key = models.CharField(max_length=200, null=True, unique=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    status = models.CharField(max_length=9, choices=STATUS_CHOICES, default='queued')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    # End of the lease of the worker running the job, after which another worker may take it.
+    locked_until = models.DateTimeField(null=True)
+    result = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    error = models.TextField(blank=True)
+    created_time = models.DateTimeField(auto_now_add=True)
+    updated_time = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+MISSING = object()
+
+
+class PayloadCache:
+    """
+    Serialized payloads shared by every contributor of a project.
+
+    Keys embed the version of the project (see api.versions), so any change in the project makes
+    its entries unreachable; the stale ones leave through the timeout or the size bound of the
+    backend (MAX_ENTRIES of locmem, maxmemory of Redis). A missing entry is computed once: the
+    other threads of the process wait on a striped lock, the other processes on a lock entry
+    taken with `add`, then read the result.
+    """
+
+    def __init__(self, alias='default', timeout=300, lock_timeout=10, poll_interval=0.05, stripes=64):
+        self.alias = alias
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def _wait(self, key):
+        """
+        Another process computes the entry: poll it until its lock expires.
+        """
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            value = self.backend.get(key, MISSING)
+            if value is not MISSING:
+                return value
+        return MISSING
+
+    def get_or_compute(self, key, compute):
+        key = f'payload:{key}'
+        value = self.backend.get(key, MISSING)
+        if value is not MISSING:
+            self._count('hits')
+            return value
+
+        with self._locks[hash(key) % len(self._locks)]:
+            value = self.backend.get(key, MISSING)
+            if value is not MISSING:
+                self._count('coalesced')
+                return value
+            lock_key = f'{key}:lock'
+            locked = self.backend.add(lock_key, 1, self.lock_timeout)
+            if not locked:
+                value = self._wait(key)
+                if value is not MISSING:
+                    self._count('coalesced')
+                    return value
+            self._count('misses')
+            try:
+                value = compute()
+                self.backend.set(key, value, self.timeout)
+            finally:
+                if locked:
+                    self.backend.delete(lock_key)
+            return value
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = sum(stats.values())
+        stats['hit_ratio'] = (stats.get('hits', 0) + stats.get('coalesced', 0)) / lookups if lookups else 0
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.clear()
+
+
+payload_cache = PayloadCache(**getattr(settings, 'PAYLOAD_CACHE', {}))
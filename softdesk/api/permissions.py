@@ -5,7 +5,7 @@ class IsObjectOwnerOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return True if obj.author == request.user else False
+        return True if obj.author_id == request.user.id else False
 
 
 class IsProjectOwnerOrContributorReadOnly(permissions.BasePermission):
@@ -0,0 +1,116 @@
+from django.db import connections, router
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def _concrete_fields(model):
+    return {field.name: field for field in model._meta.concrete_fields}
+
+
+def _collect_relations(serializer, prefix, select, prefetch, only):
+    """
+    Walk the fields `serializer` renders. `only` collects the columns they read; it is set to
+    None as soon as a field reads something that isn't a column (a property for instance).
+    """
+    model = serializer.Meta.model
+    columns = _concrete_fields(model)
+    if only is not None:
+        only.update(prefix + name for name, field in columns.items() if field.is_relation or field.primary_key)
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            child = field.child
+            queryset = optimize_queryset(child.Meta.model.objects.all(), child)
+            prefetch.append(Prefetch(prefix + field.source, queryset=queryset))
+        elif isinstance(field, serializers.BaseSerializer):
+            select.add(prefix + field.source)
+            only = _collect_relations(field, prefix + field.source + '__', select, prefetch, only)
+        elif len(field.source_attrs) > 1:
+            select.add(prefix + '__'.join(field.source_attrs[:-1]))
+            if only is not None:
+                only.add(prefix + '__'.join(field.source_attrs))
+        elif only is not None:
+            if field.source_attrs[0] in columns:
+                only.add(prefix + field.source_attrs[0])
+            elif field.source_attrs[0] not in {column.attname for column in columns.values()}:
+                only = None
+    return only
+
+
+def optimize_queryset(queryset, serializer, columns=()):
+    """
+    Add the select_related/prefetch_related needed to render `serializer`
+    (a serializer class or instance) without any per-row query, and load
+    only the columns it reads plus `columns`.
+    """
+    if isinstance(serializer, type):
+        serializer = serializer()
+    select, prefetch = set(), []
+    only = _collect_relations(serializer, '', select, prefetch, set())
+    if select:
+        queryset = queryset.select_related(*sorted(select))
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    if only:
+        queryset = queryset.only(*sorted(only.union(columns)))
+    return queryset
+
+
+def iterate_in_chunks(queryset, chunk_size):
+    """
+    Yield the rows of `queryset` by keyset chunks on the primary key. Unlike `.iterator()`,
+    the prefetches of `queryset` are applied to every chunk.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_pk = chunk[-1].pk
+
+
+def bulk_create_with_ids(model, objs, batch_size=None):
+    """
+    `bulk_create()` that also sets the primary keys on backends which can't return them
+    (SQLite on Django 3.2). Call it inside a transaction: the writer lock it holds makes the
+    new rows the last ones of the table.
+    """
+    objs = model.objects.bulk_create(objs, batch_size=batch_size)
+    if objs and objs[0].pk is None:
+        pks = model._base_manager.order_by('-pk').values_list('pk', flat=True)[:len(objs)]
+        for obj, pk in zip(objs, reversed(list(pks))):
+            obj.pk = pk
+    return objs
+
+
+def insert_rows(model, fields, rows):
+    """
+    Insert `rows`, tuples of database ready values of `fields`, with multi-row INSERT statements
+    as bulk_create() writes them, without building nor compiling a model instance per row: the
+    path of bulk imports. The auto_now fields keep their values and no signal is sent. Returns the
+    primary keys of the rows, in order. Call it inside a transaction, see bulk_create_with_ids().
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(model._meta.get_field(field).column) for field in fields)
+    row_sql = f"({', '.join(['%s'] * len(fields))})"
+    returning = connection.features.can_return_rows_from_bulk_insert
+    batch_size = max(connection.features.max_query_params // len(fields), 1)
+    pks = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            sql = f"INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES {', '.join([row_sql] * len(batch))}"
+            params = [value for row in batch for value in row]
+            if returning:
+                cursor.execute(f'{sql} RETURNING {quote(model._meta.pk.column)}', params)
+                pks.extend(pk for pk, in cursor.fetchall())
+            else:
+                # The writer lock of the transaction makes the ids of the batch consecutive.
+                cursor.execute(sql, params)
+                pks.extend(range(cursor.lastrowid - len(batch) + 1, cursor.lastrowid + 1))
+    return pks
@@ -0,0 +1,34 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=JSONEncoder, ensure_ascii=False).encode() + b'\n'
+
+
+def iter_json_array(rows):
+    yield b'['
+    separator = b''
+    for row in rows:
+        yield separator + json.dumps(row, cls=JSONEncoder, ensure_ascii=False).encode()
+        separator = b','
+    yield b']'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    One JSON document per line. List views stream their rows with it; any other payload
+    (errors for instance) is rendered as a single line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        return b''.join(iter_ndjson(rows))
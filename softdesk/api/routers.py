@@ -0,0 +1,184 @@
+import asyncio
+import contextvars
+import itertools
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+
+from . import metrics
+
+PIN_COOKIE = 'primary_pin'
+WRITES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+_state = contextvars.ContextVar('routing', default=None)
+
+
+class RoutingState:
+    """
+    The replica serving the reads of a request, unless they are pinned to the primary.
+    """
+
+    def __init__(self, replica, pinned):
+        self.replica = replica
+        self.pinned = pinned
+        self.wrote = False
+        self.user_id = None
+
+
+class ReplicaPool:
+    """
+    Pick the replica of each request, in turn (REPLICA_SELECTION 'round-robin') or the one
+    serving the fewest requests of the process ('least-loaded').
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cycle = None
+        self.load = Counter()
+
+    @property
+    def replicas(self):
+        return getattr(settings, 'DATABASE_REPLICAS', [])
+
+    def acquire(self):
+        with self._lock:
+            if getattr(settings, 'REPLICA_SELECTION', 'round-robin') == 'least-loaded':
+                replica = min(self.replicas, key=self.load.__getitem__)
+            else:
+                if self._cycle is None:
+                    self._cycle = itertools.cycle(self.replicas)
+                replica = next(self._cycle)
+            self.load[replica] += 1
+        return replica
+
+    def release(self, replica):
+        with self._lock:
+            self.load[replica] -= 1
+
+
+replica_pool = ReplicaPool()
+
+
+def _pin_key(user_id):
+    return f'replica:pin:{user_id}'
+
+
+@receiver(connection_created)
+def watch_writes(sender, connection, **kwargs):
+    if connection.alias == DEFAULT_DB_ALIAS and record_write not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_write)
+
+
+def record_write(execute, sql, params, many, context):
+    state = _state.get()
+    if state is not None and not state.wrote and sql.lstrip()[:7].upper().startswith(WRITES):
+        # Django also asks db_for_write when it only builds instances: the statements tell.
+        state.wrote = state.pinned = True
+    return execute(sql, params, many, context)
+
+
+def identify(user_id):
+    """
+    Pin the reads of the request to the primary if the user wrote in the last seconds.
+    """
+    state = _state.get()
+    if state is None:
+        return
+    state.user_id = user_id
+    if not state.pinned and cache.get(_pin_key(user_id)):
+        state.pinned = True
+
+
+class ReplicaRouter:
+    """
+    Send the reads of the api models and of the users to the replica of the request, everything
+    else to the primary. A request reads from the primary after it wrote, inside transactions,
+    and for REPLICA_PIN_SECONDS after a write of the same user or client (read-your-writes).
+    Out of the requests, management commands for instance, everything goes to the primary.
+    """
+
+    @staticmethod
+    def routed(model):
+        return model._meta.app_label == 'api' or model._meta.label_lower == 'auth.user'
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not self.routed(model):
+            return None
+        if state.pinned:
+            database, reason = DEFAULT_DB_ALIAS, 'pinned'
+        elif connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            database, reason = DEFAULT_DB_ALIAS, 'atomic'
+        else:
+            database, reason = state.replica, 'replica'
+        metrics.registry.observe_routing(database, reason)
+        return database
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_pool.replicas}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replicas get the schema from the primary.
+        return False if db in replica_pool.replicas else None
+
+
+class ReadYourWritesMiddleware:
+    """
+    Give each request a replica, pinned to the primary for the writes (unsafe methods) and
+    when the client holds the pin cookie. After a write, set the cookie and a marker of the
+    user in the cache, both for REPLICA_PIN_SECONDS.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        state, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.finish(state, token)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        state, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.finish(state, token)
+        return self.pin(state, response)
+
+    def start(self, request):
+        pinned = request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+        state = RoutingState(replica_pool.acquire(), pinned)
+        return state, _state.set(state)
+
+    def finish(self, state, token):
+        _state.reset(token)
+        replica_pool.release(state.replica)
+
+    def pin(self, state, response):
+        if state.wrote:
+            seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+            response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+            if state.user_id is not None:
+                cache.set(_pin_key(state.user_id), True, seconds)
+        return response
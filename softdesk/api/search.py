@@ -0,0 +1,173 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Comment, Issue
+
+TABLE = 'api_search_index'
+FILTERS = ('priority', 'tag', 'status')
+
+
+class SQLiteBackend:
+    """
+    FTS5 table, the issue title weighs ten times the descriptions in the bm25 rank.
+    """
+    create_sql = [
+        f"CREATE VIRTUAL TABLE {TABLE} USING fts5(title, body, issue_id UNINDEXED, project_id UNINDEXED, "
+        f"tokenize='porter unicode61')",
+        f"INSERT INTO {TABLE}({TABLE}, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    ]
+    drop_sql = [f"DROP TABLE IF EXISTS {TABLE}"]
+    upsert_sql = (f"INSERT OR REPLACE INTO {TABLE} (rowid, title, body, issue_id, project_id) "
+                  f"VALUES (%s, %s, %s, %s, %s)")
+    delete_sql = f"DELETE FROM {TABLE} WHERE rowid = %s"
+    match_sql = f"s.{TABLE} MATCH %s"
+    score_sql = "MIN(s.rank)"
+    order = 'ASC'
+
+    @staticmethod
+    def query(text):
+        return ' '.join(f'"{word}"' for word in re.findall(r'\w+', text))
+
+
+class PostgresBackend:
+    """
+    tsvector column with a GIN index, the issue title weighs more than the descriptions in ts_rank.
+    """
+    create_sql = [
+        f"CREATE TABLE {TABLE} (id bigint PRIMARY KEY, document tsvector NOT NULL, issue_id bigint NOT NULL, "
+        f"project_id bigint NOT NULL)",
+        f"CREATE INDEX {TABLE}_document ON {TABLE} USING GIN (document)",
+    ]
+    drop_sql = [f"DROP TABLE IF EXISTS {TABLE}"]
+    upsert_sql = (f"INSERT INTO {TABLE} (id, document, issue_id, project_id) VALUES (%s, "
+                  f"setweight(to_tsvector('english', %s), 'A') || setweight(to_tsvector('english', %s), 'B'), "
+                  f"%s, %s) ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document")
+    delete_sql = f"DELETE FROM {TABLE} WHERE id = %s"
+    match_sql = "s.document @@ plainto_tsquery('english', %s)"
+    score_sql = "MAX(ts_rank(s.document, plainto_tsquery('english', %s)))"
+    order = 'DESC'
+
+    @staticmethod
+    def query(text):
+        return text.strip()
+
+
+BACKENDS = {'sqlite': SQLiteBackend, 'postgresql': PostgresBackend}
+
+
+def get_backend():
+    return BACKENDS.get(connection.vendor)
+
+
+def _key(obj):
+    """
+    Issues and comments share the index: issues are stored under their negated id.
+    """
+    return -obj.id if isinstance(obj, Issue) else obj.id
+
+
+def _document(obj, project_id=None):
+    if isinstance(obj, Issue):
+        return (_key(obj), obj.title, obj.description, obj.id, obj.project_id)
+    return (_key(obj), '', obj.description, obj.issue_id, project_id or obj.issue.project_id)
+
+
+def index_objects(objs, project_id=None):
+    """
+    Add or replace issues and comments in the index. Pass `project_id` to spare a lookup
+    of the issue of each comment.
+    """
+    backend = get_backend()
+    if backend is not None and objs:
+        with connection.cursor() as cursor:
+            cursor.executemany(backend.upsert_sql, [_document(obj, project_id) for obj in objs])
+
+
+def unindex_objects(objs):
+    backend = get_backend()
+    if backend is not None and objs:
+        with connection.cursor() as cursor:
+            cursor.executemany(backend.delete_sql, [(_key(obj),) for obj in objs])
+
+
+def unindex_ids(issue_ids=(), comment_ids=()):
+    """
+    `unindex_objects` for rows already deleted.
+    """
+    keys = [(-pk,) for pk in issue_ids] + [(pk,) for pk in comment_ids]
+    backend = get_backend()
+    if backend is not None and keys:
+        with connection.cursor() as cursor:
+            cursor.executemany(backend.delete_sql, keys)
+
+
+def _chunks(queryset, fields, batch_size):
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', *fields)[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def rebuild_index(project_ids=None, batch_size=1000):
+    """
+    Rebuild the index of the given projects, or of every project, by keyset chunks.
+    """
+    backend = get_backend()
+    if backend is None:
+        return
+    issues, comments = Issue.objects.all(), Comment.objects.all()
+    with connection.cursor() as cursor:
+        if project_ids is None:
+            cursor.execute(f"DELETE FROM {TABLE}")
+        else:
+            issues = issues.filter(project_id__in=project_ids)
+            comments = comments.filter(issue__project_id__in=project_ids)
+            for project_id in project_ids:
+                cursor.execute(f"DELETE FROM {TABLE} WHERE project_id = %s", [project_id])
+        for rows in _chunks(issues, ['title', 'description', 'project_id'], batch_size):
+            cursor.executemany(backend.upsert_sql, [(-pk, title, description, pk, project_id)
+                                                    for pk, title, description, project_id in rows])
+        for rows in _chunks(comments, ['description', 'issue_id', 'issue__project_id'], batch_size):
+            cursor.executemany(backend.upsert_sql, [(pk, '', description, issue_id, project_id)
+                                                    for pk, description, issue_id, project_id in rows])
+
+
+def search_issues(project_id, text, filters=None, limit=50, offset=0):
+    """
+    Return [(issue_id, score)] of the issues of the project matching `text` in their title, their
+    description or one of their comments, best first. `filters` are equality filters on the
+    issue: priority, tag, status or assigned_id.
+    """
+    filters = {field: value for field, value in (filters or {}).items() if field in FILTERS + ('assigned_id',)}
+    backend = get_backend()
+    if backend is None:
+        words = re.findall(r'\w+', text)
+        if not words:
+            return []
+        matches = Q()
+        for word in words:
+            matches &= (Q(title__icontains=word) | Q(description__icontains=word)
+                        | Q(comments__description__icontains=word))
+        issues = Issue.objects.filter(matches, project_id=project_id, **filters).distinct().order_by('id')
+        return [(pk, 0) for pk in issues.values_list('id', flat=True)[offset:offset + limit]]
+
+    query = backend.query(text)
+    if not query:
+        return []
+    # The deleted issues stay in the index until they are purged.
+    where, params = [backend.match_sql, 's.project_id = %s', 'i.deleted_time IS NULL'], [query, project_id]
+    for field, value in filters.items():
+        where.append(f'i.{field} = %s')
+        params.append(value)
+    score_params = [query] if '%s' in backend.score_sql else []
+    sql = (f"SELECT s.issue_id, {backend.score_sql} AS score FROM {TABLE} s "
+           f"JOIN {Issue._meta.db_table} i ON i.id = s.issue_id WHERE {' AND '.join(where)} "
+           f"GROUP BY s.issue_id ORDER BY score {backend.order}, s.issue_id LIMIT %s OFFSET %s")
+    with connection.cursor() as cursor:
+        cursor.execute(sql, score_params + params + [limit, offset])
+        return cursor.fetchall()
@@ -1,6 +1,59 @@
+import time
+
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
-from .models import Comment, Issue, Project, Contributor
+from . import metrics, tokens
+from .models import ActivityLog, Comment, Issue, Job, Project, Contributor
+
+
+def parse_field_paths(value):
+    """
+    "id,issues.title,issues.comments" -> {'id': {}, 'issues': {'title': {}, 'comments': {}}}
+    """
+    tree = {}
+    for path in filter(None, (value or '').split(',')):
+        node = tree
+        for name in path.strip().split('.'):
+            node = node.setdefault(name, {})
+    return tree
+
+
+class DynamicFieldsMixin:
+    """
+    Sparse fieldsets. `fields` keeps only the listed fields and `expand` adds the nested fields
+    named in Meta.expandable; both take dotted paths for the nested serializers. When `compact`
+    is true the expandable fields are left out unless they are expanded or listed in `fields`.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, compact=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.only_fields = parse_field_paths(fields) if isinstance(fields, str) else fields or {}
+        self.expand = parse_field_paths(expand) if isinstance(expand, str) else expand or {}
+        self.compact = compact
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expandable = getattr(self.Meta, 'expandable', [])
+        for name in list(fields):
+            if self.only_fields and name not in self.only_fields:
+                del fields[name]
+            elif self.compact and name in expandable and name not in self.expand and name not in self.only_fields:
+                del fields[name]
+        for name, field in fields.items():
+            child = getattr(field, 'child', field)
+            if isinstance(child, DynamicFieldsMixin):
+                child.only_fields = self.only_fields.get(name, {})
+                child.expand = self.expand.get(name, {})
+                child.compact = self.compact
+        return fields
+
+    def to_representation(self, instance):
+        with metrics.serializing():
+            return super().to_representation(instance)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -26,7 +79,7 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
-class ContributorSerializer(serializers.ModelSerializer):
+class ContributorSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer(many=False, read_only=True)
 
     class Meta:
@@ -35,7 +88,7 @@ class ContributorSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        user_representation = representation.pop('user')
+        user_representation = representation.pop('user', {})
         for key in user_representation:
             representation[key] = user_representation[key]
         return representation
@@ -59,7 +112,7 @@ class ContributorSerializer(serializers.ModelSerializer):
         return instance
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
 
     class Meta:
@@ -67,7 +120,7 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ['id', 'author', 'description', 'created_time']
 
 
-class IssueSerializer(serializers.ModelSerializer):
+class IssueSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     comments = CommentSerializer(many=True, read_only=True)
     author = UserSerializer(required=False)
     assigned = UserSerializer(required=False)
@@ -75,15 +128,99 @@ class IssueSerializer(serializers.ModelSerializer):
     class Meta:
         model = Issue
         fields = ['id', 'author', 'assigned', 'title', 'description', 'priority', 'tag', 'status',
-                  'created_time', 'comments']
+                  'created_time', 'comment_count', 'comments']
+        read_only_fields = ['comment_count']
+        expandable = ['comments']
         extra_kwargs = {'author': {'default': ''},
                         'assigned': {'default': ''}}
 
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProjectSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     contributors = ContributorSerializer(many=True, read_only=True)
     issues = IssueSerializer(many=True, read_only=True)
 
     class Meta:
         model = Project
-        fields = ['id', 'title', 'description', 'type', 'contributors', 'issues']
+        fields = ['id', 'title', 'description', 'type', 'issue_count', 'contributor_count', 'contributors', 'issues']
+        read_only_fields = ['issue_count', 'contributor_count']
+        expandable = ['contributors', 'issues']
+
+
+class ProjectSummarySerializer(serializers.ModelSerializer):
+    open_issue_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Project
+        fields = ['id', 'title', 'type', 'issue_count', 'open_issue_count', 'todo_issue_count',
+                  'in_progress_issue_count', 'finished_issue_count', 'contributor_count']
+        read_only_fields = fields
+
+
+class IssueSearchSerializer(serializers.Serializer):
+    q = serializers.CharField()
+    priority = serializers.ChoiceField(Issue.PRIORITY_CHOICES, required=False)
+    tag = serializers.ChoiceField(Issue.TAG_CHOICES, required=False)
+    status = serializers.ChoiceField(Issue.STATUS_CHOICES, required=False)
+    assigned = serializers.CharField(required=False)
+    offset = serializers.IntegerField(min_value=0, default=0)
+    page_size = serializers.IntegerField(min_value=1, max_value=500, default=api_settings.PAGE_SIZE)
+
+
+class IssueBulkSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+    assigned = serializers.CharField(source='assigned.username', required=False, allow_blank=True)
+
+    class Meta:
+        model = Issue
+        fields = ['id', 'assigned', 'title', 'description', 'priority', 'tag', 'status', 'created_time']
+
+
+class CommentBulkSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Comment
+        fields = ['id', 'description', 'created_time']
+
+
+class ActivityLogSerializer(serializers.ModelSerializer):
+    seq = serializers.IntegerField(source='id')
+    id = serializers.IntegerField(source='object_id')
+
+    class Meta:
+        model = ActivityLog
+        fields = ['seq', 'model', 'action', 'id', 'data', 'created_time']
+
+
+class JobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Job
+        fields = ['id', 'task', 'status', 'attempts', 'result', 'created_time', 'updated_time']
+
+
+class ChangesQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=500)
+
+
+class SignInSerializer(TokenObtainPairSerializer):
+    """
+    Embed the username and the issue time in the tokens, for api.authentication.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.username
+        # With a fraction of second, to compare with the revocations of api.tokens.
+        token['iat'] = time.time()
+        return token
+
+
+class RefreshSerializer(TokenRefreshSerializer):
+
+    def validate(self, attrs):
+        if tokens.is_revoked(RefreshToken(attrs['refresh'])):
+            raise InvalidToken("Token is revoked.")
+        return super().validate(attrs)
@@ -0,0 +1,130 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import activity, counters, search, tokens, versions
+from .membership import membership_cache
+from .models import Comment, Contributor, Issue, Project
+
+
+@receiver(post_save, sender=Contributor)
+@receiver(post_delete, sender=Contributor)
+def invalidate_membership(sender, instance, **kwargs):
+    membership_cache.invalidate(instance.project_id)
+
+
+@receiver(post_save, sender=Project)
+def bump_project_version(sender, instance, created, **kwargs):
+    if not created:
+        versions.bump_project(instance.id)
+
+
+@receiver(post_save, sender=Contributor)
+@receiver(post_delete, sender=Contributor)
+@receiver(post_save, sender=Issue)
+@receiver(post_delete, sender=Issue)
+def bump_parent_version(sender, instance, **kwargs):
+    versions.bump_project(instance.project_id)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_project_version(sender, instance, **kwargs):
+    versions.bump_issue_project(instance.issue_id)
+
+
+@receiver(post_save, sender=Contributor)
+def count_new_contributor(sender, instance, created, **kwargs):
+    if created:
+        counters.contributors_changed(instance.project_id, 1)
+
+
+@receiver(post_delete, sender=Contributor)
+def count_deleted_contributor(sender, instance, **kwargs):
+    counters.contributors_changed(instance.project_id, -1)
+
+
+@receiver(post_init, sender=Issue)
+def remember_issue_status(sender, instance, **kwargs):
+    counters.remember_status(instance)
+
+
+@receiver(post_save, sender=Issue)
+def count_saved_issue(sender, instance, created, **kwargs):
+    if created:
+        counters.issues_created([instance])
+    else:
+        counters.issues_updated([instance])
+
+
+@receiver(post_delete, sender=Issue)
+def count_deleted_issue(sender, instance, **kwargs):
+    counters.issues_deleted([instance])
+
+
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=Comment)
+def index_text(sender, instance, **kwargs):
+    search.index_objects([instance])
+
+
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=Comment)
+def unindex_text(sender, instance, **kwargs):
+    search.unindex_objects([instance])
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.comments_changed(instance.issue_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.comments_changed(instance.issue_id, -1)
+
+
+@receiver(post_save, sender=Contributor)
+@receiver(post_save, sender=Issue)
+def log_saved(sender, instance, created, **kwargs):
+    activity.record(instance.project_id, [instance], 'created' if created else 'updated')
+
+
+@receiver(post_delete, sender=Contributor)
+@receiver(post_delete, sender=Issue)
+def log_deleted(sender, instance, **kwargs):
+    activity.record(instance.project_id, [instance], 'deleted')
+
+
+@receiver(post_save, sender=Comment)
+def log_saved_comment(sender, instance, created, **kwargs):
+    activity.record(instance.issue.project_id, [instance], 'created' if created else 'updated')
+
+
+@receiver(post_delete, sender=Comment)
+def log_deleted_comment(sender, instance, **kwargs):
+    activity.record(instance.issue.project_id, [instance], 'deleted')
+
+
+@receiver(post_init, sender=User)
+def remember_active(sender, instance, **kwargs):
+    instance._token_active = instance.__dict__.get('is_active')
+
+
+@receiver(post_save, sender=User)
+def revoke_tokens(sender, instance, created, **kwargs):
+    """
+    The tokens carry the user: a new password or a deactivation must revoke them. `_password`
+    is only set by set_password(), not when a login upgrades the hash of the same password.
+    """
+    active = instance.__dict__.get('is_active')
+    if not created and (instance._password is not None or active != instance._token_active):
+        tokens.revoke_user(instance.id)
+    instance._token_active = active
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    # The claims would authenticate the user still.
+    tokens.revoke_user(instance.id)
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import re
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from rest_framework.exceptions import APIException, AuthenticationFailed
+
+from . import activity
+from .authentication import ClaimsJWTAuthentication
+from .events import SubscriptionOverflow, as_event, get_broker
+from .membership import resolve_contributor
+from .models import Project
+
+EVENTS_PATH = re.compile(r'^/api/v1/projects/(?P<pk>\d+)/events/$')
+
+
+def _format(event):
+    data = json.dumps(event, cls=DjangoJSONEncoder)
+    return f"id: {event['seq']}\nevent: {event['model']}.{event['action']}\ndata: {data}\n\n".encode()
+
+
+def _subscribe(headers, query, project_id):
+    """
+    Authenticate the JWT of the request and check the membership, once per connection.
+    EventSource can't set headers: the token may come in the `token` query parameter instead.
+    """
+    close_old_connections()
+    try:
+        raw_token = query.get('token', [None])[0]
+        authorization = headers.get(b'authorization', b'').split()
+        if len(authorization) == 2 and authorization[0].lower() == b'bearer':
+            raw_token = authorization[1].decode()
+        if raw_token is None:
+            raise AuthenticationFailed("Authentication credentials were not provided.")
+        authentication = ClaimsJWTAuthentication()
+        user = authentication.get_user(authentication.get_validated_token(raw_token))
+        return resolve_contributor(user, project_id)
+    finally:
+        close_old_connections()
+
+
+def _replay(project_id, since, limit=1000):
+    """
+    Return the events after `since` from the change feed, or None if some were pruned.
+    """
+    close_old_connections()
+    try:
+        horizon = Project.objects.filter(id=project_id).values_list('activity_horizon', flat=True).first()
+        if horizon is None or since < horizon:
+            # Pruned, or the project was deleted: the client downloads it again and gets a 404.
+            return None
+        events = []
+        while True:
+            rows = activity.changes(project_id, since, limit)
+            events += [as_event(row) for row in rows]
+            if len(rows) < limit:
+                return events
+            since = rows[-1].id
+    finally:
+        close_old_connections()
+
+
+class EventStreamApp:
+    """
+    ASGI application serving GET /api/v1/projects/<pk>/events/ as Server-Sent Events, and
+    handing every other request to `app`.
+
+    Each event is a change of the feed (see ChangeList), its SSE id is the sequence number:
+    a client reconnecting with Last-Event-ID (or `?since=`) first receives the changes it
+    missed. When the changes were pruned, or when it falls too far behind, it gets a `resync`
+    event and the stream ends.
+    """
+
+    def __init__(self, app, broker=None, keepalive=15):
+        self.app = app
+        self.broker = broker
+        self.keepalive = keepalive
+
+    async def __call__(self, scope, receive, send):
+        match = EVENTS_PATH.match(scope['path']) if scope['type'] == 'http' else None
+        if match is None:
+            return await self.app(scope, receive, send)
+        await self.stream(scope, receive, send, int(match['pk']))
+
+    async def error(self, send, exc):
+        body = json.dumps({'detail': str(exc.detail)}).encode()
+        await send({'type': 'http.response.start', 'status': exc.status_code,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def stream(self, scope, receive, send, project_id):
+        headers = dict(scope['headers'])
+        query = parse_qs(scope['query_string'].decode())
+        try:
+            contributor = await sync_to_async(_subscribe)(headers, query, project_id)
+        except APIException as exc:
+            return await self.error(send, exc)
+        since = headers.get(b'last-event-id', b'').decode() or query.get('since', [''])[0]
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no'),
+        ]})
+        broker = self.broker or get_broker()
+        async with broker.subscribe(project_id) as subscription:
+            # Subscribe first, then replay, so that no change falls in between.
+            replayed = 0
+            if since.isdigit():
+                events = await sync_to_async(_replay)(project_id, int(since))
+                if events is None:
+                    return await self.resync(send)
+                for event in events:
+                    await send({'type': 'http.response.body', 'body': _format(event), 'more_body': True})
+                replayed = events[-1]['seq'] if events else int(since)
+            await self.forward(subscription, receive, send, contributor, replayed)
+
+    async def forward(self, subscription, receive, send, contributor, replayed):
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            while True:
+                next_event = asyncio.ensure_future(subscription.next(self.keepalive))
+                await asyncio.wait([next_event, disconnected], return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    next_event.cancel()
+                    return
+                try:
+                    event = next_event.result()
+                except SubscriptionOverflow:
+                    return await self.resync(send)
+                if event is None:
+                    await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                    continue
+                if event['seq'] <= replayed:
+                    continue
+                await send({'type': 'http.response.body', 'body': _format(event), 'more_body': True})
+                if event['model'] == 'contributor' and event['action'] == 'deleted' and event['id'] == contributor.id:
+                    # The subscriber was removed from the project.
+                    break
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+
+    async def resync(self, send):
+        await send({'type': 'http.response.body', 'body': b'event: resync\ndata: {}\n\n'})
+
+    @staticmethod
+    async def wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
@@ -0,0 +1,1294 @@
+import asyncio
+import io
+import json
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.hashers import check_password, make_password
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase as BaseAPITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import activity, archive, jobs, membership, metrics, routers, versions
+from .membership import membership_cache
+from .counters import rebuild_counters
+from .events import get_broker
+from .hashers import get_pool
+from .models import ActivityLog, Comment, Contributor, Issue, Job, Project, RevokedToken
+from .payloads import payload_cache
+from .search import rebuild_index
+from .sse import EventStreamApp
+from .throttling import concurrency_limit
+from .views import IssueList
+
+
+class APITestCase(BaseAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        caches[payload_cache.alias].clear()
+        membership_cache.clear()
+        payload_cache.reset_stats()
+
+
+class QueryCountTests(APITestCase):
+    """
+    Every read endpoint must run a fixed number of queries, whatever the size of the project.
+    The counts include the membership lookup of the project rate limit, which misses the
+    membership cache on the first request and after contributors are added.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        self.issue = self.add_data(self.project, size=1)
+        self.client.force_authenticate(self.author)
+
+    def add_data(self, project, size):
+        issue = None
+        for i in range(size):
+            user = User.objects.create_user(username=f'user-{project.id}-{User.objects.count()}')
+            Contributor.objects.create(user=user, project=project, role='contributor')
+            issue = Issue.objects.create(project=project, author=user, assigned=self.author,
+                                         title=f'issue {i}', description='description')
+            for _ in range(2):
+                Comment.objects.create(issue=issue, author=user, description='comment')
+        return issue
+
+    def assertConstantQueries(self, num, url):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.add_data(self.project, size=5)
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_project_list(self):
+        response = self.assertConstantQueries(5, '/api/v1/projects/?expand=contributors,issues.comments')
+        self.assertEqual(len(response.data['results'][0]['issues']), 6)
+
+    def test_compact_project_list(self):
+        response = self.assertConstantQueries(2, '/api/v1/projects/')
+        self.assertNotIn('issues', response.data['results'][0])
+        self.assertEqual(response.data['results'][0]['issue_count'], 6)
+
+    def test_project_detail(self):
+        self.assertConstantQueries(6, f'/api/v1/projects/{self.project.id}')
+
+    def test_contributor_list(self):
+        self.assertConstantQueries(3, f'/api/v1/projects/{self.project.id}/users/')
+
+    def test_issue_list(self):
+        response = self.assertConstantQueries(4, f'/api/v1/projects/{self.project.id}/issues/?expand=comments')
+        self.assertEqual(response.data['results'][0]['assigned']['username'], 'author')
+
+    def test_issue_detail(self):
+        self.assertConstantQueries(4, f'/api/v1/projects/{self.project.id}/issues/{self.issue.id}')
+
+    def test_comment_list(self):
+        url = f'/api/v1/projects/{self.project.id}/issues/{self.issue.id}/comments/'
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 2)
+        Comment.objects.bulk_create(Comment(issue=self.issue, description='more') for _ in range(5))
+        versions.bump_project(self.project.id)
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 7)
+
+    def test_comment_detail(self):
+        comment = self.issue.comments.first()
+        url = f'/api/v1/projects/{self.project.id}/issues/{self.issue.id}/comments/{comment.id}'
+        self.assertConstantQueries(3, url)
+
+
+class MembershipResolverTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.outsider = User.objects.create_user(username='outsider', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        self.issue = Issue.objects.create(project=self.project, author=self.author, title='issue',
+                                          description='description')
+        self.client.force_authenticate(self.author)
+
+    def test_missing_project(self):
+        response = self.client.get('/api/v1/projects/999/issues/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['detail'], "Project with id '999' doesn't exist.")
+
+    def test_not_a_contributor(self):
+        self.client.force_authenticate(self.outsider)
+        response = self.client.get(f'/api/v1/projects/{self.project.id}/issues/{self.issue.id}')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['detail'], "You are not collaborate on this project.")
+
+    def test_issue_of_another_project(self):
+        other = Project.objects.create(title='Other', description='API')
+        Contributor.objects.create(user=self.author, project=other, role='author')
+        response = self.client.get(f'/api/v1/projects/{other.id}/issues/{self.issue.id}/comments/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_add_contributor_twice(self):
+        url = f'/api/v1/projects/{self.project.id}/users/'
+        self.assertEqual(self.client.post(url, {'username': 'outsider'}).status_code, 201)
+        self.assertEqual(self.client.post(url, {'username': 'outsider'}).status_code, 409)
+        self.assertEqual(Contributor.objects.filter(project=self.project).count(), 2)
+
+    def test_create_issue_resolves_assigned_in_one_query(self):
+        url = f'/api/v1/projects/{self.project.id}/issues/'
+        data = {'title': 'new', 'description': 'description', 'assigned': 'author'}
+        # membership, project not deleted, assigned contributor, insert, project counters, project
+        # version, search index, activity log, comments of the new issue
+        with self.assertNumQueries(9):
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 201)
+        data['assigned'] = 'outsider'
+        response = self.client.post(url, data)
+        self.assertEqual(response.data['detail'], "The assigned user doesn't contribute to the project.")
+
+
+class MembershipCacheTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        self.contributor = Contributor.objects.create(user=self.author, project=self.project, role='author')
+        self.client.force_authenticate(self.author)
+
+    @mock.patch('api.membership.is_shared', return_value=True)
+    def test_membership_is_cached(self, is_shared):
+        url = f'/api/v1/projects/{self.project.id}/issues/'
+        with self.assertNumQueries(3):
+            self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        membership_cache.clear()
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+    def test_private_cache_is_not_trusted(self):
+        # A locmem cache is not seen by the other processes: only the in-process LRU is used.
+        lru = type(membership_cache)(local_ttl=0)
+        with self.assertNumQueries(1):
+            self.assertEqual(lru.get(self.author.id, self.project.id), (self.contributor.id, 'author'))
+        self.assertIsNone(cache.get(lru.entry_key(self.author.id, self.project.id)))
+        Contributor.objects.filter(id=self.contributor.id).delete()
+        self.assertIsNone(lru.get(self.author.id, self.project.id))
+
+    def test_contributor_change_invalidates(self):
+        membership_cache.get(self.author.id, self.project.id)
+        self.contributor.role = 'contributor'
+        self.contributor.save()
+        self.assertEqual(membership_cache.get(self.author.id, self.project.id), (self.contributor.id, 'contributor'))
+        self.contributor.delete()
+        self.assertIsNone(membership_cache.get(self.author.id, self.project.id))
+
+    def test_lru_is_bounded(self):
+        lru = type(membership_cache)(maxsize=2)
+        projects = [Project.objects.create(title=str(i), description='API') for i in range(3)]
+        for project in projects:
+            Contributor.objects.create(user=self.author, project=project)
+            lru.get(self.author.id, project.id)
+        self.assertEqual(list(lru._local), [(self.author.id, project.id) for project in projects[1:]])
+
+
+class SparseFieldsTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        self.issue = Issue.objects.create(project=self.project, author=self.author, title='issue',
+                                          description='description')
+        Comment.objects.create(issue=self.issue, author=self.author, description='comment')
+        self.client.force_authenticate(self.author)
+
+    def test_nested_fields(self):
+        url = f'/api/v1/projects/{self.project.id}?fields=id,issues.title,issues.comments.description'
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(response.data, {'id': self.project.id, 'issues': [
+            {'title': 'issue', 'comments': [{'description': 'comment'}]}]})
+
+    def test_only_requested_columns_are_loaded(self):
+        url = f'/api/v1/projects/{self.project.id}/issues/?fields=id,title'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.data['results'], [{'id': self.issue.id, 'title': 'issue'}])
+        self.assertNotIn('description', queries[-1]['sql'])
+
+    def test_update_with_deferred_columns(self):
+        response = self.client.put(f'/api/v1/projects/{self.project.id}',
+                                   {'title': 'Renamed', 'description': 'API', 'type': 'ios'})
+        self.assertEqual(response.status_code, 200)
+        project = Project.objects.get(id=self.project.id)
+        self.assertEqual((project.title, project.issue_count), ('Renamed', 1))
+        response = self.client.put(f'/api/v1/projects/{self.project.id}/issues/{self.issue.id}',
+                                   {'title': 'Renamed', 'description': 'description', 'assigned': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Issue.objects.get(id=self.issue.id).comment_count, 1)
+
+    def test_update_moves_updated_time(self):
+        comment = self.issue.comments.get()
+        urls = {Project: (f'/api/v1/projects/{self.project.id}',
+                          {'title': 'Renamed', 'description': 'API', 'type': 'ios'}),
+                Issue: (f'/api/v1/projects/{self.project.id}/issues/{self.issue.id}',
+                        {'title': 'Renamed', 'description': 'description', 'assigned': ''}),
+                Comment: (f'/api/v1/projects/{self.project.id}/issues/{self.issue.id}/comments/{comment.id}',
+                          {'description': 'edited'})}
+        for model, (url, data) in urls.items():
+            before = model.objects.values_list('updated_time', flat=True).get()
+            self.assertEqual(self.client.put(url, data).status_code, 200)
+            self.assertGreater(model.objects.values_list('updated_time', flat=True).get(), before)
+
+    def test_detail_is_complete_by_default(self):
+        response = self.client.get(f'/api/v1/projects/{self.project.id}/issues/{self.issue.id}')
+        self.assertEqual(len(response.data['comments']), 1)
+        self.assertEqual(response.data['author']['username'], 'author')
+
+
+class CursorPaginationTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        Issue.objects.bulk_create(Issue(project=self.project, author=self.author, title=f'issue {i}',
+                                        description='description') for i in range(7))
+        self.client.force_authenticate(self.author)
+
+    def test_issue_pages_follow_cursor(self):
+        url = f'/api/v1/projects/{self.project.id}/issues/?page_size=3'
+        titles = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            titles += [issue['title'] for issue in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(titles, [f'issue {i}' for i in range(7)])
+
+    def test_previous_cursor(self):
+        first = self.client.get(f'/api/v1/projects/{self.project.id}/issues/?page_size=5')
+        second = self.client.get(first.data['next'])
+        self.assertIsNone(first.data['previous'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+
+class StreamingTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        for i in range(5):
+            issue = Issue.objects.create(project=self.project, author=self.author, title=f'issue {i}',
+                                         description='description')
+            Comment.objects.create(issue=issue, author=self.author, description='comment')
+        self.url = f'/api/v1/projects/{self.project.id}/issues/'
+        self.client.force_authenticate(self.author)
+
+    def test_ndjson_stream(self):
+        response = self.client.get(self.url + '?expand=comments', HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['title'] for row in rows], [f'issue {i}' for i in range(5)])
+        self.assertEqual(len(rows[0]['comments']), 1)
+
+    @mock.patch.object(IssueList, 'stream_chunk_size', 2)
+    def test_json_stream_is_chunked(self):
+        # version, membership, then 4 chunk queries of which 3 prefetch their comments
+        with self.assertNumQueries(9):
+            response = self.client.get(self.url + '?stream=1&expand=comments')
+            rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 5)
+
+
+class BulkTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.dev = User.objects.create_user(username='dev', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        Contributor.objects.create(user=self.dev, project=self.project, role='contributor')
+        self.url = f'/api/v1/projects/{self.project.id}/issues/bulk/'
+        self.client.force_authenticate(self.author)
+
+    def payload(self, size):
+        return [{'title': f'issue {i}', 'description': 'description', 'assigned': 'dev' if i % 2 else ''}
+                for i in range(size)]
+
+    def test_create_runs_constant_queries(self):
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.post(self.url, self.payload(2), format='json')
+        self.assertEqual(response.status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(self.url, self.payload(20), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(small), len(large) + 1)  # the membership is cached on the second call
+        self.assertEqual(Issue.objects.filter(project=self.project).count(), 22)
+        created = Issue.objects.get(id=response.data[1]['id'])
+        self.assertEqual((created.title, created.assigned, created.author), ('issue 1', self.dev, self.author))
+        self.assertEqual(response.data[0]['assigned'], 'author')
+
+    def test_invalid_item_writes_nothing(self):
+        payload = self.payload(3)
+        payload[1]['assigned'] = 'nobody'
+        del payload[2]['title']
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data], [1, 2])
+        self.assertFalse(Issue.objects.exists())
+
+    def test_update_and_delete(self):
+        issues = [Issue.objects.create(project=self.project, author=self.author, title=str(i)) for i in range(3)]
+        foreign = Issue.objects.create(project=self.project, author=self.dev, title='dev')
+        response = self.client.patch(self.url, [{'id': issue.id, 'status': 'finished'} for issue in issues],
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Issue.objects.filter(status='finished').count(), 3)
+
+        response = self.client.patch(self.url, [{'id': foreign.id, 'title': 'mine'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.delete(self.url, [issue.id for issue in issues], format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(list(Issue.objects.all()), [foreign])
+
+    def test_comments(self):
+        issue = Issue.objects.create(project=self.project, author=self.author, title='issue')
+        url = f'/api/v1/projects/{self.project.id}/issues/{issue.id}/comments/bulk/'
+        response = self.client.post(url, [{'description': str(i)} for i in range(4)], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(issue.comments.filter(author=self.author).count(), 4)
+        self.assertEqual(len({comment['id'] for comment in response.data}), 4)
+
+    def test_delete_comments_runs_constant_queries(self):
+        issue = Issue.objects.create(project=self.project, author=self.author, title='issue')
+        url = f'/api/v1/projects/{self.project.id}/issues/{issue.id}/comments/bulk/'
+        ids = [comment['id'] for comment in
+               self.client.post(url, [{'description': str(i)} for i in range(22)], format='json').data]
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.delete(url, ids[:2], format='json').status_code, 204)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.client.delete(url, ids[2:], format='json').status_code, 204)
+        self.assertEqual(len(small), len(large))
+        self.assertEqual((issue.comments.count(), Issue.objects.get(id=issue.id).comment_count), (0, 0))
+        self.assertEqual(ActivityLog.objects.filter(model='comment', action='deleted').count(), 22)
+
+    def test_duplicate_ids_are_refused(self):
+        issue = Issue.objects.create(project=self.project, author=self.author, title='issue')
+        items = [{'id': issue.id, 'title': 'first'}, {'id': issue.id, 'title': 'second'}]
+        response = self.client.patch(self.url, items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, [{'index': 1, 'errors': {'id': [f"Duplicate id '{issue.id}'."]}}])
+        self.assertEqual(Issue.objects.get(id=issue.id).title, 'issue')
+
+
+class CounterTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        self.client.force_authenticate(self.author)
+
+    def assertCounters(self, **expected):
+        project = Project.objects.get(id=self.project.id)
+        self.assertEqual({field: getattr(project, field) for field in expected}, expected)
+
+    def test_signals_keep_counters(self):
+        issue = Issue.objects.create(project=self.project, author=self.author, title='issue')
+        Issue.objects.create(project=self.project, author=self.author, title='done', status='finished')
+        Comment.objects.create(issue=issue, author=self.author, description='comment')
+        self.assertCounters(issue_count=2, todo_issue_count=1, finished_issue_count=1, contributor_count=1)
+        self.assertEqual(Issue.objects.get(id=issue.id).comment_count, 1)
+
+        issue = Issue.objects.get(id=issue.id)
+        issue.status = 'in progress'
+        issue.save()
+        self.assertCounters(todo_issue_count=0, in_progress_issue_count=1, open_issue_count=1)
+        issue.delete()
+        self.assertCounters(issue_count=1, in_progress_issue_count=0, finished_issue_count=1)
+
+    def test_bulk_endpoints_keep_counters(self):
+        url = f'/api/v1/projects/{self.project.id}/issues/bulk/'
+        response = self.client.post(url, [{'title': str(i), 'description': 'description'} for i in range(3)],
+                                    format='json')
+        self.client.patch(url, [{'id': response.data[0]['id'], 'status': 'finished'}], format='json')
+        self.assertCounters(issue_count=3, todo_issue_count=2, finished_issue_count=1)
+
+    def test_rebuild_and_summary(self):
+        Issue.objects.bulk_create(Issue(project=self.project, title=str(i)) for i in range(4))
+        self.assertCounters(issue_count=0)
+        rebuild_counters()
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/projects/summary/')
+        self.assertEqual(response.data['results'][0]['issue_count'], 4)
+        self.assertEqual(response.data['results'][0]['open_issue_count'], 4)
+        self.assertEqual(response.data['results'][0]['contributor_count'], 1)
+
+
+class SearchTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.dev = User.objects.create_user(username='dev', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        Contributor.objects.create(user=self.dev, project=self.project, role='contributor')
+        self.login = Issue.objects.create(project=self.project, author=self.author, assigned=self.dev,
+                                          title='Login crashes', description='Stack trace attached', priority='high')
+        self.export = Issue.objects.create(project=self.project, author=self.author, assigned=self.author,
+                                           title='Export to CSV', description='Add an export button')
+        Comment.objects.create(issue=self.export, author=self.dev, description='Also broken after login')
+        other = Project.objects.create(title='Other', description='API')
+        Issue.objects.create(project=other, author=self.author, title='Login', description='other project')
+        self.url = f'/api/v1/projects/{self.project.id}/search/'
+        self.client.force_authenticate(self.author)
+
+    def search(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [issue['id'] for issue in response.data['results']]
+
+    def test_ranked_results(self):
+        self.assertEqual(self.search(q='login'), [self.login.id, self.export.id])
+        self.assertEqual(self.search(q='csv button'), [self.export.id])
+        self.assertEqual(self.search(q='crashing'), [self.login.id])
+
+    def test_filters(self):
+        self.assertEqual(self.search(q='login', priority='high'), [self.login.id])
+        self.assertEqual(self.search(q='login', assigned='author'), [self.export.id])
+
+    def test_index_follows_changes(self):
+        self.login.title = 'Signin crashes'
+        self.login.save()
+        self.export.comments.all().delete()
+        self.assertEqual(self.search(q='login'), [])
+        self.assertEqual(self.search(q='signin'), [self.login.id])
+        self.login.delete()
+        rebuild_index()
+        self.assertEqual(self.search(q='signin'), [])
+
+    def test_pagination(self):
+        response = self.client.get(self.url, {'q': 'login', 'page_size': 1})
+        self.assertEqual([issue['id'] for issue in response.data['results']], [self.login.id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([issue['id'] for issue in response.data['results']], [self.export.id])
+        self.assertIsNone(response.data['next'])
+
+
+class ConditionalRequestTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        self.issue = Issue.objects.create(project=self.project, author=self.author, title='issue',
+                                          description='description')
+        self.url = f'/api/v1/projects/{self.project.id}/issues/{self.issue.id}'
+        self.client.force_authenticate(self.author)
+
+    def test_not_modified_after_one_query(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_child_change_invalidates(self):
+        project_url = f'/api/v1/projects/{self.project.id}'
+        etag = self.client.get(project_url)['ETag']
+        Comment.objects.create(issue=self.issue, author=self.author, description='comment')
+        response = self.client.get(project_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_outsider_gets_no_304(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_authenticate(User.objects.create_user(username='outsider'))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+
+class PayloadCacheTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.contributor = User.objects.create_user(username='contributor', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        Contributor.objects.create(user=self.contributor, project=self.project, role='contributor')
+        Issue.objects.create(project=self.project, author=self.author, title='issue', description='description')
+        self.url = f'/api/v1/projects/{self.project.id}?expand=issues'
+        self.client.force_authenticate(self.author)
+
+    def test_payload_is_shared_by_contributors(self):
+        first = self.client.get(self.url)
+        self.client.force_authenticate(self.contributor)
+        # version and membership only, the membership read by the project rate limit
+        with self.assertNumQueries(2):
+            second = self.client.get(self.url)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(payload_cache.stats(), {'misses': 1, 'hits': 1, 'hit_ratio': 0.5})
+
+    def test_change_invalidates(self):
+        self.client.get(self.url)
+        Issue.objects.create(project=self.project, author=self.author, title='new', description='description')
+        response = self.client.get(self.url)
+        self.assertEqual([issue['title'] for issue in response.data['issues']], ['issue', 'new'])
+        self.assertEqual(payload_cache.stats()['misses'], 2)
+
+    def test_single_flight(self):
+        calls = []
+        caches[payload_cache.alias].add('payload:key:lock', 1)
+        with mock.patch.object(payload_cache, 'lock_timeout', 0.2):
+            self.assertEqual(payload_cache.get_or_compute('key', lambda: calls.append(1) or 'value'), 'value')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(payload_cache.get_or_compute('key', lambda: calls.append(1) or 'other'), 'value')
+        self.assertEqual(len(calls), 1)
+
+
+class ChangeFeedTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        self.url = f'/api/v1/projects/{self.project.id}/changes/'
+        self.client.force_authenticate(self.author)
+
+    def test_sync_from_cursor(self):
+        cursor = self.client.get(self.url).data['cursor']
+        issue = Issue.objects.create(project=self.project, author=self.author, title='issue', description='d')
+        self.client.post(f'/api/v1/projects/{self.project.id}/issues/{issue.id}/comments/bulk/',
+                         [{'description': 'first'}, {'description': 'second'}], format='json')
+        issue.delete()
+
+        response = self.client.get(self.url, {'since': cursor, 'limit': 3})
+        self.assertEqual([(change['model'], change['action']) for change in response.data['changes']],
+                         [('issue', 'created'), ('comment', 'created'), ('comment', 'created')])
+        self.assertEqual(response.data['changes'][0]['data']['title'], 'issue')
+        self.assertTrue(response.data['has_more'])
+        response = self.client.get(self.url, {'since': response.data['cursor']})
+        self.assertEqual([(change['model'], change['action']) for change in response.data['changes']],
+                         [('comment', 'deleted'), ('comment', 'deleted'), ('issue', 'deleted')])
+        self.assertFalse(response.data['has_more'])
+
+    def test_compact_and_prune(self):
+        issue = Issue.objects.create(project=self.project, author=self.author, title='issue', description='d')
+        issue.title = 'renamed'
+        issue.save()
+        self.assertEqual(activity.compact(), 1)
+        self.assertEqual(ActivityLog.objects.get(model='issue', object_id=issue.id).data['title'], 'renamed')
+
+        last = ActivityLog.objects.latest('id').id
+        activity.prune(timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.client.get(self.url).status_code, 410)
+        self.assertEqual(self.client.get(self.url, {'since': last}).data['changes'], [])
+
+
+class EventStreamTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        self.issue = Issue.objects.create(project=self.project, author=self.author, title='issue', description='d')
+        self.app = EventStreamApp(None, keepalive=0.05)
+
+    def request(self, query, on_subscribed=None):
+        scope = {'type': 'http', 'path': f'/api/v1/projects/{self.project.id}/events/', 'headers': [],
+                 'query_string': query.encode()}
+
+        async def run():
+            inbox, sent = asyncio.Queue(), []
+            await inbox.put({'type': 'http.request'})
+
+            async def send(message):
+                sent.append(message)
+                if b'issue.updated' in message.get('body', b''):
+                    await inbox.put({'type': 'http.disconnect'})
+            task = asyncio.ensure_future(self.app(scope, inbox.get, send))
+            if on_subscribed is not None:
+                while self.project.id not in get_broker()._subscriptions:
+                    await asyncio.sleep(0.01)
+                await sync_to_async(on_subscribed)()
+            await asyncio.wait_for(task, 5)
+            return sent
+        return async_to_sync(run)()
+
+    def test_replay_then_live_events(self):
+        def update_issue():
+            with self.captureOnCommitCallbacks(execute=True):
+                self.issue.title = 'renamed'
+                self.issue.save()
+
+        sent = self.request(f'token={AccessToken.for_user(self.author)}&since=0', update_issue)
+        self.assertEqual(sent[0]['status'], 200)
+        body = b''.join(message.get('body', b'') for message in sent[1:]).decode()
+        events = [line.split(': ')[1] for line in body.splitlines() if line.startswith('event: ')]
+        self.assertEqual(events, ['contributor.created', 'issue.created', 'issue.updated'])
+        self.assertIn('"title": "renamed"', body)
+
+    def test_membership_is_checked_on_subscribe(self):
+        self.assertEqual(self.request('')[0]['status'], 401)
+        outsider = User.objects.create_user(username='outsider')
+        self.assertEqual(self.request(f'token={AccessToken.for_user(outsider)}')[0]['status'], 404)
+
+
+@override_settings(ROOT_URLCONF='softdesk.asgi_urls')
+class AsyncViewTests(APITransactionTestCase):
+    """
+    The lookups run in threads with their own connections: the rows must be committed.
+    """
+
+    def setUp(self):
+        cache.clear()
+        caches[payload_cache.alias].clear()
+        membership_cache.clear()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        self.issue = Issue.objects.create(project=self.project, author=self.author, title='issue', description='d')
+        self.authorization = f'Bearer {AccessToken.for_user(self.author)}'
+
+    def get(self, url, **headers):
+        async def get():
+            return await self.async_client.get(url, authorization=self.authorization, **headers)
+        return async_to_sync(get)()
+
+    def asgi(self, path, query='', **headers):
+        """
+        Call the ASGI application as a server does: unlike the async client, the response body
+        is read in the event loop.
+        """
+        from softdesk.asgi import application
+        headers = [(b'authorization', self.authorization.encode())] + [
+            (name.encode(), value.encode()) for name, value in headers.items()]
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(), 'headers': headers,
+                 'server': ('testserver', 80), 'scheme': 'http'}
+
+        async def run():
+            inbox, sent = asyncio.Queue(), []
+            await inbox.put({'type': 'http.request'})
+
+            async def send(message):
+                sent.append(message)
+            await asyncio.wait_for(application(scope, inbox.get, send), 5)
+            return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:])
+        return async_to_sync(run)()
+
+    def test_streaming_responses(self):
+        url = f'/api/v1/projects/{self.project.id}/issues/'
+        for path, query, headers in ((url, 'stream=1', {}), (url, '', {'accept': 'application/x-ndjson'}),
+                                     (f'/api/v1/projects/{self.project.id}/issues.ndjson', '', {})):
+            status_code, body = self.asgi(path, query, **headers)
+            self.assertEqual(status_code, 200)
+            rows = json.loads(body) if query else [json.loads(line) for line in body.splitlines()]
+            self.assertEqual([row['title'] for row in rows], ['issue'])
+        status_code, body = self.asgi(f'/api/v1/projects/{self.project.id}/export')
+        self.assertEqual(status_code, 200)
+        records = list(archive.read_records(io.BytesIO(body)))
+        self.assertEqual([record.get('record') for record in records], [None, 'project', 'contributor', 'issue'])
+
+    def test_same_payload_as_sync_view(self):
+        for url in [f'/api/v1/projects/{self.project.id}', f'/api/v1/projects/{self.project.id}/issues/',
+                    f'/api/v1/projects/{self.project.id}/issues/{self.issue.id}', '/api/v1/projects/']:
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.client.credentials(HTTP_AUTHORIZATION=self.authorization)
+            self.assertEqual(response.json(), self.client.get(url).json())
+
+    def test_membership_is_resolved_once(self):
+        lookup = mock.Mock(wraps=membership.resolve_contributor)
+        with mock.patch('api.async_views.resolve_contributor', lookup), \
+                mock.patch('api.views.resolve_contributor', lookup):
+            self.assertEqual(self.get(f'/api/v1/projects/{self.project.id}/issues/').status_code, 200)
+        self.assertEqual(lookup.call_count, 1)
+
+    def test_not_modified_and_errors(self):
+        url = f'/api/v1/projects/{self.project.id}/issues/{self.issue.id}'
+        response = self.get(url, **{'if-none-match': self.get(url)['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.get('/api/v1/projects/999/issues/').status_code, 404)
+        self.client.credentials(HTTP_AUTHORIZATION=self.authorization)
+        response = self.client.post(f'/api/v1/projects/{self.project.id}/issues/',
+                                    {'title': 'new', 'description': 'd', 'assigned': ''})
+        self.assertEqual(response.status_code, 201)
+        self.authorization = ''
+        self.assertEqual(self.get(url).status_code, 401)
+
+
+class TokenAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        self.tokens = self.client.post('/api/v1/signin/', {'username': 'author', 'password': 'secret'}).data
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+
+    def user_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data)
+        self.assertLess(response.status_code, 300)
+        return [query for query in queries if 'FROM "auth_user"' in query['sql']]
+
+    def test_user_is_loaded_only_when_needed(self):
+        self.assertEqual(self.user_queries('get', f'/api/v1/projects/{self.project.id}/issues/'), [])
+        # The new issue shows the first name, last name and email of its author.
+        queries = self.user_queries('post', f'/api/v1/projects/{self.project.id}/issues/',
+                                    {'title': 'new', 'description': 'd', 'assigned': ''})
+        self.assertEqual(len(queries), 1)
+
+    def test_sign_out_revokes_tokens(self):
+        response = self.client.post('/api/v1/signout/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get('/api/v1/projects/').status_code, 401)
+        self.client.credentials()
+        response = self.client.post('/api/v1/token/refresh/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_deny_list_outlives_a_private_cache(self):
+        # The locmem cache of another process would not hold the revocation: the database does.
+        self.client.post('/api/v1/signout/', {'refresh': self.tokens['refresh']})
+        cache.clear()
+        self.assertEqual(self.client.get('/api/v1/projects/').status_code, 401)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+
+    @mock.patch('api.tokens.is_shared', return_value=True)
+    def test_deny_list_in_a_shared_cache(self, is_shared):
+        self.client.post('/api/v1/signout/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(self.client.get('/api/v1/projects/').status_code, 401)
+        self.assertFalse(RevokedToken.objects.exists())
+
+    def test_new_password_revokes_tokens(self):
+        self.assertEqual(self.client.get('/api/v1/projects/').status_code, 200)
+        self.author.set_password('changed')
+        self.author.save()
+        self.assertEqual(self.client.get('/api/v1/projects/').status_code, 401)
+
+    def test_deleting_the_user_revokes_tokens(self):
+        self.author.delete()
+        response = self.client.post('/api/v1/projects/', {'title': 'new', 'description': 'd', 'type': 'back-end'})
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Project.objects.filter(title='new').exists())
+        self.client.credentials()
+        response = self.client.post('/api/v1/token/refresh/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(PASSWORD_HASHERS=['api.hashers.PooledPBKDF2PasswordHasher',
+                                     'django.contrib.auth.hashers.MD5PasswordHasher'])
+class PasswordHashingTests(APITestCase):
+
+    def test_hashes_in_the_pool(self):
+        self.assertIsNotNone(get_pool())
+        encoded = make_password('secret')
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$'))
+        self.assertTrue(check_password('secret', encoded))
+        self.assertFalse(check_password('wrong', encoded))
+
+    def test_old_hash_is_upgraded_on_sign_in(self):
+        user = User.objects.create(username='old', password=make_password('secret', hasher='md5'))
+        access = AccessToken.for_user(user)
+        access['username'] = 'old'
+        response = self.client.post('/api/v1/signin/', {'username': 'old', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        # Not a new password: the tokens stay valid.
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/api/v1/projects/').status_code, 200)
+
+
+def throttle_rates(**rates):
+    return override_settings(REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], **rates},
+    })
+
+
+class ThrottlingTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.dev = User.objects.create_user(username='dev', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        Contributor.objects.create(user=self.dev, project=self.project, role='contributor')
+        self.url = f'/api/v1/projects/{self.project.id}/issues/'
+        self.client.force_authenticate(self.author)
+
+    def create_issue(self):
+        title = f'issue {Issue.objects.count()}'
+        return self.client.post(self.url, {'title': title, 'description': 'description', 'assigned': 'author'})
+
+    @throttle_rates(issues='2/min')
+    def test_writes_of_an_endpoint_are_limited(self):
+        self.assertEqual(self.create_issue().status_code, 201)
+        self.assertEqual(self.create_issue().status_code, 201)
+        response = self.create_issue()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+        # Reads and the other endpoints have their own buckets.
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.client.force_authenticate(self.dev)
+        self.assertEqual(self.create_issue().status_code, 201)
+
+    @throttle_rates(issues='2/min')
+    def test_bucket_refills(self):
+        with mock.patch('api.throttling.time.time', return_value=1000.0):
+            self.create_issue()
+            self.create_issue()
+            self.assertEqual(self.create_issue().status_code, 429)
+        with mock.patch('api.throttling.time.time', return_value=1030.0):
+            self.assertEqual(self.create_issue().status_code, 201)
+            self.assertEqual(self.create_issue().status_code, 429)
+
+    @throttle_rates(project='3/min')
+    def test_project_limit_is_shared_by_its_contributors(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.client.force_authenticate(self.dev)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get(self.url).status_code, 429)
+        self.assertEqual(self.client.get('/api/v1/projects/').status_code, 200)
+
+    @throttle_rates(project='2/min')
+    def test_outsiders_do_not_use_the_project_limit(self):
+        self.client.force_authenticate(User.objects.create_user(username='outsider', password='secret'))
+        for _ in range(3):
+            self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_authenticate(self.dev)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get(self.url).status_code, 429)
+
+    @throttle_rates(anon='1/min')
+    def test_anonymous_requests_are_limited_per_address(self):
+        self.client.force_authenticate(None)
+        credentials = {'username': 'author', 'password': 'secret'}
+        self.assertEqual(self.client.post('/api/v1/signin/', credentials).status_code, 200)
+        self.assertEqual(self.client.post('/api/v1/signin/', credentials).status_code, 429)
+
+    @override_settings(CONCURRENCY_LIMITS={'project': 1})
+    def test_concurrency_cap(self):
+        url = f'/api/v1/projects/{self.project.id}'
+        admission = concurrency_limit.acquire('project')
+        try:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '1')
+        finally:
+            admission.release()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+@override_settings(METRICS={'SAMPLE_RATE': 1.0, 'SERVER_TIMING': True, 'TOKEN': None})
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        Issue.objects.create(project=self.project, author=self.author, title='issue', description='description')
+        self.client.force_authenticate(self.author)
+
+    def test_sampled_request_is_profiled(self):
+        response = self.client.get(f'/api/v1/projects/{self.project.id}/issues/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="3 queries, 0 duplicates", '
+                                                    r'serialize;dur=[\d.]+, total;dur=[\d.]+$')
+        body = self.client.get('/metrics').content.decode()
+        route = 'api/v1/projects/<int:pk>/issues/'
+        self.assertIn(f'softdesk_requests_total{{route="{route}",method="GET",status="200"}} 1', body)
+        self.assertIn(f'softdesk_request_duration_seconds_count{{route="{route}"}} 1', body)
+        self.assertIn(f'softdesk_queries_total{{route="{route}"}} 3', body)
+        self.assertIn('softdesk_payload_cache_misses_total 1', body)
+
+    def test_duplicate_queries(self):
+        profile = metrics.Profile()
+        token = metrics._profile.set(profile)
+        try:
+            for issue_id in (1, 2, 3):
+                Issue.objects.filter(id=issue_id).first()
+            Project.objects.first()
+        finally:
+            metrics._profile.reset(token)
+        self.assertEqual((profile.queries, profile.duplicates), (4, 2))
+
+    @override_settings(METRICS={'SAMPLE_RATE': 0})
+    def test_unsampled_request_is_only_counted(self):
+        response = self.client.get(f'/api/v1/projects/{self.project.id}/issues/')
+        self.assertNotIn('Server-Timing', response)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('method="GET",status="200"} 1', body)
+        self.assertNotIn('softdesk_queries_total{', body)
+
+    @override_settings(METRICS={'TOKEN': 'secret'})
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+
+class BenchmarkTests(APITestCase):
+
+    def test_every_route_is_benchmarked(self):
+        call_command('seed', users=20, projects=3, contributors=5, issues=30, comments=2, stdout=io.StringIO())
+        self.assertGreater(Comment.objects.count(), 0)
+        issues = Issue.objects.count()
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('benchmark', requests=2, warmup=0, output=output.name, stdout=io.StringIO())
+            report = json.load(output)
+        self.assertEqual(report['uncovered'], [])
+        self.assertEqual(len(report['scenarios']), 24)
+        self.assertEqual([result['name'] for result in report['scenarios'] if result['errors']], [])
+        # The writes were rolled back.
+        self.assertEqual(Issue.objects.count(), issues)
+
+
+class DatabaseProfileTests(APITestCase):
+
+    @skipUnless(settings.DB_PROFILE == 'sqlite-tuned', "DB_PROFILE is not sqlite-tuned.")
+    def test_tuned_sqlite(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = type(connections['default'])({**connection.settings_dict, 'NAME': f'{directory}/db.sqlite3'})
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA synchronous')
+                    self.assertEqual(cursor.fetchone()[0], 1)
+                with CaptureQueriesContext(wrapper) as queries:
+                    wrapper._start_transaction_under_autocommit()
+                wrapper.rollback()
+                self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+            finally:
+                wrapper.close()
+
+
+@override_settings(DATABASE_REPLICAS=['replica-1', 'replica-2'], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.router = routers.ReplicaRouter()
+        self.user = User.objects.create_user(username='author', password='secret')
+
+    def route(self, pinned=False):
+        state = routers.RoutingState('replica-2', pinned)
+        token = routers._state.set(state)
+        self.addCleanup(routers._state.reset, token)
+        return state
+
+    def test_reads(self):
+        # Out of the requests and for the other apps, the default router decides.
+        self.assertIsNone(self.router.db_for_read(Issue))
+        state = self.route()
+        self.assertIsNone(self.router.db_for_read(Group))
+        # The test case runs in a transaction, whose reads stay on the primary.
+        self.assertEqual(self.router.db_for_read(User), 'default')
+        with mock.patch.object(connections['default'], 'in_atomic_block', False):
+            self.assertEqual(self.router.db_for_read(User), 'replica-2')
+        state.pinned = True
+        self.assertEqual(self.router.db_for_read(Issue), 'default')
+        self.assertEqual(self.router.db_for_write(Issue), 'default')
+        self.assertFalse(self.router.allow_migrate('replica-1', 'api'))
+
+    def test_write_pins(self):
+        state = self.route()
+        Contributor(user=self.user, project=Project(title='Softdesk'))
+        Issue.objects.filter(id=0).first()
+        self.assertFalse(state.pinned)
+        Project.objects.create(title='Softdesk', description='API')
+        self.assertTrue(state.wrote and state.pinned)
+
+    def test_identify(self):
+        state = self.route()
+        cache.set(routers._pin_key(self.user.pk), True)
+        routers.identify(self.user.pk)
+        self.assertTrue(state.pinned)
+
+    def test_pool(self):
+        pool = routers.ReplicaPool()
+        self.assertEqual([pool.acquire() for _ in range(3)], ['replica-1', 'replica-2', 'replica-1'])
+        with override_settings(REPLICA_SELECTION='least-loaded'):
+            self.assertEqual(pool.acquire(), 'replica-2')
+            pool.release('replica-1')
+            self.assertEqual(pool.acquire(), 'replica-1')
+
+    def test_middleware_pins_after_a_write(self):
+        def view(request):
+            routers.identify(self.user.pk)
+            if request.method == 'POST':
+                Project.objects.create(title='Softdesk', description='API')
+            return HttpResponse()
+
+        middleware = routers.ReadYourWritesMiddleware(view)
+        response = middleware(RequestFactory().get('/'))
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+        response = middleware(RequestFactory().post('/'))
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], 5)
+        self.assertTrue(cache.get(routers._pin_key(self.user.pk)))
+        self.assertEqual(routers.replica_pool.load['replica-1'] + routers.replica_pool.load['replica-2'], 0)
+
+
+def failing_task(message):
+    raise ValueError(message)
+
+
+class JobTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        self.client.force_authenticate(self.author)
+
+    def test_idempotency_key(self):
+        job = jobs.enqueue('api.counters.rebuild_counters', key='rebuild', project_ids=[self.project.id])
+        self.assertEqual(jobs.enqueue('api.counters.rebuild_counters', key='rebuild').id, job.id)
+        self.assertEqual([job.status for job in jobs.run_pending()], ['succeeded'])
+        self.assertEqual(jobs.enqueue('api.counters.rebuild_counters', key='rebuild').status, 'succeeded')
+        self.assertEqual(jobs.run_pending(), [])
+
+    @override_settings(JOBS={'MAX_ATTEMPTS': 2, 'RETRY_DELAY': 10})
+    def test_retries(self):
+        job = jobs.enqueue('api.tests.failing_task', key='failing', message='boom')
+        job = jobs.run_pending()[0]
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertIn('ValueError: boom', job.error)
+        self.assertEqual(jobs.run_pending(), [])
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        job = jobs.run_pending()[0]
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        # Queued again under the same key.
+        self.assertEqual(jobs.enqueue('api.tests.failing_task', key='failing', message='boom').status, 'queued')
+
+    def test_lease_expired(self):
+        job = jobs.enqueue('api.counters.rebuild_counters')
+        self.assertEqual(jobs.claim().id, job.id)
+        self.assertIsNone(jobs.claim())
+        Job.objects.filter(id=job.id).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(jobs.run(jobs.claim()).status, 'succeeded')
+
+    def test_project_delete(self):
+        issue = Issue.objects.create(project=self.project, author=self.author, title='issue', description='d')
+        Comment.objects.create(issue=issue, author=self.author, description='comment')
+        response = self.client.delete(f'/api/v1/projects/{self.project.id}')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['job']['status'], 'queued')
+        self.assertEqual(self.client.delete(f'/api/v1/projects/{self.project.id}').status_code, 404)
+
+        call_command('worker', burst=True, stdout=io.StringIO())
+        self.assertFalse(Project.all_objects.filter(id=self.project.id).exists())
+        self.assertFalse(ActivityLog.objects.filter(project_id=self.project.id).exists())
+        status = self.client.get(response['Location'])
+        self.assertEqual(status.data['status'], 'succeeded')
+        self.assertEqual(status.data['result'], {'issues': 1, 'comments': 1})
+        self.client.force_authenticate(User.objects.create_user(username='other'))
+        self.assertEqual(self.client.get(response['Location']).status_code, 404)
+
+    @override_settings(EVENTS={'FAN_OUT_INLINE': 1})
+    def test_fan_out(self):
+        with mock.patch.object(type(get_broker()), 'shared', True), \
+                mock.patch.object(type(get_broker()), 'publish') as publish:
+            self.client.post(f'/api/v1/projects/{self.project.id}/issues/bulk/',
+                             [{'title': 'one', 'description': 'd'}, {'title': 'two', 'description': 'd'}],
+                             format='json')
+            publish.assert_not_called()
+            self.assertEqual(jobs.run_pending()[0].result, {'events': 2})
+        self.assertEqual(publish.call_count, 2)
+
+
+class DeletionTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        self.issues = [Issue.objects.create(project=self.project, author=self.author, title=f'crash {i}',
+                                            description='description') for i in range(3)]
+        for issue in self.issues:
+            Comment.objects.create(issue=issue, author=self.author, description='crash')
+        self.client.force_authenticate(self.author)
+        self.url = f'/api/v1/projects/{self.project.id}'
+
+    def test_deleted_project_is_hidden(self):
+        self.client.get(f'{self.url}/issues/')
+        self.assertEqual(self.client.delete(self.url).status_code, 202)
+        self.assertEqual(self.client.get('/api/v1/projects/').data['results'], [])
+        for path in ('', '/issues/', f'/issues/{self.issues[0].id}', f'/issues/{self.issues[0].id}/comments/',
+                     '/search/?q=crash', '/changes/'):
+            self.assertEqual(self.client.get(self.url + path).status_code, 404, path)
+
+    def test_stale_membership_of_a_deleted_project(self):
+        member = membership_cache.get(self.author.id, self.project.id)
+        self.assertEqual(self.client.delete(self.url).status_code, 202)
+        # Another process still has the membership in its in-process cache.
+        membership_cache._set_local((self.author.id, self.project.id), member)
+        for path in ('/issues/', '/users/', '/search/?q=crash', '/changes/', '/export'):
+            self.assertEqual(self.client.get(self.url + path).status_code, 404, path)
+        issue = {'title': 'new', 'description': 'description', 'assigned': ''}
+        self.assertEqual(self.client.post(f'{self.url}/issues/', issue).status_code, 404)
+        self.assertEqual(self.client.post(f'{self.url}/issues/bulk/', [issue], format='json').status_code, 404)
+        self.assertEqual(Issue.all_objects.filter(project=self.project).count(), 3)
+
+    def test_deleted_issue_is_hidden(self):
+        issue = self.issues[0]
+        self.assertEqual(self.client.delete(f'{self.url}/issues/{issue.id}').status_code, 204)
+        self.assertEqual(self.client.get(f'{self.url}/issues/{issue.id}').status_code, 404)
+        self.assertEqual(self.client.get(f'{self.url}/issues/{issue.id}/comments/').status_code, 404)
+        self.assertEqual(len(self.client.get(f'{self.url}/issues/').data['results']), 2)
+        results = self.client.get(f'{self.url}/search/?q=crash').data['results']
+        self.assertNotIn(issue.id, [row['id'] for row in results])
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.issue_count, 2)
+        self.assertEqual(ActivityLog.objects.filter(model='issue', action='deleted').count(), 1)
+
+    def test_purge_by_batches(self):
+        response = self.client.delete(f'{self.url}/issues/bulk/', [issue.id for issue in self.issues[:2]],
+                                      format='json')
+        self.assertEqual(response.status_code, 204)
+        job = Job.objects.get()
+        job.kwargs['batch_size'] = 1
+        job.save()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(jobs.run_pending()[0].result, {'issues': 2, 'comments': 2})
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE FROM "api_')]
+        self.assertEqual(len(deletes), 4)
+        self.assertFalse([sql for sql in deletes if ',' in sql])
+        self.assertEqual(Issue.all_objects.count(), 1)
+        self.assertEqual(Comment.objects.count(), 1)
+        # No per row side effect: the comments are gone with their issue.
+        self.assertFalse(ActivityLog.objects.filter(model='comment', action='deleted').exists())
+        self.assertEqual([row['id'] for row in self.client.get(f'{self.url}/search/?q=crash').data['results']],
+                         [self.issues[2].id])
+
+
+class ArchiveTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(username='author', password='secret')
+        self.member = User.objects.create_user(username='member', password='secret')
+        self.project = Project.objects.create(title='Softdesk', description='API', type='ios')
+        Contributor.objects.create(user=self.author, project=self.project, role='author')
+        Contributor.objects.create(user=self.member, project=self.project, role='contributor')
+        self.issues = [Issue.objects.create(project=self.project, author=self.author, assigned=self.member,
+                                            title=f'issue {i}', description='description', status='finished')
+                       for i in range(3)]
+        for issue in self.issues:
+            Comment.objects.create(issue=issue, author=self.member, description=f'comment of {issue.id}')
+        self.client.force_authenticate(self.author)
+
+    def export(self):
+        response = self.client.get(f'/api/v1/projects/{self.project.id}/export')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        return b''.join(response.streaming_content)
+
+    def test_export(self):
+        records = list(archive.read_records(io.BytesIO(self.export())))
+        self.assertEqual([record.get('record') for record in records],
+                         [None, 'project', 'contributor', 'contributor'] + ['issue'] * 3 + ['comment'] * 3)
+        self.assertEqual(records[1]['type'], 'ios')
+        self.assertEqual(records[4]['assigned'], 'member')
+        self.assertEqual(records[7]['issue'], self.issues[0].id)
+
+    def test_round_trip(self):
+        data = self.export()
+        self.client.force_authenticate(self.member)
+        with self.assertNumQueries(24):
+            response = self.client.post('/api/v1/projects/import/', data, content_type='application/gzip')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'id': response.data['id'], 'contributors': 1, 'issues': 3, 'comments': 3})
+
+        project = Project.objects.get(id=response.data['id'])
+        self.assertEqual((project.type, project.issue_count, project.finished_issue_count, project.contributor_count),
+                         ('ios', 3, 3, 2))
+        self.assertEqual(Contributor.objects.get(project=project, user=self.member).role, 'author')
+        issues = list(Issue.objects.filter(project=project).order_by('id'))
+        self.assertEqual([issue.created_time for issue in issues], [issue.created_time for issue in self.issues])
+        self.assertEqual([issue.comment_count for issue in issues], [1, 1, 1])
+        self.assertEqual([comment.description for comment in Comment.objects.filter(issue__project=project)
+                          .order_by('id')], [f'comment of {issue.id}' for issue in self.issues])
+        jobs.run_pending()
+        results = self.client.get(f'/api/v1/projects/{project.id}/search/?q=comment').data['results']
+        self.assertEqual(len(results), 3)
+
+    def test_invalid_archive(self):
+        records = [{'format': archive.FORMAT, 'version': archive.VERSION},
+                   {'record': 'project', 'title': 'Broken', 'description': 'broken'},
+                   {'record': 'comment', 'issue': 1, 'description': 'orphan'}]
+        data = b''.join(archive.compress(records))
+        response = self.client.post('/api/v1/projects/import/', data, content_type='application/gzip')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Project.objects.filter(title='Broken').exists())
+        self.assertEqual(Job.objects.get().task, 'api.deletion.delete_project')
+        response = self.client.post('/api/v1/projects/import/', b'not gzip', content_type='application/gzip')
+        self.assertEqual(response.status_code, 400)
+
+    def test_values_are_checked(self):
+        header = {'format': archive.FORMAT, 'version': archive.VERSION}
+        project = {'record': 'project', 'title': 'Bad', 'description': 'd'}
+        issue = {'record': 'issue', 'id': 1, 'title': 'issue', 'description': 'd'}
+        for records, error in (([{**project, 'type': 'bogus'}], "type 'bogus'"),
+                               ([project, {**issue, 'status': 'bogus'}], "status 'bogus'"),
+                               ([project, {**issue, 'title': 'x' * 201}], 'at most 200 characters')):
+            data = b''.join(archive.compress([header, *records]))
+            response = self.client.post('/api/v1/projects/import/', data, content_type='application/gzip')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(error, response.data['detail'])
+        self.assertFalse(Project.objects.filter(title='Bad').exists())
+
+    def test_commands(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('export_project', self.project.id, output=f'{directory}/project.ndjson.gz')
+            out = io.StringIO()
+            call_command('import_project', f'{directory}/project.ndjson.gz', owner='member', stdout=out)
+        self.assertIn('1 contributors, 3 issues, 3 comments', out.getvalue())
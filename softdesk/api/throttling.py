@@ -0,0 +1,200 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import throttling
+from rest_framework.exceptions import Throttled
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+
+from .membership import membership_cache
+
+# KEYS[1]: the bucket, ARGV: capacity, refill rate per second, now. Returns whether the
+# request is admitted and the tokens left.
+TOKEN_BUCKET_SCRIPT = """
+local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'time')
+local tokens = tonumber(state[1]) or capacity
+local last = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(now - last, 0) * rate)
+local admitted = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    admitted = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'time', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {admitted, tostring(tokens)}
+"""
+
+
+class TokenBucket:
+    """
+    Token buckets in a shared Django cache: a bucket holds up to `capacity` tokens, refilled at
+    `rate` tokens per second, and each request takes one. A bucket is a single entry updated in
+    O(1): by a Lua script on Redis, atomic across processes, and under a lock with the other
+    backends, atomic in the process (which is all a locmem cache is shared with).
+    """
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._script = None
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def consume(self, key, capacity, rate):
+        """
+        Take a token from the bucket `key`. Return whether there was one, and the seconds until
+        the next one.
+        """
+        key = f'throttle:{key}'
+        if type(self.backend).__module__.startswith('django_redis'):
+            admitted, tokens = self._consume_redis(key, capacity, rate)
+        else:
+            admitted, tokens = self._consume_local(key, capacity, rate)
+        return admitted, 0 if admitted else (1 - tokens) / rate
+
+    def _consume_redis(self, key, capacity, rate):
+        if self._script is None:
+            from django_redis import get_redis_connection
+            self._script = get_redis_connection(self.alias).register_script(TOKEN_BUCKET_SCRIPT)
+        admitted, tokens = self._script(keys=[self.backend.make_key(key)], args=[capacity, rate, time.time()])
+        return bool(admitted), float(tokens)
+
+    def _consume_local(self, key, capacity, rate):
+        now = time.time()
+        with self._lock:
+            tokens, last = self.backend.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(now - last, 0) * rate)
+            admitted = tokens >= 1
+            if admitted:
+                tokens -= 1
+            self.backend.set(key, (tokens, now), capacity / rate)
+        return admitted, tokens
+
+
+token_bucket = TokenBucket()
+
+
+class TokenBucketThrottle(throttling.SimpleRateThrottle):
+    """
+    A DRF throttle over a token bucket: the rate 'num/period' of the scope, from the
+    DEFAULT_THROTTLE_RATES setting, refills num tokens per period and allows bursts of num
+    requests. A scope without a rate is not throttled.
+    """
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        admitted, self.retry_after = token_bucket.consume(key, self.num_requests, self.num_requests / self.duration)
+        return admitted
+
+    def wait(self):
+        return self.retry_after
+
+
+class AnonRateThrottle(TokenBucketThrottle):
+    """
+    Unauthenticated requests (sign in, sign up...), per client address.
+    """
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return f'{self.scope}:{self.get_ident(request)}'
+
+
+class UserRateThrottle(TokenBucketThrottle):
+    """
+    Every request of an authenticated user.
+    """
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return None
+        return f'{self.scope}:{request.user.pk}'
+
+
+class ProjectRateThrottle(TokenBucketThrottle):
+    """
+    Every request of the contributors of a project: a busy project cannot starve the others.
+    The requests of non members are left out, they cannot empty the bucket of a project they
+    will be refused anyway.
+    """
+    scope = 'project'
+
+    def get_cache_key(self, request, view):
+        project_id = getattr(view, 'kwargs', {}).get('pk')
+        if project_id is None or not request.user or not request.user.is_authenticated:
+            return None
+        if membership_cache.get(request.user.id, project_id) is None:
+            return None
+        return f'{self.scope}:{project_id}'
+
+
+class EndpointRateThrottle(TokenBucketThrottle):
+    """
+    The writes of a user on the views of a `throttle_scope`, issues or comments for instance.
+    """
+
+    def __init__(self):
+        # The scope depends on the view.
+        pass
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scope', None)
+        if self.scope is None or request.method in SAFE_METHODS or not request.user.is_authenticated:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+    def get_cache_key(self, request, view):
+        return f'{self.scope}:{request.user.pk}'
+
+
+class ConcurrencyLimit:
+    """
+    Cap the number of requests of each scope of CONCURRENCY_LIMITS served at once by the
+    process. A request over the cap is refused right away rather than queued.
+    """
+
+    def __init__(self):
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def semaphore(self, scope):
+        limit = getattr(settings, 'CONCURRENCY_LIMITS', {}).get(scope)
+        if limit is None:
+            return None
+        with self._lock:
+            if (scope, limit) not in self._semaphores:
+                self._semaphores[(scope, limit)] = threading.BoundedSemaphore(limit)
+            return self._semaphores[(scope, limit)]
+
+    def acquire(self, scope):
+        """
+        Return the semaphore to release at the end of the request, None if `scope` is not capped,
+        or raise Throttled.
+        """
+        semaphore = self.semaphore(scope)
+        if semaphore is None:
+            return None
+        if not semaphore.acquire(blocking=False):
+            raise Throttled(wait=getattr(settings, 'CONCURRENCY_RETRY_AFTER', 1))
+        return semaphore
+
+
+concurrency_limit = ConcurrencyLimit()
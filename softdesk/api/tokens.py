@@ -0,0 +1,64 @@
+import time
+from datetime import timedelta
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .membership import is_shared
+from .models import RevokedToken
+
+
+def _deny_key(jti):
+    return f'jwt:deny:{jti}'
+
+
+def _user_key(user_id):
+    return f'jwt:deny-user:{user_id}'
+
+
+def _store(key, timeout):
+    """
+    Record a revocation for `timeout` seconds. A private cache would only refuse the token in
+    this process: without a shared cache, the deny-list is kept in the database.
+    """
+    cache = caches[DEFAULT_CACHE_ALIAS]
+    if is_shared(cache):
+        cache.set(key, time.time(), timeout)
+        return
+    now = timezone.now()
+    RevokedToken.objects.filter(expires__lt=now).delete()
+    RevokedToken.objects.update_or_create(key=key, defaults={'revoked_at': time.time(),
+                                                             'expires': now + timedelta(seconds=timeout)})
+
+
+def _load(keys):
+    cache = caches[DEFAULT_CACHE_ALIAS]
+    if is_shared(cache):
+        return cache.get_many(keys)
+    return dict(RevokedToken.objects.filter(key__in=keys, expires__gt=timezone.now())
+                .values_list('key', 'revoked_at'))
+
+
+def revoke(token):
+    """
+    Refuse the token until it expires.
+    """
+    _store(_deny_key(token[api_settings.JTI_CLAIM]), max(int(token['exp'] - time.time()), 1))
+
+
+def revoke_user(user_id):
+    """
+    Refuse every token of the user issued so far, when they change their password or are
+    deactivated for instance.
+    """
+    _store(_user_key(user_id), int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()))
+
+
+def is_revoked(token):
+    """
+    Check the deny-list, in one lookup.
+    """
+    jti_key, user_key = _deny_key(token.get(api_settings.JTI_CLAIM)), _user_key(token.get(api_settings.USER_ID_CLAIM))
+    found = _load([jti_key, user_key])
+    return jti_key in found or token.get('iat', 0) < found.get(user_key, 0)
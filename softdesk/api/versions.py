@@ -0,0 +1,20 @@
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Project
+
+
+def bump(projects):
+    """
+    Bump the version of the projects of the queryset, which invalidates every ETag and cached
+    payload built from them.
+    """
+    projects.update(version=F('version') + 1, updated_time=timezone.now())
+
+
+def bump_project(project_id):
+    bump(Project.objects.filter(id=project_id))
+
+
+def bump_issue_project(issue_id):
+    bump(Project.objects.filter(issues__id=issue_id))
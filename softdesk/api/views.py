@@ -1,39 +1,328 @@
-from rest_framework.permissions import AllowAny, IsAuthenticated
+import hashlib
+
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAuthenticated
 from rest_framework import status
 from rest_framework import mixins
 from rest_framework import generics
+from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, Max, OuterRef, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
-
-from .models import Comment, Issue, Project, Contributor
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from . import activity, archive, counters, deletion, search, tokens, versions
+from .membership import resolve_assigned, resolve_contributor, resolve_membership
+from .models import Comment, Issue, Job, Project, Contributor
+from .pagination import CreatedTimeCursorPagination
+from .payloads import payload_cache
 from .permissions import (IsProjectOwnerOrContributorReadOnly,
                           IsIssueOwnerOrContributorReadOnly,
                           IsCommentOwnerOrContributorReadOnly)
-from .serializers import CommentSerializer, IssueSerializer, UserSerializer, ContributorSerializer, ProjectSerializer
+from .querysets import bulk_create_with_ids, iterate_in_chunks, optimize_queryset
+from .renderers import NDJSONRenderer, iter_json_array, iter_ndjson
+from .serializers import (CommentSerializer, IssueSerializer, UserSerializer, ContributorSerializer, ProjectSerializer,
+                          CommentBulkSerializer, IssueBulkSerializer, IssueSearchSerializer, ProjectSummarySerializer,
+                          ActivityLogSerializer, ChangesQuerySerializer, JobSerializer, RefreshSerializer,
+                          SignInSerializer)
+from .throttling import concurrency_limit
+
+
+class SparseFieldsMixin:
+    """
+    Pass the `fields` and `expand` query parameters of GET requests to the serializer.
+    List views render compact objects unless nested fields are asked for.
+    """
+    compact = False
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method == 'GET':
+            kwargs.setdefault('fields', self.request.query_params.get('fields'))
+            kwargs.setdefault('expand', self.request.query_params.get('expand'))
+            kwargs.setdefault('compact', self.compact)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_ordering_columns(self):
+        ordering = getattr(self.paginator, 'ordering', ())
+        ordering = (ordering,) if isinstance(ordering, str) else ordering
+        return [column.lstrip('-') for column in ordering]
+
+
+class ConditionalGetMixin:
+    """
+    ETag and Last-Modified on GET, validated by the version of the project: any change in the
+    project or in one of its children bumps it. A matching If-None-Match or If-Modified-Since
+    is answered 304 after one lookup of the version and the membership, before any serialization.
+    """
+    cache_payloads = False
+    validated = False
+    etag = None
+    last_modified = None
+    payload_key = None
+
+    def get_validators(self, request):
+        """
+        Return (key, last modified) of the resource, or None to skip the conditional handling.
+        """
+        member = Contributor.objects.filter(project_id=OuterRef('pk'), user=request.user)
+        row = (Project.objects.filter(id=self.kwargs['pk']).annotate(member=Exists(member))
+               .values_list('version', 'updated_time', 'member').first())
+        if row is None:
+            # Deleted, even if the membership cache of the process does not know it yet.
+            raise NotFound(f"Project with id '{self.kwargs['pk']}' doesn't exist.")
+        if not row[2]:
+            # Let the view raise the right error.
+            return None
+        return f"{self.kwargs['pk']}:{row[0]}", row[1]
+
+    def get_projects_validators(self, projects):
+        stats = projects.aggregate(count=Count('id'), ids=Sum('id'), version=Sum('version'),
+                                   updated=Max('updated_time'))
+        if not stats['count']:
+            return None
+        return f"{self.request.user.id}:{stats['count']}:{stats['ids']}:{stats['version']}", stats['updated']
+
+    def validate(self, request):
+        """
+        Compute the ETag and Last-Modified of the request, once.
+        """
+        if self.validated:
+            return
+        self.validated = True
+        validators = self.get_validators(request)
+        if validators is None:
+            return
+        key, updated = validators
+        key = f'{key}:{request.build_absolute_uri()}:{request.accepted_media_type}'
+        self.payload_key = hashlib.md5(key.encode()).hexdigest()
+        self.etag = f'W/"{self.payload_key}"'
+        self.last_modified = int(updated.timestamp())
+
+    def not_modified(self, request):
+        """
+        Return a 304 response if the client is up to date.
+        """
+        self.validate(request)
+        if self.etag is None:
+            return None
+        return get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+
+    def cached_payload(self, compute):
+        """
+        Return the data built by `compute`, shared by every contributor until the project changes.
+        """
+        if not self.cache_payloads or self.payload_key is None:
+            return compute()
+        return payload_cache.get_or_compute(self.payload_key, compute)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method == 'GET' and self.etag and response.status_code in (200, 304):
+            response['ETag'] = self.etag
+            response['Last-Modified'] = http_date(self.last_modified)
+        return response
 
 
-class CustomListMixin:
-    def get(self, request, is_comment=False, *args, **kwargs):
+class CustomListMixin(ConditionalGetMixin, SparseFieldsMixin):
+    renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + [NDJSONRenderer]
+    stream_chunk_size = 500
+    compact = True
+    # The membership, when the async view resolved it already.
+    contributor = None
+
+    def get(self, request, *args, **kwargs):
+        not_modified = self.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        if 'issue_id' in self.kwargs:
+            contributor = resolve_membership(request.user, self.kwargs['pk'], self.kwargs['issue_id']).contributor
+        else:
+            contributor = self.contributor or resolve_contributor(request.user, self.kwargs['pk'])
+        self.check_object_permissions(request, contributor)
+        serializer = self.get_serializer()
+        queryset = optimize_queryset(self.get_queryset(), serializer, self.get_ordering_columns())
+        if request.accepted_renderer.format == 'ndjson' or request.query_params.get('stream') in ('1', 'true'):
+            return self.stream(request, queryset, serializer)
+        return Response(self.cached_payload(lambda: self.get_page_data(queryset)))
+
+    def get_page_data(self, queryset):
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data).data
+
+    def stream(self, request, queryset, serializer):
+        """
+        Send every row of the queryset without pagination, serialized one by one.
+        """
+        rows = (serializer.to_representation(obj) for obj in iterate_in_chunks(queryset, self.stream_chunk_size))
+        if request.accepted_renderer.format == 'ndjson':
+            return StreamingHttpResponse(iter_ndjson(rows), content_type=NDJSONRenderer.media_type)
+        return StreamingHttpResponse(iter_json_array(rows), content_type='application/json')
+
+
+class ConcurrencyLimitMixin:
+    """
+    Serve at most CONCURRENCY_LIMITS[concurrency_scope] requests of the view at once, the others
+    are answered 429 with a Retry-After.
+    """
+    concurrency_scope = None
+    admission = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.admission = concurrency_limit.acquire(self.concurrency_scope)
+
+    def release_admission(self):
+        if self.admission is not None:
+            self.admission.release()
+            self.admission = None
+
+    def handle_exception(self, exc):
         try:
-            project = Project.objects.get(id=self.kwargs['pk'])
-            user = Contributor.objects.get(project=project, user=request.user)
-        except Project.DoesNotExist:
-            return Response({"detail": f"Project with id '{self.kwargs['pk']}' doesn't exist."},
-                            status=status.HTTP_404_NOT_FOUND)
-        except Contributor.DoesNotExist:
-            return Response({"detail": "You are not collaborate on this project."},
-                            status=status.HTTP_404_NOT_FOUND)
+            return super().handle_exception(exc)
+        except Exception:
+            # Uncaught, finalize_response is not called.
+            self.release_admission()
+            raise
 
-        if is_comment:
-            try:
-                Issue.objects.get(id=self.kwargs['issue_id'])
-            except Issue.DoesNotExist:
-                return Response({"detail": f"Issue with id '{self.kwargs['issue_id']}' doesn't exist."})
+    def finalize_response(self, request, response, *args, **kwargs):
+        try:
+            return super().finalize_response(request, response, *args, **kwargs)
+        finally:
+            self.release_admission()
 
-        self.check_object_permissions(request, user)
-        serializer = self.serializer_class(self.get_queryset(), many=True)
+
+class BulkMixin(ConcurrencyLimitMixin):
+    """
+    POST creates, PATCH updates and DELETE removes a list of objects. The payloads are validated
+    in one pass and written in one transaction; if any item is invalid nothing is written and
+    the errors are returned per item.
+    """
+    batch_size = 500
+    throttle_scope = 'bulk'
+    concurrency_scope = 'bulk'
+    not_author_message = "You're not the author."
+
+    def get_parent(self, request):
+        """
+        Check the membership and return the fields shared by every created object.
+        """
+        raise NotImplementedError
+
+    def resolve_relations(self, request, items, errors):
+        pass
+
+    def build(self, request, data, parent):
+        return self.get_queryset().model(**parent, **data)
+
+    def bulk_created(self, objs):
+        """
+        Hook for the side effects the model signals would have run on each save.
+        """
+
+    def bulk_updated(self, objs):
+        pass
+
+    def bulk_delete(self, objs):
+        with transaction.atomic():
+            self.get_queryset().filter(id__in=[obj.id for obj in objs]).delete()
+
+    def validate_items(self, request, partial=False):
+        if not isinstance(request.data, list):
+            raise ValidationError({'detail': 'Expected a list of items.'})
+        items, errors = [], []
+        for data in request.data:
+            serializer = self.get_serializer(data=data, partial=partial)
+            serializer.is_valid()
+            items.append(dict(serializer.validated_data))
+            errors.append(dict(serializer.errors))
+        self.resolve_relations(request, items, errors)
+        return items, errors
+
+    def get_objects(self, request, ids, errors):
+        """
+        Fetch the objects to modify in one query, and report the missing or not owned ones.
+        """
+        objects = self.get_queryset().in_bulk([pk for pk in ids if pk is not None])
+        for index, pk in enumerate(ids):
+            if pk is None:
+                errors[index].setdefault('id', ['This field is required.'])
+            elif pk not in objects:
+                errors[index].setdefault('id', [f"Object with id '{pk}' doesn't exist."])
+            elif objects[pk].author_id != request.user.id:
+                errors[index].setdefault('detail', self.not_author_message)
+        return objects
+
+    def error_response(self, errors):
+        return Response([{'index': index, 'errors': item_errors}
+                         for index, item_errors in enumerate(errors) if item_errors],
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    def post(self, request, *args, **kwargs):
+        parent = self.get_parent(request)
+        items, errors = self.validate_items(request)
+        if any(errors):
+            return self.error_response(errors)
+        for data in items:
+            data.pop('id', None)
+        objs = [self.build(request, data, parent) for data in items]
+        with transaction.atomic():
+            bulk_create_with_ids(self.get_queryset().model, objs, batch_size=self.batch_size)
+            self.bulk_created(objs)
+            versions.bump_project(self.kwargs['pk'])
+        serializer = self.get_serializer(objs, many=True)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def patch(self, request, *args, **kwargs):
+        self.get_parent(request)
+        items, errors = self.validate_items(request, partial=True)
+        ids = [data.pop('id', None) for data in items]
+        objects = self.get_objects(request, ids, errors)
+        seen = set()
+        for index, pk in enumerate(ids):
+            if pk in seen:
+                errors[index].setdefault('id', [f"Duplicate id '{pk}'."])
+            seen.add(pk)
+        if any(errors):
+            return self.error_response(errors)
+
+        objs, fields, now = [], set(), timezone.now()
+        for pk, data in zip(ids, items):
+            obj = objects[pk]
+            for attr, value in data.items():
+                setattr(obj, attr, value)
+            obj.updated_time = now
+            fields.update(data)
+            objs.append(obj)
+        if fields:
+            with transaction.atomic():
+                self.get_queryset().model.objects.bulk_update(objs, fields | {'updated_time'},
+                                                              batch_size=self.batch_size)
+                self.bulk_updated(objs)
+                versions.bump_project(self.kwargs['pk'])
+        serializer = self.get_serializer(objs, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def delete(self, request, *args, **kwargs):
+        self.get_parent(request)
+        ids = serializers.ListField(child=serializers.IntegerField()).run_validation(request.data)
+        errors = [{} for _ in ids]
+        objects = self.get_objects(request, ids, errors)
+        if any(errors):
+            return self.error_response(errors)
+        self.bulk_delete([objects[pk] for pk in dict.fromkeys(ids)])
+        return Response({'detail': f'{len(ids)} objects deleted successfully'},
+                        status=status.HTTP_204_NO_CONTENT)
+
 
 class ContributorList(CustomListMixin, mixins.CreateModelMixin, generics.GenericAPIView):
     serializer_class = ContributorSerializer
@@ -43,31 +332,23 @@ class ContributorList(CustomListMixin, mixins.CreateModelMixin, generics.Generic
         return Contributor.objects.filter(project_id=self.kwargs['pk'])
 
     def post(self, request, *args, **kwargs):
+        membership = resolve_membership(request.user, self.kwargs['pk'])
+        project = membership.project
         try:
             new_contributor = User.objects.get(username=request.data['username'])
-            project = Project.objects.get(id=self.kwargs['pk'])
-        except Project.DoesNotExist:
-            return Response({"detail": f"Project with id '{self.kwargs['pk']}' doesn't exist."},
-                            status=status.HTTP_404_NOT_FOUND)
         except User.DoesNotExist:
             return Response({"detail": f"Username '{request.data['username']}' doesn't exist."},
                             status=status.HTTP_404_NOT_FOUND)
 
-        contributor = Contributor.objects.filter(user=new_contributor, project=project).exists()
-        if contributor:
+        contributor = Contributor(user=new_contributor, project=project, role='contributor')
+        self.check_object_permissions(request, membership.contributor)
+        try:
+            with transaction.atomic():
+                contributor.save()
+        except IntegrityError:
             return Response({'detail': f"{new_contributor.username} already contribute \
                             to the project '{project.title}'."},
                             status=status.HTTP_409_CONFLICT)
-
-        try:
-            user = Contributor.objects.get(project=project, user=request.user)
-        except Contributor.DoesNotExist:
-            return Response({"detail": "You are not collaborate on this project."},
-                            status=status.HTTP_404_NOT_FOUND)
-
-        contributor = Contributor(user=new_contributor, project=project, role='contributor')
-        self.check_object_permissions(request, user)
-        contributor.save()
         serializer = self.serializer_class(contributor)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -82,24 +363,14 @@ class ContributorDetail(mixins.DestroyModelMixin, generics.GenericAPIView):
 
     def delete(self, request, *args, **kwargs):
         # Verifier si c'est bien fini, normalement oui
-        try:
-            project = Project.objects.get(id=self.kwargs['pk'])
-            user = Contributor.objects.get(user=request.user, project=project)
-            author = Contributor.objects.filter(project=project).filter(role='author')[0]
-        except Contributor.DoesNotExist:
-            return Response({"detail": "You are not collaborate on this project."},
-                            status=status.HTTP_404_NOT_FOUND)
-
-        except Project.DoesNotExist:
-            return Response({'detail': "This project doesn't exist."},
-                            status=status.HTTP_404_NOT_FOUND)
+        user = resolve_contributor(request.user, self.kwargs['pk'], check_project=True)
         try:
             del_contributor = Contributor.objects.get(user_id=self.kwargs['user_id'], project_id=self.kwargs['pk'])
         except Contributor.DoesNotExist:
             return Response({"detail": "This contributor doesn't exist in this project."},
                             status=status.HTTP_404_NOT_FOUND)
 
-        if user == author and author == del_contributor:
+        if user == del_contributor and user.role == 'author':
             return Response({"detail": "Can't delete the author of this project."})
         self.check_object_permissions(request, user)
         del_contributor.delete()
@@ -118,12 +389,46 @@ class UserRegister(mixins.CreateModelMixin, generics.GenericAPIView):
         return self.create(request, *args, **kwargs)
 
 
-class ProjectList(mixins.ListModelMixin, mixins.CreateModelMixin, generics.GenericAPIView):
+class SignIn(TokenObtainPairView):
+    serializer_class = SignInSerializer
+
+
+class TokenRefresh(TokenRefreshView):
+    serializer_class = RefreshSerializer
+
+
+class SignOut(generics.GenericAPIView):
+    """
+    Revoke the access token of the request, and the refresh token given in the body if any.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        tokens.revoke(request.auth)
+        if request.data.get('refresh'):
+            try:
+                tokens.revoke(RefreshToken(request.data['refresh']))
+            except TokenError as exc:
+                raise InvalidToken(exc.args[0])
+        return Response({'detail': 'signed out successfully'}, status=status.HTTP_204_NO_CONTENT)
+
+
+class ProjectList(ConditionalGetMixin, SparseFieldsMixin, mixins.ListModelMixin, mixins.CreateModelMixin,
+                  generics.GenericAPIView):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'projects'
+    compact = True
+
+    def get_validators(self, request):
+        return self.get_projects_validators(Project.objects.filter(contributors__user=request.user,
+                                                                   contributors__role='author'))
 
     def get(self, request, *args, **kwargs):
+        not_modified = self.not_modified(request)
+        if not_modified is not None:
+            return not_modified
         return self.list(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
@@ -134,9 +439,11 @@ class ProjectList(mixins.ListModelMixin, mixins.CreateModelMixin, generics.Gener
         Retrieve all project on the user logged, is DONE.
         """
         projects_id = Contributor.objects.filter(user=request.user, role='author').values_list('project_id', flat=True)
-        projects = Project.objects.filter(id__in=projects_id)
-        serializer = self.serializer_class(projects, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        projects = optimize_queryset(Project.objects.filter(id__in=projects_id), self.get_serializer(),
+                                     self.get_ordering_columns())
+        page = self.paginate_queryset(projects)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def create(self, request, *args, **kwargs):
         """
@@ -150,226 +457,402 @@ class ProjectList(mixins.ListModelMixin, mixins.CreateModelMixin, generics.Gener
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class ProjectDetail(mixins.RetrieveModelMixin,
+class ProjectSummaryList(ConditionalGetMixin, mixins.ListModelMixin, generics.GenericAPIView):
+    """
+    Counters of every project the user contributes to, read from the denormalized columns only.
+    """
+    serializer_class = ProjectSummarySerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        fields = [field for field in self.serializer_class.Meta.fields if field != 'open_issue_count']
+        return Project.objects.filter(contributors__user=self.request.user).only(*fields)
+
+    def get_validators(self, request):
+        return self.get_projects_validators(Project.objects.filter(contributors__user=request.user))
+
+    def get(self, request, *args, **kwargs):
+        not_modified = self.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        return self.list(request, *args, **kwargs)
+
+
+class ProjectDetail(ConcurrencyLimitMixin,
+                    ConditionalGetMixin,
+                    SparseFieldsMixin,
+                    mixins.RetrieveModelMixin,
                     mixins.UpdateModelMixin,
                     mixins.DestroyModelMixin,
                     generics.GenericAPIView):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     permission_classes = [IsAuthenticated, IsProjectOwnerOrContributorReadOnly]
+    throttle_scope = 'projects'
+    concurrency_scope = 'project'
+    cache_payloads = True
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            # save() only writes the loaded fields: updated_time must not be deferred.
+            return queryset
+        return optimize_queryset(queryset, self.get_serializer())
 
     def get_project_or_error(self, request):
-        try:
-            project = Project.objects.get(id=self.kwargs['pk'])
-            user = Contributor.objects.get(user=request.user, project=project)
-        except Contributor.DoesNotExist:
-            return Response({"detail": "You are not collaborate on this project."},
-                            status=status.HTTP_404_NOT_FOUND)
-        except Project.DoesNotExist:
-            return Response({'detail': "This project doesn't exist."},
-                            status=status.HTTP_404_NOT_FOUND)
-        self.check_object_permissions(request, user)
-        return project
+        membership = resolve_membership(request.user, self.kwargs['pk'], queryset=self.get_queryset())
+        self.check_object_permissions(request, membership.contributor)
+        return membership.project
 
     def get(self, request, *args, **kwargs):
-        project_or_error = self.get_project_or_error(request)
-        if isinstance(project_or_error, Response):
-            return project_or_error
-        serializer = self.serializer_class(project_or_error)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        not_modified = self.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        data = self.cached_payload(lambda: self.get_serializer(self.get_project_or_error(request)).data)
+        return Response(data, status=status.HTTP_200_OK)
 
     def put(self, request, *args, **kwargs):
-        project_or_error = self.get_project_or_error(request)
-        if isinstance(project_or_error, Response):
-            return project_or_error
-        serializer = self.serializer_class(project_or_error, data=request.data)
+        project = self.get_project_or_error(request)
+        serializer = self.serializer_class(project, data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def delete(self, request, *args, **kwargs):
-        project_or_error = self.get_project_or_error(request)
-        if isinstance(project_or_error, Response):
-            return project_or_error
-        project_or_error.delete()
-        return Response({'detail': 'project deleled successfully'}, status=status.HTTP_204_NO_CONTENT)
+        """
+        The project disappears at once; a background job purges it: answer 202 with the job to poll.
+        """
+        project = self.get_project_or_error(request)
+        job = deletion.soft_delete_project(project, request.user)
+        return Response({'detail': 'project deletion accepted', 'job': JobSerializer(job).data},
+                        status=status.HTTP_202_ACCEPTED, headers={'Location': f'/api/v1/jobs/{job.id}'})
+
+
+class ProjectExport(generics.GenericAPIView):
+    """
+    The project with its contributors, issues and comments as a gzip NDJSON archive, streamed
+    with bounded memory, see api.archive.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'projects'
+
+    def get(self, request, *args, **kwargs):
+        resolve_contributor(request.user, self.kwargs['pk'], check_project=True)
+        response = StreamingHttpResponse(archive.export_project(self.kwargs['pk']), content_type=archive.MEDIA_TYPE)
+        response['Content-Disposition'] = f'attachment; filename="project-{self.kwargs["pk"]}.ndjson.gz"'
+        return response
+
+
+class ProjectImport(ConcurrencyLimitMixin, generics.GenericAPIView):
+    """
+    Create a project from the archive of ProjectExport sent as the body, or from its plain NDJSON
+    with the application/x-ndjson content type. The user becomes the author of the project.
+    """
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'projects'
+    concurrency_scope = 'bulk'
+
+    def post(self, request, *args, **kwargs):
+        compressed = request.content_type.split(';')[0].strip() != 'application/x-ndjson'
+        importer = archive.Importer(request.user)
+        project = importer.run(archive.read_records(request.stream, compressed))
+        return Response({'id': project.id, **importer.counts}, status=status.HTTP_201_CREATED)
 
 
 class IssueList(CustomListMixin, mixins.CreateModelMixin, generics.GenericAPIView):
     serializer_class = IssueSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'issues'
+    pagination_class = CreatedTimeCursorPagination
+    cache_payloads = True
 
     def get_queryset(self):
         return Issue.objects.filter(project_id=self.kwargs['pk'])
 
     def post(self, request, *args, **kwargs):
-        try:
-            project = Project.objects.get(id=self.kwargs['pk'])
-            user = Contributor.objects.get(project=project, user=request.user)
-        except Project.DoesNotExist:
-            return Response({"detail": f"Project with id '{self.kwargs['pk']}' doesn't exist."},
-                            status=status.HTTP_404_NOT_FOUND)
-        except Contributor.DoesNotExist:
-            return Response({"detail": "You are not collaborate on this project."},
-                            status=status.HTTP_404_NOT_FOUND)
-
-        print(request.data)
+        contributor = resolve_contributor(request.user, self.kwargs['pk'], check_project=True)
         if request.data['assigned']:
-            try:
-                assigned = User.objects.get(username=request.data['assigned'])
-                Contributor.objects.get(user=assigned, project=project)
-            except User.DoesNotExist:
-                return Response({"detail": f"User with username '{request.data['assigned']}' doesn't exist. "},
-                                status=status.HTTP_404_NOT_FOUND)
-            except Contributor.DoesNotExist:
-                return Response({"detail": "The assigned user doesn't contribute to the project."},
-                                status=status.HTTP_404_NOT_FOUND)
+            assigned = resolve_assigned(self.kwargs['pk'], request.data['assigned'])
         else:
             assigned = request.user
 
-        self.check_object_permissions(request, user)
+        self.check_object_permissions(request, contributor)
         serializer = self.serializer_class(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save(project=project, author=request.user, assigned=assigned)
+        serializer.save(project_id=contributor.project_id, author=request.user, assigned=assigned)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class IssueDetail(mixins.RetrieveModelMixin,
+class IssueBulk(BulkMixin, generics.GenericAPIView):
+    serializer_class = IssueBulkSerializer
+    permission_classes = [IsAuthenticated]
+    not_author_message = IsIssueOwnerOrContributorReadOnly.message
+
+    def get_queryset(self):
+        return Issue.objects.filter(project_id=self.kwargs['pk']).select_related('assigned')
+
+    def get_parent(self, request):
+        resolve_contributor(request.user, self.kwargs['pk'], check_project=True)
+        return {'project_id': self.kwargs['pk']}
+
+    def resolve_relations(self, request, items, errors):
+        """
+        Replace the assigned usernames by users, with a single query for the whole list.
+        """
+        usernames = {data['assigned']['username'] for data in items if data.get('assigned', {}).get('username')}
+        users = {contributor.user.username: contributor.user for contributor in
+                 Contributor.objects.filter(project_id=self.kwargs['pk'], user__username__in=usernames)
+                 .select_related('user')}
+        for data, item_errors in zip(items, errors):
+            if 'assigned' not in data:
+                continue
+            username = data.pop('assigned').get('username')
+            if not username:
+                continue
+            if username in users:
+                data['assigned'] = users[username]
+            else:
+                item_errors['assigned'] = ["The assigned user doesn't contribute to the project."]
+
+    def build(self, request, data, parent):
+        data.setdefault('assigned', request.user)
+        return super().build(request, data, {**parent, 'author': request.user})
+
+    def bulk_created(self, objs):
+        counters.issues_created(objs)
+        search.index_objects(objs)
+        activity.record(self.kwargs['pk'], objs, 'created')
+
+    def bulk_updated(self, objs):
+        counters.issues_updated(objs)
+        search.index_objects(objs)
+        activity.record(self.kwargs['pk'], objs, 'updated')
+
+    def bulk_delete(self, objs):
+        deletion.soft_delete_issues(objs, self.request.user)
+
+
+class IssueSearch(ConcurrencyLimitMixin, ConditionalGetMixin, SparseFieldsMixin, generics.GenericAPIView):
+    """
+    Full text search in the issues of a project and in their comments, best match first.
+    """
+    serializer_class = IssueSerializer
+    permission_classes = [IsAuthenticated]
+    concurrency_scope = 'search'
+    compact = True
+
+    def get(self, request, *args, **kwargs):
+        not_modified = self.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        resolve_contributor(request.user, self.kwargs['pk'])
+        params = IssueSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+        filters = {field: params[field] for field in search.FILTERS if field in params}
+        if 'assigned' in params:
+            filters['assigned_id'] = resolve_assigned(self.kwargs['pk'], params['assigned']).id
+
+        offset, page_size = params['offset'], params['page_size']
+        hits = search.search_issues(self.kwargs['pk'], params['q'], filters, limit=page_size + 1, offset=offset)
+        scores = dict(hits[:page_size])
+        serializer = self.get_serializer()
+        issues = optimize_queryset(Issue.objects.filter(id__in=scores), serializer).in_bulk()
+        results = []
+        for issue_id, score in hits[:page_size]:
+            results.append({**serializer.to_representation(issues[issue_id]), 'score': score})
+
+        url = request.build_absolute_uri()
+        return Response({
+            'next': replace_query_param(url, 'offset', offset + page_size) if len(hits) > page_size else None,
+            'previous': replace_query_param(url, 'offset', max(offset - page_size, 0)) if offset else None,
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
+
+class ChangeList(generics.GenericAPIView):
+    """
+    Changes of the issues, comments and contributors of a project after the sequence number
+    `since`, oldest first. Clients keep the returned `cursor` and sync from it next time; a
+    410 means the changes they miss were pruned and the project must be downloaded again.
+    """
+    serializer_class = ActivityLogSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        resolve_contributor(request.user, self.kwargs['pk'])
+        params = ChangesQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        since, limit = params.validated_data['since'], params.validated_data['limit']
+        horizon = Project.objects.filter(id=self.kwargs['pk']).values_list('activity_horizon', flat=True).first()
+        if horizon is None:
+            raise NotFound(f"Project with id '{self.kwargs['pk']}' doesn't exist.")
+        if since < horizon:
+            return Response({'detail': f"Changes before {horizon} were pruned, download the project again."},
+                            status=status.HTTP_410_GONE)
+
+        rows = activity.changes(self.kwargs['pk'], since, limit + 1)
+        serializer = self.get_serializer(rows[:limit], many=True)
+        return Response({
+            'cursor': rows[:limit][-1].id if rows else since,
+            'has_more': len(rows) > limit,
+            'changes': serializer.data,
+        }, status=status.HTTP_200_OK)
+
+
+class JobDetail(generics.GenericAPIView):
+    """
+    Status of a background job queued by the user, see api.jobs.
+    """
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        job = Job.objects.filter(id=self.kwargs['job_id'], user=request.user).first()
+        if job is None:
+            raise NotFound(f"Job with id '{self.kwargs['job_id']}' doesn't exist.")
+        return Response(self.get_serializer(job).data, status=status.HTTP_200_OK)
+
+
+class IssueDetail(ConditionalGetMixin,
+                  SparseFieldsMixin,
+                  mixins.RetrieveModelMixin,
                   mixins.UpdateModelMixin,
                   mixins.DestroyModelMixin,
                   generics.GenericAPIView):
     queryset = Issue.objects.all()
     serializer_class = IssueSerializer
     permission_classes = [IsAuthenticated, IsIssueOwnerOrContributorReadOnly]
+    throttle_scope = 'issues'
 
-    def get_issue_or_error(self, request):
-        try:
-            project = Project.objects.get(id=self.kwargs['pk'])
-            Contributor.objects.get(user=request.user, project=project)
-            issue = Issue.objects.get(id=self.kwargs['issue_id'], project=project)
-        except Contributor.DoesNotExist:
-            return Response({"detail": "You are not collaborate on this project."}, status=status.HTTP_404_NOT_FOUND)
-        except Project.DoesNotExist:
-            return Response({'detail': "This project doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
-        except Issue.DoesNotExist:
-            return Response({"detail": "This issue doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return optimize_queryset(queryset, self.get_serializer())
 
+    def get_issue_or_error(self, request):
+        issue = resolve_membership(request.user, self.kwargs['pk'], self.kwargs['issue_id'],
+                                   queryset=self.get_queryset()).issue
         self.check_object_permissions(request, issue)
         return issue
 
     def get(self, request, *args, **kwargs):
-        issue_or_error = self.get_issue_or_error(request)
-        if isinstance(issue_or_error, Response):
-            return issue_or_error
-        serializer = self.serializer_class(issue_or_error)
+        not_modified = self.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        issue = self.get_issue_or_error(request)
+        serializer = self.get_serializer(issue)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def put(self, request, *args, **kwargs):
-        issue_or_error = self.get_issue_or_error(request)
-        if isinstance(issue_or_error, Response):
-            return issue_or_error
+        issue = self.get_issue_or_error(request)
         if request.data['assigned']:
-            try:
-                assigned = User.objects.get(username=request.data['assigned'])
-                project = Project.objects.get(id=self.kwargs['pk'])
-                Contributor.objects.get(user=assigned, project=project)
-            except User.DoesNotExist:
-                return Response({"detail": f"User with username '{request.data['assigned']}' doesn't exist. "},
-                                status=status.HTTP_404_NOT_FOUND)
-            except Contributor.DoesNotExist:
-                return Response({"detail": "The assigned user doesn't contribute to the project."},
-                                status=status.HTTP_404_NOT_FOUND)
+            assigned = resolve_assigned(self.kwargs['pk'], request.data['assigned'])
         else:
-            assigned = issue_or_error.assigned
-        serializer = self.serializer_class(issue_or_error, data=request.data)
+            assigned = issue.assigned
+        serializer = self.serializer_class(issue, data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save(assigned=assigned)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def delete(self, request, *args, **kwargs):
-        issue_or_error = self.get_issue_or_error(request)
-        if isinstance(issue_or_error, Response):
-            return issue_or_error
-        issue_or_error.delete()
+        issue = self.get_issue_or_error(request)
+        deletion.soft_delete_issues([issue], request.user)
         return Response({'detail': 'issue deleled successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 
 class CommentList(CustomListMixin, mixins.CreateModelMixin, generics.GenericAPIView):
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'comments'
+    pagination_class = CreatedTimeCursorPagination
+    cache_payloads = True
 
     def get_queryset(self):
         return Comment.objects.filter(issue_id=self.kwargs['issue_id'])
 
-    def get(self, request, *args, **kwargs):
-        return super().get(request, is_comment=True, *args, **kwargs)
-
     def post(self, request, *args, **kwargs):
-        try:
-            project = Project.objects.get(id=self.kwargs['pk'])
-            user = Contributor.objects.get(project=project, user=request.user)
-            issue = Issue.objects.get(project=project, id=self.kwargs['issue_id'])
-        except Project.DoesNotExist:
-            return Response({"detail": f"Project with id '{self.kwargs['pk']}' doesn't exist."},
-                            status=status.HTTP_404_NOT_FOUND)
-        except Contributor.DoesNotExist:
-            return Response({"detail": "You are not collaborate on this project."},
-                            status=status.HTTP_404_NOT_FOUND)
-        except Issue.DoesNotExist:
-            return Response({"detail": f"Issue with id '{self.kwargs['issue_id']}' doesn't exist."})
-
-        self.check_object_permissions(request, user)
+        membership = resolve_membership(request.user, self.kwargs['pk'], self.kwargs['issue_id'])
+        self.check_object_permissions(request, membership.contributor)
         serializer = self.serializer_class(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save(author=request.user, issue=issue)
+        serializer.save(author=request.user, issue=membership.issue)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class CommentDetail(mixins.RetrieveModelMixin,
+class CommentBulk(BulkMixin, generics.GenericAPIView):
+    serializer_class = CommentBulkSerializer
+    permission_classes = [IsAuthenticated]
+    not_author_message = IsCommentOwnerOrContributorReadOnly.message
+
+    def get_queryset(self):
+        return Comment.objects.filter(issue_id=self.kwargs['issue_id'], issue__project_id=self.kwargs['pk'])
+
+    def get_parent(self, request):
+        resolve_membership(request.user, self.kwargs['pk'], self.kwargs['issue_id'])
+        return {'issue_id': self.kwargs['issue_id'], 'author': request.user}
+
+    def bulk_created(self, objs):
+        counters.comments_changed(self.kwargs['issue_id'], len(objs))
+        search.index_objects(objs, project_id=self.kwargs['pk'])
+        activity.record(self.kwargs['pk'], objs, 'created')
+
+    def bulk_updated(self, objs):
+        search.index_objects(objs, project_id=self.kwargs['pk'])
+        activity.record(self.kwargs['pk'], objs, 'updated')
+
+    def bulk_delete(self, objs):
+        # One DELETE without the per-row signals, their side effects applied once for the list.
+        ids = [obj.id for obj in objs]
+        with transaction.atomic():
+            comments = Comment.objects.filter(id__in=ids)
+            comments._raw_delete(comments.db)
+            counters.comments_changed(self.kwargs['issue_id'], -len(ids))
+            search.unindex_ids(comment_ids=ids)
+            activity.record(self.kwargs['pk'], objs, 'deleted')
+            versions.bump_project(self.kwargs['pk'])
+
+
+class CommentDetail(ConditionalGetMixin,
+                    SparseFieldsMixin,
+                    mixins.RetrieveModelMixin,
                     mixins.UpdateModelMixin,
                     mixins.DestroyModelMixin,
                     generics.GenericAPIView):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated, IsCommentOwnerOrContributorReadOnly]
+    throttle_scope = 'comments'
 
-    def get_comment_or_error(self, request):
-        try:
-            project = Project.objects.get(id=self.kwargs['pk'])
-            Contributor.objects.get(user=request.user, project=project)
-            issue = Issue.objects.get(id=self.kwargs['issue_id'], project=project)
-            comment = Comment.objects.get(id=self.kwargs['comment_id'], issue=issue)
-        except Contributor.DoesNotExist:
-            return Response({"detail": "You are not collaborate on this project."}, status=status.HTTP_404_NOT_FOUND)
-        except Project.DoesNotExist:
-            return Response({'detail': "This project doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
-        except Issue.DoesNotExist:
-            return Response({"detail": "This issue doesn't exist."}, status=status.HTTP_404_NOT_FOUND)
-        except Comment.DoesNotExist:
-            return Response({"detail": "This comment does't exist."}, status=status.HTTP_404_NOT_FOUND)
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return optimize_queryset(queryset, self.get_serializer())
 
+    def get_comment_or_error(self, request):
+        comment = resolve_membership(request.user, self.kwargs['pk'], self.kwargs['issue_id'],
+                                     self.kwargs['comment_id'], queryset=self.get_queryset()).comment
         self.check_object_permissions(request, comment)
         return comment
 
     def get(self, request, *args, **kwargs):
-        comment_or_error = self.get_comment_or_error(request)
-        if isinstance(comment_or_error, Response):
-            return comment_or_error
-        serializer = self.serializer_class(comment_or_error)
+        not_modified = self.not_modified(request)
+        if not_modified is not None:
+            return not_modified
+        comment = self.get_comment_or_error(request)
+        serializer = self.get_serializer(comment)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def put(self, request, *args, **kwargs):
-        comment_or_error = self.get_comment_or_error(request)
-        if isinstance(comment_or_error, Response):
-            return comment_or_error
-        serializer = self.serializer_class(comment_or_error, data=request.data)
+        comment = self.get_comment_or_error(request)
+        serializer = self.serializer_class(comment, data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     def delete(self, request, *args, **kwargs):
-        comment_or_error = self.get_comment_or_error(request)
-        if isinstance(comment_or_error, Response):
-            return comment_or_error
-        comment_or_error.delete()
+        comment = self.get_comment_or_error(request)
+        comment.delete()
         return Response({"detail": "comment deleted successfully"}, status=status.HTTP_204_NO_CONTENT)
@@ -2,6 +2,7 @@
 ASGI config for softdesk project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with an ASGI server, for instance ``uvicorn softdesk.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -9,8 +10,51 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'softdesk.settings')
 
-application = get_asgi_application()
+
+class AsyncReadsASGIHandler(ASGIHandler):
+    """
+    Resolve the requests with softdesk.asgi_urls, where the read endpoints are coroutines.
+    """
+
+    async def get_response_async(self, request):
+        request.urlconf = 'softdesk.asgi_urls'
+        return await super().get_response_async(request)
+
+    async def send_response(self, response, send):
+        """
+        Django 3.2 iterates a streaming response in the event loop, where the generators reading
+        the database may not run: pull the parts from one thread instead, the one of the other
+        blocking calls of the request, and send them before the closing message.
+        """
+        if not response.streaming:
+            return await super().send_response(response, send)
+        parts = iter(response.streaming_content)
+        response.streaming_content = ()
+        next_part = sync_to_async(next, thread_sensitive=True)
+        done = object()
+
+        async def send_with_parts(message):
+            if message['type'] == 'http.response.body':
+                part = await next_part(parts, done)
+                while part is not done:
+                    for chunk, _ in self.chunk_bytes(part):
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    part = await next_part(parts, done)
+            await send(message)
+
+        await super().send_response(response, send_with_parts)
+
+
+django.setup(set_prefix=False)
+django_application = AsyncReadsASGIHandler()
+
+# Server-Sent Events of the projects, served outside of the Django request cycle.
+from api.sse import EventStreamApp  # noqa: E402
+
+application = EventStreamApp(django_application)
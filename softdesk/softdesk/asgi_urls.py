@@ -0,0 +1,14 @@
+"""
+URL configuration of the ASGI application: softdesk.urls with the async read views of the API.
+"""
+from django.contrib import admin
+from django.urls import path, include
+
+from api.metrics import metrics_view
+
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/v1/', include('api.async_urls')),
+    path('metrics', metrics_view),
+]
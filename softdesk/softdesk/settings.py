@@ -1,5 +1,10 @@
 import datetime
+import importlib.util
+import os
 from pathlib import Path
+from urllib.parse import unquote, urlsplit
+
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -16,6 +21,9 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+# The revoked tokens (sign out, new password, deactivated or deleted user) are kept in the
+# default cache when it is shared by the processes (REDIS_URL), in the database otherwise, at
+# the cost of one query per authenticated request: see api.tokens.
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': datetime.timedelta(minutes=60),
 }
@@ -34,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,8 +54,111 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
   'DEFAULT_AUTHENTICATION_CLASSES': (
-    'rest_framework_simplejwt.authentication.JWTAuthentication',
+    'api.authentication.ClaimsJWTAuthentication',
+  ),
+  'DEFAULT_PAGINATION_CLASS': 'api.pagination.IdCursorPagination',
+  'PAGE_SIZE': 50,
+  # Token buckets of 'num/period' requests, see api.throttling: per client address before
+  # signing in, per user, per project, and per user on the writes of each `throttle_scope`.
+  'DEFAULT_THROTTLE_CLASSES': (
+    'api.throttling.AnonRateThrottle',
+    'api.throttling.UserRateThrottle',
+    'api.throttling.ProjectRateThrottle',
+    'api.throttling.EndpointRateThrottle',
   ),
+  'DEFAULT_THROTTLE_RATES': {
+    'anon': os.environ.get('THROTTLE_ANON', '60/min'),
+    'user': os.environ.get('THROTTLE_USER', '1200/min'),
+    'project': os.environ.get('THROTTLE_PROJECT', '3000/min'),
+    'projects': '30/min',
+    'issues': '120/min',
+    'comments': '240/min',
+    'bulk': '20/min',
+  },
+}
+
+# Per route metrics served at /metrics, see api.metrics. SAMPLE_RATE is the share of the requests
+# whose queries and serialization are profiled; SERVER_TIMING adds the Server-Timing header to
+# them; TOKEN, when set, is required as a Bearer token to read /metrics.
+METRICS = {
+    'SAMPLE_RATE': float(os.environ.get('METRICS_SAMPLE_RATE', 0.1)),
+    'SERVER_TIMING': DEBUG or os.environ.get('METRICS_SERVER_TIMING') == '1',
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+}
+
+# Requests of a `concurrency_scope` served at once per process: the full serialization of a
+# project, the search and the bulk writes. Over it, 429 with Retry-After: CONCURRENCY_RETRY_AFTER.
+CONCURRENCY_LIMITS = {
+    'project': int(os.environ.get('CONCURRENCY_PROJECT', 8)),
+    'search': int(os.environ.get('CONCURRENCY_SEARCH', 4)),
+    'bulk': int(os.environ.get('CONCURRENCY_BULK', 2)),
+}
+CONCURRENCY_RETRY_AFTER = 1
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'payloads': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'payloads',
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('PAYLOAD_CACHE_MAX_ENTRIES', 1000))},
+    },
+}
+
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+    # Bounded by the maxmemory policy of the server.
+    CACHES['payloads'] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get('PAYLOAD_CACHE_URL', os.environ['REDIS_URL']),
+        'KEY_PREFIX': 'payloads',
+    }
+
+# (user, project) -> role cache used by the permission checks, see api.membership.MembershipCache.
+# Its invalidations reach the other processes through the default cache, when it is shared
+# (REDIS_URL). With the locmem cache, each process only keeps its entries `local_ttl` seconds.
+MEMBERSHIP_CACHE = {
+    'alias': 'default',
+    'maxsize': 10000,
+    'local_ttl': 5,
+    'timeout': 300,
+}
+
+# Broker of the real-time events of the projects, see api.events
+EVENTS = {
+    'BROKER': 'api.events.InMemoryBroker',
+    'OPTIONS': {'queue_size': 1000},
+    # Larger batches of changes are pushed by a background job, when the broker is shared.
+    'FAN_OUT_INLINE': 100,
+}
+
+# Background jobs, see api.jobs: run by `manage.py worker`, retried MAX_ATTEMPTS times, RETRY_DELAY
+# seconds apart and doubling; a job running longer than LEASE seconds is taken by another worker.
+JOBS = {
+    'QUEUE': 'api.jobs.DatabaseQueue',
+    'OPTIONS': {'poll_interval': 1},
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 10,
+    'LEASE': 300,
+}
+
+if os.environ.get('REDIS_URL'):
+    EVENTS = {
+        'BROKER': 'api.events.RedisBroker',
+        'OPTIONS': {'url': os.environ['REDIS_URL'], 'queue_size': 1000},
+        'FAN_OUT_INLINE': 100,
+    }
+    JOBS.update(QUEUE='api.jobs.RedisQueue', OPTIONS={'url': os.environ['REDIS_URL']})
+
+# Serialized project, issue list and comment list payloads, see api.payloads.PayloadCache
+PAYLOAD_CACHE = {
+    'alias': 'payloads',
+    'timeout': 300,
+    'lock_timeout': 10,
 }
 
 ROOT_URLCONF = 'softdesk.urls'
@@ -72,13 +184,98 @@ WSGI_APPLICATION = 'softdesk.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
+# DB_PROFILE picks the database:
+# - sqlite, the default: the settings of Django, no pragma: the database file keeps the journal
+#   mode it has;
+# - sqlite-tuned, for single node installs: WAL journal (the readers do not block the writer),
+#   synchronous=NORMAL, memory mapped reads, and the writers wait for each other up to
+#   SQLITE_TIMEOUT seconds instead of failing with "database is locked". Every atomic() block
+#   begins IMMEDIATE, so takes the write lock even when it only reads. Switching to it turns
+#   the database file to WAL mode for good, next to its -wal and -shm files: going back to
+#   the rollback journal takes a `PRAGMA journal_mode = delete` in `manage.py dbshell`;
+# - postgres: DATABASE_URL, with connections kept CONN_MAX_AGE seconds and checked before use;
+# - postgres-pooled: DATABASE_URL is a transaction pooler such as PgBouncer, which the
+#   server side cursors do not go through.
+
+DB_PROFILE = os.environ.get('DB_PROFILE', 'sqlite')
+
+
+def postgres_database(url):
+    url = urlsplit(url)
+    return {
+        'ENGINE': 'api.backends.postgresql',
+        'NAME': url.path.lstrip('/'),
+        'USER': unquote(url.username or ''),
+        'PASSWORD': unquote(url.password or ''),
+        'HOST': url.hostname or '',
+        'PORT': url.port or '',
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 600)),
+        'DISABLE_SERVER_SIDE_CURSORS': DB_PROFILE == 'postgres-pooled',
+        'OPTIONS': {'health_checks': True, 'connect_timeout': 5},
+    }
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+
+if DB_PROFILE in ('sqlite', 'sqlite-tuned'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'api.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
     }
+    if DB_PROFILE == 'sqlite-tuned':
+        DATABASES['default']['OPTIONS'] = {
+            'timeout': float(os.environ.get('SQLITE_TIMEOUT', 20)),
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'wal',
+                'synchronous': 'normal',
+                'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 2 ** 20)),
+                'cache_size': -64000,
+                'temp_store': 'memory',
+            },
+        }
+elif DB_PROFILE in ('postgres', 'postgres-pooled'):
+    DATABASES = {'default': postgres_database(os.environ['DATABASE_URL'])}
+else:
+    raise ImproperlyConfigured(f"Unknown DB_PROFILE '{DB_PROFILE}'.")
+
+# DATABASE_REPLICAS, comma separated: read replicas of the primary, as SQLite paths or URLs
+# according to DB_PROFILE. The reads of the requests go to one of them (REPLICA_SELECTION:
+# round-robin or least-loaded), except after a write of the client, see api.routers.
+
+DATABASE_REPLICAS = []
+for number, location in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), 1):
+    if DB_PROFILE.startswith('sqlite'):
+        replica = {**DATABASES['default'], 'NAME': location.strip()}
+    else:
+        replica = postgres_database(location.strip())
+    DATABASES[f'replica-{number}'] = {**replica, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica-{number}')
+
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+    MIDDLEWARE.insert(1, 'api.routers.ReadYourWritesMiddleware')
+REPLICA_SELECTION = os.environ.get('REPLICA_SELECTION', 'round-robin')
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/3.2/topics/auth/passwords/
+# The first hasher hashes the new passwords, the others verify the existing hashes, which are
+# upgraded on the next login. Argon2 and bcrypt need the argon2-cffi and bcrypt packages. The
+# hashes are computed in a pool of PASSWORD_HASHING_WORKERS processes, one per core by default.
+
+PASSWORD_HASHERS_BY_NAME = {
+    'argon2': 'api.hashers.PooledArgon2PasswordHasher',
+    'bcrypt': 'api.hashers.PooledBCryptSHA256PasswordHasher',
+    'pbkdf2': 'api.hashers.PooledPBKDF2PasswordHasher',
 }
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'argon2' if importlib.util.find_spec('argon2') else 'pbkdf2')
+PASSWORD_HASHERS = [PASSWORD_HASHERS_BY_NAME[PASSWORD_HASHER]] + [
+    hasher for name, hasher in PASSWORD_HASHERS_BY_NAME.items() if name != PASSWORD_HASHER
+]
+PASSWORD_HASHING_WORKERS = int(os.environ['PASSWORD_HASHING_WORKERS']) if 'PASSWORD_HASHING_WORKERS' in os.environ \
+    else None
 
 
 # Password validation